@@ -181,6 +181,16 @@ describe('Advanced AI Parsing Service', () => {
       })
     })
   })
+
+  describe('Combined Plan Analysis', () => {
+    it('should return detections, scale and statistics together', async () => {
+      const result = await advancedAIParsing.analyzePlan('test-image-base64')
+      expect(result.objects).toBeInstanceOf(Array)
+      expect(result.scale.scaleRatio).toBeGreaterThan(0)
+      expect(result.statistics.totalDoors).toBeDefined()
+      expect(result.imageSize.width).toBeGreaterThan(0)
+    })
+  })
 })
 
 // ============================================================================
@@ -209,6 +219,55 @@ describe('ifcopenshell Advanced Service', () => {
       expect(props).toBeInstanceOf(Array)
     })
   })
+
+  describe('Spatial Tree', () => {
+    afterEach(() => {
+      vi.unstubAllGlobals()
+    })
+
+    it('should get the spatial structure tree', async () => {
+      const fetchMock = vi.fn().mockResolvedValue({
+        ok: true,
+        json: async () => ({
+          tree: {
+            id: '#1',
+            type: 'IfcProject',
+            name: 'Project',
+            childCount: 1,
+            children: [{id: '#20', type: 'IfcSite', name: 'Site', childCount: 0, children: []}]
+          }
+        })
+      })
+      vi.stubGlobal('fetch', fetchMock)
+
+      const tree = await ifcopenshellAdvanced.getSpatialTree('test.ifc')
+      expect(fetchMock.mock.calls[0][0]).toMatch(/\/spatial-tree$/)
+      expect(tree).not.toBeNull()
+      expect(tree!.id).toBe('#1')
+      expect(tree!.type).toBe('IfcProject')
+      expect(tree!.childCount).toBe(1)
+      expect(tree!.children).toHaveLength(1)
+      expect(tree!.children![0].id).toBe('#20')
+      expect(tree!.children![0].type).toBe('IfcSite')
+    })
+
+    it('should return null when the service fails', async () => {
+      vi.stubGlobal('fetch', vi.fn().mockResolvedValue({ok: false, json: async () => ({})}))
+
+      const tree = await ifcopenshellAdvanced.getSpatialTree('test.ifc')
+      expect(tree).toBeNull()
+    })
+  })
+
+  describe('Element Search', () => {
+    it('should search elements by property', async () => {
+      const result = await ifcopenshellAdvanced.searchElements('test.ifc', {
+        types: ['IfcWall'],
+        filters: [{property: 'Pset_WallCommon.IsExternal', value: true}]
+      })
+      expect(result.elementIds).toBeInstanceOf(Array)
+    })
+  })
 })
 
 // ============================================================================
@@ -0,0 +1,194 @@
+"""
+Lighting service benchmark
+Time analysis, illuminance grids, natural lighting and light placement across scaling inputs
+
+Usage:
+    python benchmark_lighting.py > baseline.json
+    python benchmark_lighting.py --lights 10 1000 --points 10000 --compare baseline.json
+
+Scenes are generated from a fixed seed, so runs are comparable between
+releases. Each case also reports the per-stage timings collected by the
+request profiler. With --compare, cases whose median is more than
+--tolerance slower than the baseline are flagged and the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import profiling
+from server import analyzer, natural_light, optimizer
+
+ROOM = {'minX': -10, 'maxX': 10, 'minZ': -10, 'maxZ': 10}
+CAMERA = {'x': 0, 'y': 1.6, 'z': 0}
+COLORS = ['#ffffff', '#ffd699', '#ff9329', '#cce6ff', '#fffaf4']
+
+
+def random_lights(rng: np.random.Generator, count: int) -> list:
+    """Point lights scattered over ROOM at ceiling height"""
+    xs = rng.uniform(ROOM['minX'], ROOM['maxX'], count)
+    zs = rng.uniform(ROOM['minZ'], ROOM['maxZ'], count)
+    ys = rng.uniform(2.5, 3.5, count)
+    intensities = rng.uniform(0.2, 2.0, count)
+    colors = rng.integers(0, len(COLORS), count)
+    return [
+        {'type': 'point', 'position': {'x': float(x), 'y': float(y), 'z': float(z)},
+         'intensity': float(intensity), 'color': COLORS[color]}
+        for x, y, z, intensity, color in zip(xs, ys, zs, intensities, colors)
+    ]
+
+
+def measure(call, repeat: int, max_seconds: float) -> dict:
+    """Run call once to warm up, then up to repeat times within max_seconds; wall times and mean stage times"""
+    call()
+    latencies = []
+    stages = {}
+    budget_started = time.perf_counter()
+    while len(latencies) < repeat:
+        profiling.start()
+        started = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - started) * 1000)
+        for name, ms in profiling.finish().items():
+            stages[name] = stages.get(name, 0.0) + ms
+        if time.perf_counter() - budget_started > max_seconds:
+            break
+
+    latencies = np.asarray(latencies)
+    return {
+        'runs': len(latencies),
+        'ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'min': float(latencies.min()),
+            'max': float(latencies.max())
+        },
+        'stagesMs': {name: total / len(latencies) for name, total in stages.items()}
+    }
+
+
+def analyze_cases(sizes, rng):
+    for count in sizes:
+        lights = random_lights(rng, count)
+        yield 'analyze', count, 'lights', lambda lights=lights: analyzer.analyze_lighting_setup(lights, CAMERA, ROOM)
+
+
+def illuminance_cases(sizes, rng):
+    lights = random_lights(rng, 100)
+    side = ROOM['maxX'] - ROOM['minX']
+    for count in sizes:
+        # Square grid with about count points
+        spacing = side / max(int(round(np.sqrt(count))), 1)
+        room = {'name': 'Benchmark', 'bounds': ROOM}
+        yield 'illuminanceMap', count, 'points', \
+            lambda spacing=spacing: analyzer.illuminance_map(lights, [room], spacing, 0.8, include_values=False)
+
+
+def natural_light_cases(sizes):
+    start = datetime(2025, 1, 1)
+    for count in sizes:
+        # One call per hourly timestep, as clients do without the series endpoint
+        times = [start + timedelta(hours=h) for h in range(count)]
+        yield 'naturalLighting', count, 'timesteps', lambda times=times: [
+            natural_light.calculate(40.7128, -74.0060, t, t.hour, 0.2, 0) for t in times
+        ]
+        end = start + timedelta(hours=count)
+        yield 'naturalLightingSeries', count, 'timesteps', \
+            lambda end=end: natural_light.calculate_series(40.7128, -74.0060, start, end, 60, 0.2)
+
+
+def optimize_cases(goals, search_sizes, evaluations):
+    for goal in goals:
+        yield f'optimize:{goal}', 1, 'layouts', lambda goal=goal: optimizer.optimize(ROOM, 500, goal)
+    for count in search_sizes:
+        yield 'optimize:search', count, 'lights', lambda count=count: optimizer.search(
+            ROOM, 500, count, mounting_height=3.0, work_plane_height=0.8, min_uniformity=0.6,
+            restarts=1, max_evaluations=evaluations
+        )
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> int:
+    """Annotate results with the baseline median and ratio; number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {(row['benchmark'], row['size']): row for row in json.load(f)['results']}
+    regressions = 0
+    for row in results:
+        previous = baseline.get((row['benchmark'], row['size']))
+        if previous is None:
+            continue
+        row['baselineMs'] = previous['ms']['p50']
+        row['ratio'] = row['ms']['p50'] / max(previous['ms']['p50'], 1e-9)
+        row['regression'] = row['ratio'] > 1 + tolerance
+        regressions += row['regression']
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lights', type=int, nargs='*', default=[10, 100, 1000, 10000],
+                        help='light counts for analyze_lighting_setup')
+    parser.add_argument('--points', type=int, nargs='*', default=[1, 100, 10000, 1000000],
+                        help='sample points for the illuminance map (100 lights)')
+    parser.add_argument('--timesteps', type=int, nargs='*', default=[1, 24, 744, 8760],
+                        help='hourly timesteps for natural lighting')
+    parser.add_argument('--goals', nargs='*', default=['natural', 'dramatic', 'even'])
+    parser.add_argument('--search-lights', type=int, nargs='*', default=[4, 16],
+                        help='light counts for placement search')
+    parser.add_argument('--search-evaluations', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=10.0, help='time budget per case after warm-up')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed median slowdown against the baseline')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    cases = [
+        *analyze_cases(args.lights, rng),
+        *illuminance_cases(args.points, rng),
+        *natural_light_cases(args.timesteps),
+        *optimize_cases(args.goals, args.search_lights, args.search_evaluations)
+    ]
+
+    results = []
+    for name, size, unit, call in cases:
+        row = {'benchmark': name, 'size': size, 'unit': unit, **measure(call, args.repeat, args.max_seconds)}
+        results.append(row)
+        print(f"{name:22s} {size:>8d} {unit:9s} p50 {row['ms']['p50']:10.2f} ms  min {row['ms']['min']:10.2f} ms  "
+              f"({row['runs']} runs)", file=sys.stderr)
+
+    regressions = compare(results, args.compare, args.tolerance) if args.compare else 0
+    for row in results:
+        if row.get('regression'):
+            print(f"REGRESSION {row['benchmark']} {row['size']} {row['unit']}: "
+                  f"{row['ms']['p50']:.2f} ms vs {row['baselineMs']:.2f} ms ({row['ratio']:.2f}x)", file=sys.stderr)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'results': results
+    }
+    if args.compare:
+        report['baseline'] = args.compare
+        report['regressions'] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Climate-based daylight modelling from EPW weather files
+Parsed weather cached as compact binary, hourly sky and sun contributions at sample points, sDA and ASE
+"""
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from profiling import stage
+from shadows import TriangleBVH, sun_vectors, visibility
+from solar import compass_bearing, sun_path
+
+logger = logging.getLogger(__name__)
+
+# Luminous efficacy used when a weather file has no illuminance columns, in lm/W
+DIRECT_EFFICACY = 110.0
+DIFFUSE_EFFICACY = 120.0
+
+# Sun directions are binned to this angular grid (degrees) before ray casting
+SUN_BIN_DEGREES = 2.0
+
+# Tregenza sky: altitude band centres (degrees) and patches per band, plus one zenith patch
+TREGENZA_BANDS = [(6, 30), (18, 30), (30, 24), (42, 24), (54, 18), (66, 12), (78, 6)]
+SKY_PATCH_COUNT = sum(count for _, count in TREGENZA_BANDS) + 1
+
+# EPW data columns (0-based)
+EPW_MONTH, EPW_DAY, EPW_HOUR = 1, 2, 3
+EPW_DNI, EPW_DHI = 14, 15
+EPW_DIRECT_ILLUMINANCE, EPW_DIFFUSE_ILLUMINANCE = 17, 18
+
+# Days before each month in the non-leap year EPW files describe
+MONTH_START_DAY = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+
+def parse_epw(text: str) -> Dict[str, Any]:
+    """Location and hourly direct normal / diffuse horizontal illuminance from EPW text"""
+    lines = text.splitlines()
+    location = lines[0].split(',')
+    rows = [line.split(',') for line in lines[8:] if line.strip()]
+    columns = np.array([[row[i] for i in (EPW_MONTH, EPW_DAY, EPW_HOUR, EPW_DNI, EPW_DHI,
+                                          EPW_DIRECT_ILLUMINANCE, EPW_DIFFUSE_ILLUMINANCE)]
+                        for row in rows], dtype=np.float64)
+    month, day, hour, dni, dhi, direct_lux, diffuse_lux = columns.T
+
+    # Missing illuminance (999999) falls back to radiation times luminous efficacy
+    direct = np.where(direct_lux >= 999900, np.where(dni >= 9999, 0, dni) * DIRECT_EFFICACY, direct_lux)
+    diffuse = np.where(diffuse_lux >= 999900, np.where(dhi >= 9999, 0, dhi) * DIFFUSE_EFFICACY, diffuse_lux)
+
+    return {
+        'city': location[1].strip() if len(location) > 1 else '',
+        'country': location[3].strip() if len(location) > 3 else '',
+        'latitude': float(location[6]),
+        'longitude': float(location[7]),
+        'timezone': float(location[8]),
+        'month': month.astype(np.int8),
+        'day': day.astype(np.int8),
+        'hour': hour.astype(np.int8),
+        'directNormal': direct.astype(np.float32),
+        'diffuseHorizontal': diffuse.astype(np.float32)
+    }
+
+
+class WeatherCache:
+    """Parsed weather files by content hash, in memory and as compressed .npz on disk
+
+    A file is parsed once; later requests refer to it by its id, and after a
+    restart the arrays are loaded from disk instead of re-parsing the text.
+    Files are written to a temp file and renamed into place under the cache
+    lock, so readers never see a partial .npz.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 16):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, weather_id: str) -> str:
+        return os.path.join(self.directory, f'{weather_id}.npz')
+
+    def add(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        """Parse (or reuse) a weather file: (weather id, weather)"""
+        weather_id = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        weather = self.get(weather_id)
+        if weather is None:
+            weather = parse_epw(text)
+            buffer = io.BytesIO()
+            np.savez_compressed(buffer, **{key: np.asarray(value) for key, value in weather.items()})
+            self._save(weather_id, weather, buffer.getvalue())
+        return weather_id, weather
+
+    def _save(self, weather_id: str, weather: Dict[str, Any], data: bytes):
+        """Atomically write the .npz and remember the weather"""
+        with self._lock:
+            path = self._path(weather_id)
+            if not os.path.exists(path):
+                handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                try:
+                    with os.fdopen(handle, 'wb') as f:
+                        f.write(data)
+                    os.replace(temp_path, path)
+                except BaseException:
+                    os.unlink(temp_path)
+                    raise
+            self._store(weather_id, weather)
+
+    def get(self, weather_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            weather = self._entries.get(weather_id)
+            if weather is not None:
+                self._entries.move_to_end(weather_id)
+                return weather
+        path = self._path(weather_id)
+        if not weather_id.isalnum() or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            weather = {key: data[key] if data[key].ndim else data[key].item() for key in data.files}
+        self._remember(weather_id, weather)
+        return weather
+
+    def _remember(self, weather_id: str, weather: Dict[str, Any]):
+        with self._lock:
+            self._store(weather_id, weather)
+
+    def _store(self, weather_id: str, weather: Dict[str, Any]):
+        """LRU update; the caller holds the lock"""
+        self._entries[weather_id] = weather
+        self._entries.move_to_end(weather_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def sky_patches() -> Tuple[np.ndarray, np.ndarray]:
+    """Tregenza sky patch centre directions (145, 3) and CIE overcast weights summing to 1
+
+    A weight is the patch's share of horizontal illuminance under the CIE
+    standard overcast sky, so an unobstructed point receives exactly the
+    diffuse horizontal illuminance.
+    """
+    altitudes, azimuths, solid_angles = [], [], []
+    for altitude, count in TREGENZA_BANDS:
+        low, high = np.radians(altitude - 6), np.radians(altitude + 6)
+        altitudes.extend([altitude] * count)
+        azimuths.extend((np.arange(count) + 0.5) * 360 / count)
+        solid_angles.extend([2 * np.pi * (np.sin(high) - np.sin(low)) / count] * count)
+    altitudes.append(90)
+    azimuths.append(0)
+    solid_angles.append(2 * np.pi * (1 - np.sin(np.radians(84))))
+
+    altitudes = np.asarray(altitudes, dtype=np.float64)
+    sin_alt = np.sin(np.radians(altitudes))
+    weights = (1 + 2 * sin_alt) / 3 * sin_alt * np.asarray(solid_angles)
+    return sun_vectors(altitudes, np.asarray(azimuths)), weights / weights.sum()
+
+
+def hourly_sun(weather: Dict[str, Any], orientation: float) -> Dict[str, np.ndarray]:
+    """Sun altitude and direction at the middle of each weather hour
+
+    EPW hours are local standard time ending at the given hour; they are
+    shifted to solar time by the longitude's offset from the time zone meridian.
+    """
+    day_of_year = MONTH_START_DAY[weather['month'] - 1] + weather['day']
+    solar_hours = weather['hour'] - 0.5 + (weather['longitude'] - 15 * weather['timezone']) / 15
+    path = sun_path(weather['latitude'], day_of_year, solar_hours)
+    return {
+        'altitude': path['altitude'],
+        'direction': sun_vectors(path['altitude'], compass_bearing(path['azimuth']), orientation)
+    }
+
+
+def climate_daylight(weather: Dict[str, Any], points: np.ndarray, triangles: np.ndarray, orientation: float = 0.0,
+                     occupied_hours: Tuple[int, int] = (8, 18), sda_lux: float = 300, sda_fraction: float = 0.5,
+                     ase_lux: float = 1000, ase_hours: int = 250, workers: int = 1) -> Dict[str, Any]:
+    """Annual daylight metrics at sample points on a horizontal work plane
+
+    Sky visibility is ray cast once per (point, sky patch) and direct sun once
+    per (point, binned sun direction), both through one BVH. Hourly
+    illuminance is then the visibility-weighted sky vector plus the visible
+    direct component for every point and occupied hour at once.
+    Interreflections are not modelled.
+    """
+    with stage('bvhBuild'):
+        bvh = TriangleBVH(triangles)
+    patch_directions, patch_weights = sky_patches()
+    with stage('skyVisibility'):
+        sky_view = visibility(bvh, points, patch_directions, workers).astype(np.float32)
+
+    with stage('sunPath'):
+        sun = hourly_sun(weather, orientation)
+    occupied = (weather['hour'] > occupied_hours[0]) & (weather['hour'] <= occupied_hours[1])
+    hours = np.flatnonzero(occupied)
+
+    # Direct sun only counts with the sun up and direct light in the weather data
+    direct = weather['directNormal'][hours] * np.maximum(np.sin(np.radians(sun['altitude'][hours])), 0)
+    sunny = direct > 0
+    bins = np.round(sun['direction'][hours[sunny]] * (180 / np.pi / SUN_BIN_DEGREES))
+    _, first, inverse = np.unique(bins, axis=0, return_index=True, return_inverse=True)
+    with stage('sunVisibility'):
+        sun_view = visibility(bvh, points, sun['direction'][hours[sunny]][first], workers)
+
+    with stage('hourlyIlluminance'):
+        # Hourly sky vectors (hours, patches): diffuse horizontal illuminance spread over the patches
+        sky = weather['diffuseHorizontal'][hours, None] * patch_weights[None, :].astype(np.float32)
+        diffuse = sky_view @ sky.T                                  # (points, hours)
+
+        direct_lux = np.zeros((len(points), len(hours)), dtype=np.float32)
+        direct_lux[:, sunny] = sun_view[:, inverse.ravel()] * direct[sunny].astype(np.float32)
+        total = diffuse + direct_lux
+
+    autonomy = (total >= sda_lux).mean(axis=1) if len(hours) else np.zeros(len(points))
+    sun_hours = (direct_lux >= ase_lux).sum(axis=1)
+    return {
+        'daylightAutonomy': autonomy,
+        'directSunHours': sun_hours,
+        'skyFactor': sky_view @ patch_weights,
+        'sDA': float(np.mean(autonomy >= sda_fraction)),
+        'ASE': float(np.mean(sun_hours > ase_hours)),
+        'occupiedHours': int(len(hours)),
+        'sunDirections': int(len(first)),
+        'rays': int(len(points) * (len(patch_directions) + len(first)))
+    }
@@ -0,0 +1,140 @@
+"""
+Discomfort glare from electric light fixtures
+Unified Glare Rating (and DGP) for every observer x view x fixture triple in one broadcasted pass
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from illuminance import CHUNK_ELEMENTS, LUX_PER_INTENSITY, floor_grid
+
+# Luminous area of a fixture without one, in m^2 (600 x 600 mm panel)
+DEFAULT_FIXTURE_AREA = 0.36
+
+# Background luminance in cd/m^2 when the request does not give one
+DEFAULT_BACKGROUND_LUMINANCE = 40.0
+
+# Seated eye height in metres
+DEFAULT_EYE_HEIGHT = 1.2
+
+# UGR limit for offices and similar tasks (EN 12464-1)
+DEFAULT_UGR_LIMIT = 19.0
+
+
+def fixture_arrays(lights: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fixture positions (n, 3), luminous intensities in cd (n,) and luminous areas in m^2 (n,)"""
+    positions = np.empty((len(lights), 3), dtype=np.float64)
+    candela = np.empty(len(lights), dtype=np.float64)
+    areas = np.empty(len(lights), dtype=np.float64)
+    for i, light in enumerate(lights):
+        position = light.get('position', {'x': 0, 'y': 5, 'z': 0})
+        positions[i] = (position.get('x', 0), position.get('y', 0), position.get('z', 0))
+        candela[i] = light.get('intensity', 1.0) * LUX_PER_INTENSITY
+        areas[i] = light.get('area', DEFAULT_FIXTURE_AREA)
+    return positions, candela, areas
+
+
+def view_directions(azimuths: List[float], pitch: float = 0.0) -> np.ndarray:
+    """Unit view vectors (n, 3) for compass azimuths in degrees (0 = -z, 90 = +x) and a common pitch"""
+    az = np.radians(np.asarray(azimuths, dtype=np.float64))
+    tilt = np.radians(pitch)
+    return np.stack([np.sin(az) * np.cos(tilt), np.full(len(az), np.sin(tilt)), -np.cos(az) * np.cos(tilt)], axis=1)
+
+
+def position_index(alpha: np.ndarray, beta: np.ndarray) -> np.ndarray:
+    """Guth position index from the Kim & Kim closed-form fit, angles in degrees
+
+    alpha is the angle from vertical of the plane through the line of sight
+    and the source, beta the angle between the line of sight and the source.
+    """
+    return np.exp(
+        (35.2 - 0.31889 * alpha - 1.22 * np.exp(-2 * alpha / 9)) * 1e-3 * beta
+        + (21 + 0.26667 * alpha - 0.002963 * alpha ** 2) * 1e-5 * beta ** 2
+    )
+
+
+def glare_terms(eyes: np.ndarray, views: np.ndarray, positions: np.ndarray, candela: np.ndarray,
+                areas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Glare sums over fixtures: (sum of L^2 * omega / p^2, vertical illuminance at the eye)
+
+    eyes is (observers, 3) and views (directions, 3); every observer looks in
+    every direction. positions is (..., fixtures, 3) and candela/areas
+    (..., fixtures), so leading candidate dimensions broadcast to results of
+    shape (..., observers, directions). Fixtures are isotropic emitters whose
+    luminous area faces down. Only fixtures in front of the observer and above
+    the line of sight contribute to the glare sum.
+    """
+    offset = positions[..., None, :, :] - eyes[:, None, :]          # (..., E, F, 3)
+    distance_sq = np.maximum(np.einsum('...k,...k->...', offset, offset), 1e-12)
+    distance = np.sqrt(distance_sq)
+    toward = offset / distance[..., None]
+
+    # Terms that do not depend on the view direction: L^2 * omega = I^2 / (projected area * d^2)
+    rising = toward[..., 1]
+    projected = areas[..., None, :] * np.maximum(rising, 1e-3)
+    source = np.where(rising > 0, candela[..., None, :] ** 2 / (projected * distance_sq), 0.0)
+    irradiance = candela[..., None, :] / distance_sq
+
+    # Vertical in each view plane: world up with the view component removed
+    up = np.array([0.0, 1.0, 0.0]) - views[:, 1:2] * views
+    up /= np.maximum(np.linalg.norm(up, axis=1, keepdims=True), 1e-9)
+
+    cos_beta = np.einsum('...efk,vk->...evf', toward, views)          # (..., E, V, F)
+    sin_beta = np.sqrt(np.maximum(1 - cos_beta ** 2, 1e-18))
+    cos_alpha = np.einsum('...efk,vk->...evf', toward, up) / sin_beta
+
+    beta = np.degrees(np.arccos(np.clip(cos_beta, -1, 1)))
+    alpha = np.degrees(np.arccos(np.clip(cos_alpha, -1, 1)))
+    visible = (cos_beta > 0) & (cos_alpha >= 0)
+
+    p = position_index(alpha, beta)
+    glare = np.einsum('...evf,...ef->...ev', np.where(visible, 1.0 / p ** 2, 0.0), source)
+    vertical = np.einsum('...evf,...ef->...ev', np.maximum(cos_beta, 0), irradiance)
+    return glare, vertical
+
+
+def ugr(glare: np.ndarray, background_luminance: float) -> np.ndarray:
+    """Unified Glare Rating from the glare sum; 0 where no fixture is in view"""
+    with np.errstate(divide='ignore'):
+        rating = 8 * np.log10(0.25 / background_luminance * glare)
+    return np.where(glare > 0, np.maximum(rating, 0.0), 0.0)
+
+
+def dgp(glare: np.ndarray, vertical: np.ndarray) -> np.ndarray:
+    """Daylight Glare Probability form, evaluated for the fixtures only"""
+    ev = np.maximum(vertical, 1e-6)
+    return np.clip(5.87e-5 * ev + 9.18e-2 * np.log10(1 + glare / ev ** 1.87) + 0.16, 0, 1)
+
+
+def glare_map(lights: List[Dict], bounds: Dict, spacing: float, eye_height: float, azimuths: List[float],
+              background_luminance: float, ugr_limit: float) -> Dict:
+    """Worst-direction UGR over a grid of observer positions"""
+    positions, candela, areas = fixture_arrays(lights)
+    eyes, (rows, cols) = floor_grid(bounds, spacing, eye_height)
+    views = view_directions(azimuths)
+
+    # Observers in chunks of about CHUNK_ELEMENTS (observer, direction, fixture) triples
+    glare = np.zeros((len(eyes), len(views)))
+    vertical = np.zeros((len(eyes), len(views)))
+    chunk = max(CHUNK_ELEMENTS // max(len(positions) * len(views), 1), 1)
+    for start in range(0, len(eyes), chunk):
+        glare[start:start + chunk], vertical[start:start + chunk] = glare_terms(
+            eyes[start:start + chunk], views, positions, candela, areas
+        )
+    ratings = ugr(glare, background_luminance)
+    probability = dgp(glare, vertical)
+
+    worst = ratings.max(axis=1)
+    return {
+        'ugr': np.round(worst.reshape(rows, cols), 2).tolist(),
+        'worstDirection': np.asarray(azimuths, dtype=np.float64)[ratings.argmax(axis=1)].reshape(rows, cols).tolist(),
+        'stats': {
+            'maxUgr': float(worst.max()),
+            'avgUgr': float(worst.mean()),
+            'maxDgp': float(probability.max()),
+            'exceedingLimit': float(np.mean(worst > ugr_limit))
+        },
+        'grid': {'rows': rows, 'cols': cols, 'eyeHeight': eye_height},
+        'ugrLimit': ugr_limit
+    }
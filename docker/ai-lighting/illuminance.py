@@ -0,0 +1,177 @@
+"""
+Vectorised illuminance evaluation
+Inverse-square contributions of every light at every sample point, in chunks
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Position used for lights that do not specify one
+DEFAULT_LIGHT_POSITION = {'x': 0, 'y': 5, 'z': 0}
+
+# Lux at 1 m from a light of intensity 1.0
+LUX_PER_INTENSITY = 10000
+
+# (points x lights) block evaluated at once, in elements; small enough to stay in cache
+CHUNK_ELEMENTS = 65536
+
+
+def light_arrays(lights: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Light positions (n, 3) and intensities (n,) from light dicts"""
+    positions = np.empty((len(lights), 3), dtype=np.float64)
+    intensities = np.empty(len(lights), dtype=np.float64)
+    for i, light in enumerate(lights):
+        position = light.get('position', DEFAULT_LIGHT_POSITION)
+        positions[i] = (position.get('x', 0), position.get('y', 0), position.get('z', 0))
+        intensities[i] = light.get('intensity', 1.0)
+    return positions, intensities
+
+
+def grid_shape(bounds: Dict, spacing: float) -> Tuple[int, int]:
+    """(rows, cols) of a floor grid with cells no larger than spacing"""
+    cols = max(int(np.ceil((bounds.get('maxX', 10) - bounds.get('minX', -10)) / spacing)), 1)
+    rows = max(int(np.ceil((bounds.get('maxZ', 10) - bounds.get('minZ', -10)) / spacing)), 1)
+    return rows, cols
+
+
+def floor_grid(bounds: Dict, spacing: float, height: float) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Sample points (n, 3) on a horizontal plane at cell centres, and the grid shape (rows, cols)
+
+    Rows run along z and columns along x, so values.reshape(shape) is a heatmap
+    with minZ in the first row.
+    """
+    min_x, max_x = bounds.get('minX', -10), bounds.get('maxX', 10)
+    min_z, max_z = bounds.get('minZ', -10), bounds.get('maxZ', 10)
+    rows, cols = grid_shape(bounds, spacing)
+
+    xs = min_x + (np.arange(cols) + 0.5) * (max_x - min_x) / cols
+    zs = min_z + (np.arange(rows) + 0.5) * (max_z - min_z) / rows
+    gx, gz = np.meshgrid(xs, zs)
+    points = np.stack([gx.ravel(), np.full(gx.size, float(height)), gz.ravel()], axis=1)
+    return points, (rows, cols)
+
+
+def illuminance_at(points: np.ndarray, positions: np.ndarray, intensities: np.ndarray,
+                   chunk_elements: int = CHUNK_ELEMENTS) -> np.ndarray:
+    """Total illuminance (lux) at each point, summed over all lights
+
+    Same law as the single-point analysis: intensity * 10000 / max(d^2, 1).
+    Points are processed in chunks so the (points x lights) distance block
+    stays within chunk_elements regardless of grid size. The block is float32;
+    coordinates are first centred on the lights so large site coordinates do
+    not lose precision.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    result = np.zeros(len(points), dtype=np.float64)
+    if len(positions) == 0 or len(points) == 0:
+        return result
+
+    origin = positions.mean(axis=0)
+    lights = (positions - origin).astype(np.float32)
+    flux = (intensities * LUX_PER_INTENSITY).astype(np.float32)
+    light_sq = np.einsum('ij,ij->i', lights, lights)
+    cross = -2.0 * lights.T
+    chunk = max(chunk_elements // len(positions), 1)
+    for start in range(0, len(points), chunk):
+        block = (points[start:start + chunk] - origin).astype(np.float32)
+        # |p - l|^2 = |p|^2 + |l|^2 - 2 p.l, one matrix product per chunk
+        d2 = block @ cross
+        d2 += np.einsum('ij,ij->i', block, block)[:, None]
+        d2 += light_sq
+        np.maximum(d2, 1.0, out=d2)
+        result[start:start + chunk] = np.reciprocal(d2, out=d2) @ flux
+    return result
+
+
+def illuminance_batch(points: np.ndarray, positions: np.ndarray, intensities: np.ndarray,
+                      chunk_elements: int = CHUNK_ELEMENTS) -> np.ndarray:
+    """Illuminance (candidates, points) for a stack of light sets
+
+    positions is (candidates, lights, 3) and intensities (candidates, lights),
+    so a whole optimiser population or set of design variants is scored in one
+    pass. Candidates are processed in chunks of about chunk_elements
+    (points x lights) pairs.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    candidates, lights = intensities.shape
+    result = np.zeros((candidates, len(points)), dtype=np.float64)
+    if lights == 0 or len(points) == 0:
+        return result
+
+    chunk = max(chunk_elements // (len(points) * lights), 1)
+    for start in range(0, candidates, chunk):
+        block = positions[start:start + chunk]
+        d2 = ((points[None, :, None, :] - block[:, None, :, :]) ** 2).sum(axis=-1)
+        np.maximum(d2, 1.0, out=d2)
+        result[start:start + chunk] = np.einsum('cpl,cl->cp', np.reciprocal(d2, out=d2),
+                                                intensities[start:start + chunk] * LUX_PER_INTENSITY)
+    return result
+
+
+def stack_light_sets(light_sets: List[List[Dict]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Light sets of different sizes as padded (sets, max lights, 3) positions and (sets, max lights) intensities
+
+    Padding lights have zero intensity, so they contribute nothing.
+    """
+    width = max((len(lights) for lights in light_sets), default=0)
+    positions = np.zeros((len(light_sets), width, 3), dtype=np.float64)
+    intensities = np.zeros((len(light_sets), width), dtype=np.float64)
+    for i, lights in enumerate(light_sets):
+        positions[i, :len(lights)], intensities[i, :len(lights)] = light_arrays(lights)
+    return positions, intensities
+
+
+def illuminance_pairs(points: np.ndarray, set_index: np.ndarray, positions: np.ndarray, intensities: np.ndarray,
+                      chunk_elements: int = CHUNK_ELEMENTS) -> np.ndarray:
+    """Illuminance at points[i] from light set set_index[i], for many (point, light set) pairs at once"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    result = np.zeros(len(points), dtype=np.float64)
+    width = positions.shape[1]
+    if width == 0 or len(points) == 0:
+        return result
+
+    chunk = max(chunk_elements // width, 1)
+    for start in range(0, len(points), chunk):
+        sets = set_index[start:start + chunk]
+        d2 = ((points[start:start + chunk, None, :] - positions[sets]) ** 2).sum(axis=-1)
+        np.maximum(d2, 1.0, out=d2)
+        result[start:start + chunk] = np.einsum('pl,pl->p', np.reciprocal(d2, out=d2),
+                                                intensities[sets] * LUX_PER_INTENSITY)
+    return result
+
+
+def illuminance_stats(values: np.ndarray) -> Dict[str, float]:
+    """Min/avg/max lux with uniformity (min/avg) and diversity (min/max) ratios"""
+    if values.size == 0:
+        return {'min': 0.0, 'avg': 0.0, 'max': 0.0, 'uniformity': 0.0, 'diversity': 0.0}
+    low, mean, high = float(values.min()), float(values.mean()), float(values.max())
+    return {
+        'min': low,
+        'avg': mean,
+        'max': high,
+        'uniformity': low / mean if mean > 0 else 0.0,
+        'diversity': low / high if high > 0 else 0.0
+    }
+
+
+def illuminance_map(lights: List[Dict], bounds: Dict, spacing: float = 0.25, height: float = 0.8,
+                    include_values: bool = True) -> Dict[str, Any]:
+    """Lux heatmap over a floor region with its summary statistics"""
+    positions, intensities = light_arrays(lights)
+    points, (rows, cols) = floor_grid(bounds, spacing, height)
+    values = illuminance_at(points, positions, intensities)
+
+    result = {
+        'stats': illuminance_stats(values),
+        'grid': {
+            'rows': rows,
+            'cols': cols,
+            'cellWidth': (bounds.get('maxX', 10) - bounds.get('minX', -10)) / cols,
+            'cellDepth': (bounds.get('maxZ', 10) - bounds.get('minZ', -10)) / rows,
+            'height': height
+        }
+    }
+    if include_values:
+        result['grid']['values'] = np.round(values.reshape(rows, cols), 1).tolist()
+    return result
@@ -0,0 +1,230 @@
+"""
+Numerical light placement search
+CMA-ES over fixture positions and intensities, scoring each population in one batched evaluation
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+
+from glare import DEFAULT_BACKGROUND_LUMINANCE, DEFAULT_EYE_HEIGHT, DEFAULT_FIXTURE_AREA, glare_terms, ugr, view_directions
+from illuminance import LUX_PER_INTENSITY, floor_grid, illuminance_batch
+from worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Objective grid resolution: sample points along the longer side of the room
+OBJECTIVE_GRID_SIDE = 24
+
+# Observer positions per side, each looking in four directions, when glare is constrained
+GLARE_GRID_SIDE = 4
+
+# Penalty weights relative to the squared relative illuminance error
+UNIFORMITY_WEIGHT = 4.0
+GLARE_WEIGHT = 4.0
+ENERGY_LIMIT_WEIGHT = 10.0
+BOUNDS_WEIGHT = 10.0
+# Small pull towards lower total intensity among otherwise equal layouts
+ENERGY_WEIGHT = 0.01
+
+
+def cma_es(objective: Callable[[np.ndarray], np.ndarray], x0: np.ndarray, sigma: float,
+           max_evaluations: int, rng: np.random.Generator, tolerance: float = 1e-4) -> Tuple[np.ndarray, float, int]:
+    """Minimise a batched objective with CMA-ES: (best x, best loss, evaluations)
+
+    objective maps a (population, dim) array to (population,) losses, so each
+    generation is one call.
+    """
+    n = len(x0)
+    population = 4 + int(3 * np.log(n))
+    mu = population // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= weights.sum()
+    mueff = 1.0 / np.sum(weights ** 2)
+
+    cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    cs = (mueff + 2) / (n + mueff + 5)
+    c1 = 2 / ((n + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0.0, np.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+    chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+    mean = np.asarray(x0, dtype=np.float64).copy()
+    pc, ps = np.zeros(n), np.zeros(n)
+    basis, scales = np.eye(n), np.ones(n)
+    cov = np.eye(n)
+    inv_sqrt_cov = np.eye(n)
+
+    best_x, best_loss = mean.copy(), float(objective(mean[None, :])[0])
+    evaluations = 1
+    generation = 0
+    while evaluations + population <= max_evaluations:
+        generation += 1
+        steps = (rng.standard_normal((population, n)) * scales) @ basis.T
+        candidates = mean + sigma * steps
+        losses = objective(candidates)
+        evaluations += population
+
+        order = np.argsort(losses)
+        if losses[order[0]] < best_loss:
+            best_loss, best_x = float(losses[order[0]]), candidates[order[0]].copy()
+
+        old_mean = mean
+        selected = candidates[order[:mu]]
+        mean = weights @ selected
+        shift = (mean - old_mean) / sigma
+
+        ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) * (inv_sqrt_cov @ shift)
+        hsig = (np.linalg.norm(ps) / np.sqrt(1 - (1 - cs) ** (2 * generation)) / chi_n) < 1.4 + 2 / (n + 1)
+        pc = (1 - cc) * pc + hsig * np.sqrt(cc * (2 - cc) * mueff) * shift
+
+        deviations = (selected - old_mean) / sigma
+        cov = ((1 - c1 - cmu) * cov
+               + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * cov)
+               + cmu * (deviations.T * weights) @ deviations)
+        sigma *= np.exp((cs / damps) * (np.linalg.norm(ps) / chi_n - 1))
+
+        cov = np.triu(cov) + np.triu(cov, 1).T
+        eigenvalues, basis = np.linalg.eigh(cov)
+        scales = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        inv_sqrt_cov = (basis / scales) @ basis.T
+
+        if sigma * scales.max() < tolerance:
+            break
+    return best_x, best_loss, evaluations
+
+
+class PlacementProblem:
+    """Fixture layout encoded as a unit cube: (x, z, intensity) per fixture, all in [0, 1]"""
+
+    def __init__(self, bounds: Dict, light_count: int, target: float, mounting_height: float,
+                 work_plane_height: float, min_uniformity: float, max_total_intensity: float = None,
+                 max_ugr: float = None, fixture_area: float = DEFAULT_FIXTURE_AREA,
+                 background_luminance: float = DEFAULT_BACKGROUND_LUMINANCE):
+        self.bounds = bounds
+        self.light_count = light_count
+        self.target = target
+        self.mounting_height = mounting_height
+        self.min_uniformity = min_uniformity
+        self.max_total_intensity = max_total_intensity
+        self.max_ugr = max_ugr
+        self.fixture_area = fixture_area
+        self.background_luminance = background_luminance
+
+        self.min_x, self.max_x = bounds.get('minX', -10), bounds.get('maxX', 10)
+        self.min_z, self.max_z = bounds.get('minZ', -10), bounds.get('maxZ', 10)
+        side = max(self.max_x - self.min_x, self.max_z - self.min_z)
+        self.points, _ = floor_grid(bounds, side / OBJECTIVE_GRID_SIDE, work_plane_height)
+
+        self.eyes, _ = floor_grid(bounds, side / GLARE_GRID_SIDE, DEFAULT_EYE_HEIGHT)
+        self.views = view_directions([0, 90, 180, 270])
+
+        # Enough headroom for one fixture to light its share of the floor on its own
+        area = (self.max_x - self.min_x) * (self.max_z - self.min_z)
+        drop = max(mounting_height - work_plane_height, 1.0)
+        self.max_intensity = 4 * target * max(drop ** 2, area / light_count) / LUX_PER_INTENSITY
+
+    def decode(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions (pop, lights, 3) and intensities (pop, lights) from unit-cube parameters"""
+        params = np.clip(x, 0.0, 1.0).reshape(len(x), self.light_count, 3)
+        positions = np.empty((len(x), self.light_count, 3))
+        positions[..., 0] = self.min_x + params[..., 0] * (self.max_x - self.min_x)
+        positions[..., 1] = self.mounting_height
+        positions[..., 2] = self.min_z + params[..., 1] * (self.max_z - self.min_z)
+        return positions, params[..., 2] * self.max_intensity
+
+    def evaluate(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        """Average lux, uniformity (min/avg), total intensity and, if constrained, worst UGR of each candidate"""
+        positions, intensities = self.decode(x)
+        lux = illuminance_batch(self.points, positions, intensities)
+        average = lux.mean(axis=1)
+        metrics = {
+            'average': average,
+            'uniformity': lux.min(axis=1) / np.maximum(average, 1e-9),
+            'totalIntensity': intensities.sum(axis=1)
+        }
+        if self.max_ugr:
+            glare, _ = glare_terms(self.eyes, self.views, positions, intensities * LUX_PER_INTENSITY,
+                                   np.full(intensities.shape, self.fixture_area))
+            metrics['maxUgr'] = ugr(glare, self.background_luminance).max(axis=(1, 2))
+        return metrics
+
+    def loss(self, x: np.ndarray) -> np.ndarray:
+        metrics = self.evaluate(x)
+        loss = ((metrics['average'] - self.target) / self.target) ** 2
+        loss += UNIFORMITY_WEIGHT * np.maximum(self.min_uniformity - metrics['uniformity'], 0) ** 2
+        loss += ENERGY_WEIGHT * metrics['totalIntensity'] / (self.max_intensity * self.light_count)
+        if self.max_total_intensity:
+            excess = np.maximum(metrics['totalIntensity'] - self.max_total_intensity, 0) / self.max_total_intensity
+            loss += ENERGY_LIMIT_WEIGHT * excess ** 2
+        if self.max_ugr:
+            loss += GLARE_WEIGHT * (np.maximum(metrics['maxUgr'] - self.max_ugr, 0) / self.max_ugr) ** 2
+        # Keep the search inside the unit cube
+        loss += BOUNDS_WEIGHT * np.sum((x - np.clip(x, 0.0, 1.0)) ** 2, axis=1)
+        return loss
+
+    def grid_start(self) -> np.ndarray:
+        """Fixtures on a regular grid at mid intensity"""
+        cols = int(np.ceil(np.sqrt(self.light_count)))
+        rows = int(np.ceil(self.light_count / cols))
+        cells = [((c + 0.5) / cols, (r + 0.5) / rows) for r in range(rows) for c in range(cols)]
+        return np.array([[u, v, 0.5] for u, v in cells[:self.light_count]]).ravel()
+
+
+def _run_restart(args) -> Tuple[np.ndarray, float, int]:
+    problem, seed, start, max_evaluations = args
+    rng = np.random.default_rng(seed)
+    x0 = problem.grid_start() if start == 'grid' else rng.uniform(0.1, 0.9, problem.light_count * 3)
+    return cma_es(problem.loss, x0, 0.25, max_evaluations, rng)
+
+
+# Long-lived restart pool, shared by all requests
+_search_pool = WorkerPool()
+
+
+def search_pool(workers: int) -> ProcessPoolExecutor:
+    """The restart pool, started on first use with at least workers processes"""
+    return _search_pool.get(workers)
+
+
+def search_placement(problem: PlacementProblem, restarts: int, max_evaluations: int,
+                     workers: int, seed: int = 0) -> Dict[str, Any]:
+    """Best layout over independent CMA-ES restarts, run in parallel processes
+
+    The first restart starts from a regular grid, the others from random layouts.
+    Restarts run on the long-lived search pool; the problem holds only a few
+    small sample grids, so it is simply pickled with each restart.
+    """
+    jobs = [(problem, seed + i, 'grid' if i == 0 else 'random', max_evaluations) for i in range(restarts)]
+    if workers <= 1 or restarts == 1:
+        runs = [_run_restart(job) for job in jobs]
+    else:
+        runs = list(search_pool(workers).map(_run_restart, jobs))
+
+    best_x, best_loss, _ = min(runs, key=lambda run: run[1])
+    positions, intensities = problem.decode(best_x[None, :])
+    metrics = problem.evaluate(best_x[None, :])
+
+    lights = [
+        {
+            'type': 'point',
+            'position': {'x': float(x), 'y': float(y), 'z': float(z)},
+            'intensity': float(intensity),
+            'color': '#ffffff',
+            'name': f'Fixture {i + 1}'
+        }
+        for i, ((x, y, z), intensity) in enumerate(zip(positions[0], intensities[0]))
+    ]
+    for light in lights:
+        light['area'] = problem.fixture_area
+    return {
+        'lights': lights,
+        'estimatedIlluminance': float(metrics['average'][0]),
+        'uniformity': float(metrics['uniformity'][0]),
+        'totalIntensity': float(metrics['totalIntensity'][0]),
+        'maxUgr': float(metrics['maxUgr'][0]) if 'maxUgr' in metrics else None,
+        'loss': best_loss,
+        'restarts': [{'loss': loss, 'evaluations': evaluations} for _, loss, evaluations in runs]
+    }
@@ -0,0 +1,45 @@
+"""
+In-process request profiler
+Wall-clock timings of named stages within one request, reported as Server-Timing and a JSON log line
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Stage timings (ms) of the request being profiled in this context, or None when not profiling
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('timings', default=None)
+
+
+def start() -> Dict[str, float]:
+    """Begin collecting stage timings in the current context"""
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+
+def finish() -> Optional[Dict[str, float]]:
+    """Stop collecting and return the timings gathered since start()"""
+    timings = _timings.get()
+    _timings.set(None)
+    return timings
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage name; repeated stages accumulate. A no-op when not profiling."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value, e.g. 'coverage;dur=1.42, total;dur=3.10'"""
+    return ', '.join(f'{name};dur={ms:.2f}' for name, ms in timings.items())
@@ -4,13 +4,29 @@ AI Lighting Optimization Service - Production Backend
 ML-based lighting analysis, natural lighting calculations, and AI-powered optimization
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
 import math
+import os
+import time as timer
 from typing import List, Dict, Any, Tuple
 import logging
+from scipy.spatial import cKDTree
+
+from glare import (DEFAULT_BACKGROUND_LUMINANCE, DEFAULT_EYE_HEIGHT, DEFAULT_FIXTURE_AREA, DEFAULT_UGR_LIMIT,
+                   glare_map)
+from illuminance import (floor_grid, grid_shape, illuminance_at, illuminance_map, illuminance_pairs,
+                         light_arrays, stack_light_sets)
+import profiling
+from placement_search import PlacementProblem, search_placement
+from profiling import stage
+from climate_daylight import SKY_PATCH_COUNT, WeatherCache, climate_daylight
+from shadows import TriangleBVH, mesh_triangles, sun_exposure, sun_vectors
+from solar import compass_bearing, day_and_hour, sun_path, time_range
+from sun_cache import NaturalLightCache
 
 app = Flask(__name__)
 CORS(app)
@@ -19,6 +35,43 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Floor sample points per side when scoring how much of the floor is lit
+COVERAGE_GRID_SIDE = 40
+
+# Largest floor grid evaluated per room by /illuminance-map
+MAX_GRID_POINTS = int(os.environ.get('MAX_GRID_POINTS', '2000000'))
+
+# Most timestamps computed by one /natural-lighting/series request
+MAX_SUN_PATH_SAMPLES = int(os.environ.get('MAX_SUN_PATH_SAMPLES', '600000'))
+
+# Processes casting sun rays for /sun-hours, and the most rays (points x sun positions) per request
+SUN_HOURS_WORKERS = int(os.environ.get('SUN_HOURS_WORKERS', str(os.cpu_count() or 1)))
+MAX_SUN_RAYS = int(os.environ.get('MAX_SUN_RAYS', '50000000'))
+
+# Most (variant, viewpoint) evaluations per /analyze/batch request
+MAX_BATCH_EVALUATIONS = int(os.environ.get('MAX_BATCH_EVALUATIONS', '200000'))
+
+# /natural-lighting cache: entries (0 disables), day tables and input quantisation
+NATURAL_LIGHT_CACHE_SIZE = int(os.environ.get('NATURAL_LIGHT_CACHE_SIZE', '4096'))
+SUN_TABLE_CACHE_SIZE = int(os.environ.get('SUN_TABLE_CACHE_SIZE', '64'))
+SUN_CACHE_LATLON_STEP = float(os.environ.get('SUN_CACHE_LATLON_STEP', '0.01'))
+SUN_CACHE_TIME_MINUTES = float(os.environ.get('SUN_CACHE_TIME_MINUTES', '5'))
+SUN_CACHE_CLOUD_STEP = float(os.environ.get('SUN_CACHE_CLOUD_STEP', '0.05'))
+
+# Processes running independent placement search restarts for /optimize
+OPTIMIZER_WORKERS = int(os.environ.get('OPTIMIZER_WORKERS', str(os.cpu_count() or 1)))
+MAX_SEARCH_LIGHTS = int(os.environ.get('MAX_SEARCH_LIGHTS', '64'))
+
+# Parsed weather files for /climate-daylight: on-disk directory and entries kept in memory
+EPW_CACHE_DIR = os.environ.get('EPW_CACHE_DIR', '/tmp/epw-cache')
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', '16'))
+
+# Largest EPW upload accepted by /weather; a year of hourly data is about 2 MB
+MAX_WEATHER_UPLOAD_MB = float(os.environ.get('MAX_WEATHER_UPLOAD_MB', '10'))
+
+# Per-stage request timings in a Server-Timing header and a JSON log line
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+
 # ============================================================================
 # LIGHTING ANALYSIS MODELS
 # ============================================================================
@@ -31,33 +84,35 @@ class LightingAnalyzer:
         self.max_illuminance = 1000  # lux to avoid glare
         self.optimal_color_temp = 5000  # Kelvin for natural light
 
-    def analyze_lighting_setup(self, lights: List[Dict], camera_position: Dict) -> Dict:
+    def analyze_lighting_setup(self, lights: List[Dict], camera_position: Dict,
+                               scene_bounds: Dict = None) -> Dict:
         """Analyze lighting quality and generate recommendations"""
 
         # Calculate total illuminance
-        total_illuminance = self._calculate_total_illuminance(lights, camera_position)
+        with stage('illuminance'):
+            total_illuminance = self._calculate_total_illuminance(lights, camera_position)
 
         # Calculate color temperature balance
-        color_temp_score = self._analyze_color_temperature(lights)
+        with stage('colorTemperature'):
+            color_temp_score = self._analyze_color_temperature(lights)
 
         # Check for shadows and coverage
-        coverage_score = self._analyze_coverage(lights)
+        with stage('coverage'):
+            coverage = self._coverage_metrics(lights, scene_bounds)
+        coverage_score = coverage['score']
 
         # Detect harsh shadows
-        shadow_score = self._analyze_shadow_quality(lights)
+        with stage('shadowQuality'):
+            shadow_score = self._analyze_shadow_quality(lights)
 
         # Calculate overall score
-        overall_score = (
-            0.3 * min(total_illuminance / self.min_illuminance, 1.0) +
-            0.25 * color_temp_score +
-            0.25 * coverage_score +
-            0.20 * shadow_score
-        )
+        overall_score = self._overall_score(total_illuminance, color_temp_score, coverage_score, shadow_score)
 
         # Generate recommendations
-        recommendations = self._generate_recommendations(
-            total_illuminance, color_temp_score, coverage_score, shadow_score
-        )
+        with stage('recommendations'):
+            recommendations = self._generate_recommendations(
+                total_illuminance, color_temp_score, coverage_score, shadow_score
+            )
 
         return {
             'overallScore': float(overall_score),
@@ -65,24 +120,107 @@ class LightingAnalyzer:
                 'illuminance': float(total_illuminance),
                 'colorTemperature': float(self._get_avg_color_temp(lights)),
                 'coverage': float(coverage_score),
-                'shadowQuality': float(shadow_score)
+                'shadowQuality': float(shadow_score),
+                'spacing': coverage['spacing'],
+                'floorCoverage': coverage['floorCoverage']
             },
             'recommendations': recommendations
         }
 
+    def analyze_batch(self, variants: List[Dict], viewpoints: List[Dict], scene_bounds: Dict = None) -> Dict:
+        """Score many light sets from many viewpoints
+
+        Illuminance for every (variant, viewpoint) pair is evaluated in one
+        stacked pass; the light-set metrics that do not depend on the camera
+        are computed once per variant.
+        """
+        started = timer.perf_counter()
+        light_sets = [variant.get('lights', []) for variant in variants]
+        cameras = [variant.get('viewpoints') or viewpoints for variant in variants]
+
+        set_index = np.repeat(np.arange(len(variants)), [len(views) for views in cameras])
+        points = np.array([[view.get('x', 0), view.get('y', 0), view.get('z', 0)]
+                           for views in cameras for view in views], dtype=np.float64).reshape(-1, 3)
+        positions, intensities = stack_light_sets(light_sets)
+        lux = illuminance_pairs(points, set_index, positions, intensities)
+
+        results = []
+        offset = 0
+        for i, (variant, lights, views) in enumerate(zip(variants, light_sets, cameras)):
+            variant_lux = lux[offset:offset + len(views)]
+            offset += len(views)
+
+            color_temp_score = self._analyze_color_temperature(lights)
+            coverage = self._coverage_metrics(lights, variant.get('sceneBounds', scene_bounds))
+            shadow_score = self._analyze_shadow_quality(lights)
+            scores = self._overall_score(variant_lux, color_temp_score, coverage['score'], shadow_score)
+            average_lux = float(variant_lux.mean()) if len(views) else 0.0
+
+            results.append({
+                'id': variant.get('id', i),
+                'overallScore': float(scores.mean()) if len(views) else None,
+                'minScore': float(scores.min()) if len(views) else None,
+                'metrics': {
+                    'illuminance': {
+                        'min': float(variant_lux.min()) if len(views) else 0.0,
+                        'avg': average_lux,
+                        'max': float(variant_lux.max()) if len(views) else 0.0
+                    },
+                    'colorTemperature': float(self._get_avg_color_temp(lights)),
+                    'coverage': float(coverage['score']),
+                    'shadowQuality': float(shadow_score),
+                    'spacing': coverage['spacing'],
+                    'floorCoverage': coverage['floorCoverage']
+                },
+                'viewpoints': [
+                    {'cameraPosition': view, 'illuminance': float(value), 'overallScore': float(score)}
+                    for view, value, score in zip(views, variant_lux, scores)
+                ],
+                'recommendations': self._generate_recommendations(
+                    average_lux, color_temp_score, coverage['score'], shadow_score
+                )
+            })
+
+        scored = [result for result in results if result['overallScore'] is not None]
+        best = max(scored, key=lambda result: result['overallScore']) if scored else None
+        return {
+            'variants': results,
+            'bestVariant': best['id'] if best else None,
+            'evaluations': len(points),
+            'computeMs': (timer.perf_counter() - started) * 1000
+        }
+
+    def _overall_score(self, illuminance, color_temp_score: float, coverage_score: float, shadow_score: float):
+        """Weighted quality score; illuminance may be a scalar or an array of viewpoints"""
+        return (
+            0.3 * np.minimum(illuminance / self.min_illuminance, 1.0) +
+            0.25 * color_temp_score +
+            0.25 * coverage_score +
+            0.20 * shadow_score
+        )
+
     def _calculate_total_illuminance(self, lights: List[Dict], camera_pos: Dict) -> float:
         """Calculate total illuminance at camera position"""
-        total = 0
-        for light in lights:
-            distance = self._distance(
-                camera_pos,
-                light.get('position', {'x': 0, 'y': 5, 'z': 0})
-            )
-            intensity = light.get('intensity', 1.0)
-            # Inverse square law
-            illuminance = (intensity * 10000) / max(distance ** 2, 1)
-            total += illuminance
-        return total
+        positions, intensities = light_arrays(lights)
+        point = np.array([camera_pos.get('x', 0), camera_pos.get('y', 0), camera_pos.get('z', 0)])
+        # Inverse square law
+        return float(illuminance_at(point, positions, intensities)[0])
+
+    def illuminance_map(self, lights: List[Dict], rooms: List[Dict], spacing: float,
+                        height: float, include_values: bool = True) -> Dict:
+        """Lux heatmap and uniformity for each room's floor area"""
+        results = []
+        for i, room in enumerate(rooms):
+            bounds = room.get('bounds', room)
+            started = timer.perf_counter()
+            with stage('illuminanceMap'):
+                room_map = illuminance_map(lights, bounds, spacing, height, include_values)
+            room_map['name'] = room.get('name', f'Room {i + 1}')
+            room_map['bounds'] = bounds
+            room_map['computeMs'] = (timer.perf_counter() - started) * 1000
+            room_map['meetsMinimum'] = room_map['stats']['min'] >= self.min_illuminance
+            results.append(room_map)
+        return {'rooms': results}
 
     def _analyze_color_temperature(self, lights: List[Dict]) -> float:
         """Score color temperature balance"""
@@ -115,30 +253,50 @@ class LightingAnalyzer:
                 return 5000  # Neutral
         return 5000
 
-    def _analyze_coverage(self, lights: List[Dict]) -> float:
+    def _analyze_coverage(self, lights: List[Dict], scene_bounds: Dict = None) -> float:
         """Score spatial coverage of lights"""
+        return self._coverage_metrics(lights, scene_bounds)['score']
+
+    def _coverage_metrics(self, lights: List[Dict], scene_bounds: Dict = None) -> Dict:
+        """Nearest-neighbour spacing and lit floor fraction, combined into a coverage score
+
+        Spacing uses a k-d tree over the light positions, so large fixture
+        layouts score in O(n log n). The floor (scene bounds, or the lights'
+        footprint) is sampled on a coarse grid and the fraction of points
+        reaching the minimum illuminance is reported as floorCoverage.
+        """
         if len(lights) < 2:
-            return 0.5
+            return {'score': 0.5, 'spacing': None, 'floorCoverage': None}
 
-        # Calculate spatial distribution
-        positions = [l.get('position', {'x': 0, 'y': 5, 'z': 0}) for l in lights]
-        distances = []
-        for i in range(len(positions)):
-            for j in range(i + 1, len(positions)):
-                dist = self._distance(positions[i], positions[j])
-                distances.append(dist)
+        positions, intensities = light_arrays(lights)
 
-        if not distances:
-            return 0.5
+        # Distance from each light to its nearest neighbour (k=1 is the light itself)
+        nearest = cKDTree(positions).query(positions, k=2)[0][:, 1]
+        mean_spacing = float(nearest.mean())
+        variation = float(nearest.std()) / max(mean_spacing, 1)
+        # Balanced spacing = better coverage
+        spacing_score = 1.0 / (1.0 + variation)
 
-        # Good coverage has balanced spacing
-        avg_dist = sum(distances) / len(distances)
-        variance = sum((d - avg_dist) ** 2 for d in distances) / len(distances)
-        std_dev = math.sqrt(variance)
+        if scene_bounds is None:
+            scene_bounds = {
+                'minX': float(positions[:, 0].min()), 'maxX': float(positions[:, 0].max()),
+                'minZ': float(positions[:, 2].min()), 'maxZ': float(positions[:, 2].max())
+            }
+        side = max(scene_bounds.get('maxX', 10) - scene_bounds.get('minX', -10),
+                   scene_bounds.get('maxZ', 10) - scene_bounds.get('minZ', -10), 1e-6)
+        points, _ = floor_grid(scene_bounds, side / COVERAGE_GRID_SIDE, 0.0)
+        lit = float(np.mean(illuminance_at(points, positions, intensities) >= self.min_illuminance))
 
-        # Lower variance = better coverage
-        score = 1.0 / (1.0 + std_dev / max(avg_dist, 1))
-        return score
+        return {
+            'score': 0.5 * spacing_score + 0.5 * lit,
+            'spacing': {
+                'mean': mean_spacing,
+                'min': float(nearest.min()),
+                'max': float(nearest.max()),
+                'variation': variation
+            },
+            'floorCoverage': lit
+        }
 
     def _analyze_shadow_quality(self, lights: List[Dict]) -> float:
         """Score shadow quality (multiple lights = softer shadows)"""
@@ -196,41 +354,29 @@ class NaturalLightCalculator:
         # Calculate day of year
         day_of_year = date.timetuple().tm_yday
 
-        # Solar declination (angle of sun relative to equator)
-        declination = 23.45 * math.sin(math.radians((360/365) * (day_of_year - 81)))
-
-        # Hour angle (position of sun in the sky at given time)
-        hour_angle = 15 * (time - 12)
-
-        # Solar altitude (elevation angle)
-        lat_rad = math.radians(latitude)
-        dec_rad = math.radians(declination)
-        hour_rad = math.radians(hour_angle)
-
-        altitude = math.degrees(math.asin(
-            math.sin(lat_rad) * math.sin(dec_rad) +
-            math.cos(lat_rad) * math.cos(dec_rad) * math.cos(hour_rad)
-        ))
-
-        # Solar azimuth (compass direction)
-        azimuth = math.degrees(math.atan2(
-            math.sin(hour_rad),
-            math.cos(hour_rad) * math.sin(lat_rad) - math.tan(dec_rad) * math.cos(lat_rad)
-        ))
-
-        # Adjust azimuth to 0-360 range
-        azimuth = (azimuth + 360) % 360
-
-        # Sun intensity based on altitude (higher = stronger)
-        base_intensity = max(0, math.sin(math.radians(altitude)))
-
-        # Adjust for cloud cover
-        cloud_factor = 1 - (cloud_cover * 0.7)  # Clouds reduce intensity
-        intensity = base_intensity * cloud_factor
+        with stage('sunPath'):
+            path = sun_path(latitude, [day_of_year], [time], cloud_cover)
+        return self._lighting_result(
+            float(path['altitude'][0]), float(path['azimuth'][0]), float(path['intensity'][0]),
+            float(path['colorTemperature'][0]), cloud_cover, time
+        )
 
-        # Sun color (warmer at low angles, cooler at high angles)
-        color_temp = 2000 + (altitude / 90) * 4500  # 2000K at horizon, 6500K at zenith
+    def calculate_from_table(self, cache: NaturalLightCache, key: Tuple) -> Dict:
+        """Result for a quantised cache key, read from the cached sun table for its location-day
+
+        Only the first request for a site and day evaluates the sun model.
+        """
+        latitude, day_of_year, slot, cloud_cover = key
+        table = cache.day_table(latitude, day_of_year)
+        intensity = float(table['intensity'][slot]) * (1 - cloud_cover * 0.7)
+        return self._lighting_result(
+            float(table['altitude'][slot]), float(table['azimuth'][slot]), intensity,
+            float(table['colorTemperature'][slot]), cloud_cover, cache.slot_time(slot)
+        )
 
+    def _lighting_result(self, altitude: float, azimuth: float, intensity: float, color_temp: float,
+                         cloud_cover: float, time: float) -> Dict:
+        """Response for one sun position"""
         # Sky light intensity (ambient light from sky)
         sky_intensity = 0.3 * intensity
 
@@ -249,6 +395,81 @@ class NaturalLightCalculator:
             'recommendedHDRI': hdri
         }
 
+    def calculate_series(self, latitude: float, longitude: float, start: datetime, end: datetime,
+                         step_minutes: float, cloud_cover: float, daylight_only: bool = False) -> Dict:
+        """Sun positions for every timestamp in [start, end) at a fixed step, computed as arrays"""
+        with stage('sunPath'):
+            timestamps = time_range(start, end, step_minutes)
+            day_of_year, hours = day_and_hour(timestamps)
+            path = sun_path(latitude, day_of_year, hours, cloud_cover)
+
+        above = path['altitude'] > 0
+        daylight_hours = float(np.count_nonzero(above)) * step_minutes / 60
+        if daylight_only:
+            timestamps = timestamps[above]
+            path = {key: values[above] for key, values in path.items()}
+
+        with stage('serialize'):
+            series = {key: np.round(values, 3).tolist() for key, values in path.items()}
+            series['timestamps'] = np.datetime_as_string(timestamps, unit='m').tolist()
+        return {
+            'count': len(timestamps),
+            'stepMinutes': step_minutes,
+            'daylightHours': daylight_hours,
+            'maxAltitude': float(path['altitude'].max()) if len(timestamps) else None,
+            'series': series
+        }
+
+    def sun_hours(self, latitude: float, start: datetime, end: datetime, step_minutes: float,
+                  building_orientation: float, triangles: np.ndarray, points: np.ndarray) -> Dict:
+        """Direct sun hours at each point, with the scene geometry casting shadows
+
+        The BVH is built once and every daylight timestep is cast from every
+        point; each unblocked timestep counts step_minutes of sun.
+        """
+        started = timer.perf_counter()
+        with stage('sunPath'):
+            timestamps = time_range(start, end, step_minutes)
+            day_of_year, hours = day_and_hour(timestamps)
+            path = sun_path(latitude, day_of_year, hours)
+            above = path['altitude'] > 0
+            directions = sun_vectors(
+                path['altitude'][above], compass_bearing(path['azimuth'][above]), building_orientation
+            )
+
+        with stage('bvhBuild'):
+            bvh = TriangleBVH(triangles)
+        build_ms = (timer.perf_counter() - started) * 1000
+        with stage('rayCast'):
+            lit = sun_exposure(bvh, points, directions, SUN_HOURS_WORKERS)
+        step_hours = step_minutes / 60
+
+        return {
+            'sunHours': lit * step_hours,
+            'possibleHours': float(len(directions) * step_hours),
+            'sunPositions': len(directions),
+            'triangles': len(triangles),
+            'buildMs': build_ms,
+            'computeMs': (timer.perf_counter() - started) * 1000
+        }
+
+    def climate_daylight(self, weather: Dict, triangles: np.ndarray, points: np.ndarray,
+                         building_orientation: float, thresholds: Dict) -> Dict:
+        """Annual daylight autonomy and direct sun exposure at each point from hourly weather data"""
+        started = timer.perf_counter()
+        result = climate_daylight(
+            weather, points, triangles, building_orientation,
+            occupied_hours=(int(thresholds.get('occupiedStart', 8)), int(thresholds.get('occupiedEnd', 18))),
+            sda_lux=float(thresholds.get('sdaLux', 300)),
+            sda_fraction=float(thresholds.get('sdaFraction', 0.5)),
+            ase_lux=float(thresholds.get('aseLux', 1000)),
+            ase_hours=int(thresholds.get('aseHours', 250)),
+            workers=SUN_HOURS_WORKERS
+        )
+        result['triangles'] = len(triangles)
+        result['computeMs'] = (timer.perf_counter() - started) * 1000
+        return result
+
     def _select_hdri(self, altitude: float, cloud_cover: float, time: float) -> str:
         """Select appropriate HDRI based on conditions"""
         if time < 6 or time > 20:
@@ -289,15 +510,17 @@ class LightOptimizer:
         max_z = scene_bounds.get('maxZ', 10)
 
         # Generate lights based on goal
-        if lighting_goal == 'natural':
-            lights = self._generate_natural_lights(min_x, max_x, min_z, max_z)
-        elif lighting_goal == 'dramatic':
-            lights = self._generate_dramatic_lights(min_x, max_x, min_z, max_z)
-        else:  # even
-            lights = self._generate_even_lights(min_x, max_x, min_z, max_z)
+        with stage('placement'):
+            if lighting_goal == 'natural':
+                lights = self._generate_natural_lights(min_x, max_x, min_z, max_z)
+            elif lighting_goal == 'dramatic':
+                lights = self._generate_dramatic_lights(min_x, max_x, min_z, max_z)
+            else:  # even
+                lights = self._generate_even_lights(min_x, max_x, min_z, max_z)
 
         # Adjust intensities to match target illuminance
-        lights = self._adjust_intensities(lights, target_illuminance)
+        with stage('intensities'):
+            lights = self._adjust_intensities(lights, target_illuminance)
 
         return {
             'lights': lights,
@@ -305,6 +528,22 @@ class LightOptimizer:
             'configuration': lighting_goal
         }
 
+    def search(self, scene_bounds: Dict, target_illuminance: float, light_count: int,
+               mounting_height: float, work_plane_height: float, min_uniformity: float,
+               max_total_intensity: float = None, restarts: int = 4, max_evaluations: int = 2000,
+               seed: int = 0, max_ugr: float = None, fixture_area: float = DEFAULT_FIXTURE_AREA) -> Dict:
+        """Search fixture positions and intensities for the target illuminance, uniformity and glare limit"""
+        with stage('problemSetup'):
+            problem = PlacementProblem(
+                scene_bounds, light_count, target_illuminance, mounting_height,
+                work_plane_height, min_uniformity, max_total_intensity, max_ugr, fixture_area
+            )
+        with stage('search'):
+            result = search_placement(problem, restarts, max_evaluations, OPTIMIZER_WORKERS, seed)
+        result['configuration'] = 'search'
+        result['targetIlluminance'] = float(target_illuminance)
+        return result
+
     def _generate_natural_lights(self, min_x: float, max_x: float,
                                  min_z: float, max_z: float) -> List[Dict]:
         """Generate natural lighting setup"""
@@ -405,6 +644,32 @@ class LightOptimizer:
 analyzer = LightingAnalyzer()
 natural_light = NaturalLightCalculator()
 optimizer = LightOptimizer()
+natural_light_cache = NaturalLightCache(
+    NATURAL_LIGHT_CACHE_SIZE, SUN_TABLE_CACHE_SIZE, SUN_CACHE_LATLON_STEP,
+    SUN_CACHE_TIME_MINUTES, SUN_CACHE_CLOUD_STEP
+) if NATURAL_LIGHT_CACHE_SIZE > 0 else None
+weather_cache = WeatherCache(EPW_CACHE_DIR, WEATHER_CACHE_SIZE)
+
+
+if PROFILE_REQUESTS:
+    @app.before_request
+    def start_profile():
+        g.request_started = timer.perf_counter()
+        profiling.start()
+
+    @app.after_request
+    def report_profile(response):
+        timings = profiling.finish()
+        if timings is None:
+            return response
+        timings['total'] = (timer.perf_counter() - g.request_started) * 1000
+        response.headers['Server-Timing'] = profiling.server_timing(timings)
+        logger.info(json.dumps({
+            'profile': request.path,
+            'status': response.status_code,
+            'stagesMs': {name: round(ms, 3) for name, ms in timings.items()}
+        }))
+        return response
 
 # ============================================================================
 # API ENDPOINTS
@@ -416,7 +681,8 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'ai-lighting',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'naturalLightingCache': natural_light_cache.stats() if natural_light_cache else None
     })
 
 
@@ -428,8 +694,9 @@ def analyze_lighting():
 
         lights = data.get('lights', [])
         camera_position = data.get('cameraPosition', {'x': 0, 'y': 1.6, 'z': 0})
+        scene_bounds = data.get('sceneBounds')
 
-        result = analyzer.analyze_lighting_setup(lights, camera_position)
+        result = analyzer.analyze_lighting_setup(lights, camera_position, scene_bounds)
 
         logger.info(f"Analyzed {len(lights)} lights, score: {result['overallScore']:.2f}")
 
@@ -440,6 +707,100 @@ def analyze_lighting():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_lighting_batch():
+    """Score many light set variants from many viewpoints in one request"""
+    try:
+        data = request.get_json()
+
+        variants = data.get('variants', [])
+        viewpoints = data.get('viewpoints') or [data.get('cameraPosition', {'x': 0, 'y': 1.6, 'z': 0})]
+        scene_bounds = data.get('sceneBounds')
+
+        evaluations = sum(len(variant.get('viewpoints') or viewpoints) for variant in variants)
+        if evaluations > MAX_BATCH_EVALUATIONS:
+            return jsonify({'error': f'{evaluations} evaluations exceeds limit of {MAX_BATCH_EVALUATIONS}'}), 400
+
+        result = analyzer.analyze_batch(variants, viewpoints, scene_bounds)
+
+        logger.info(f"Analyzed {len(variants)} variants, {result['evaluations']} evaluations in {result['computeMs']:.0f}ms")
+
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error analyzing lighting batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/illuminance-map', methods=['POST'])
+def calculate_illuminance_map():
+    """Lux heatmaps over room floor areas"""
+    try:
+        data = request.get_json()
+
+        lights = data.get('lights', [])
+        rooms = data.get('rooms') or [{'name': 'Scene', 'bounds': data.get('sceneBounds', {
+            'minX': -10, 'maxX': 10,
+            'minZ': -10, 'maxZ': 10
+        })}]
+        spacing = float(data.get('gridSpacing', 0.25))
+        height = float(data.get('workPlaneHeight', 0.8))
+        include_values = data.get('includeValues', True)
+
+        if spacing <= 0:
+            return jsonify({'error': 'gridSpacing must be positive'}), 400
+        for room in rooms:
+            rows, cols = grid_shape(room.get('bounds', room), spacing)
+            if rows * cols > MAX_GRID_POINTS:
+                return jsonify({'error': f'Grid of {rows * cols} points exceeds limit of {MAX_GRID_POINTS}'}), 400
+
+        result = analyzer.illuminance_map(lights, rooms, spacing, height, include_values)
+
+        logger.info(f"Illuminance map: {len(lights)} lights, {len(rooms)} rooms")
+
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error calculating illuminance map: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/glare', methods=['POST'])
+def calculate_glare():
+    """Unified Glare Rating map over observer positions in a room"""
+    try:
+        data = request.get_json()
+
+        lights = data.get('lights', [])
+        bounds = data.get('sceneBounds', {
+            'minX': -10, 'maxX': 10,
+            'minZ': -10, 'maxZ': 10
+        })
+        spacing = float(data.get('gridSpacing', 0.5))
+        eye_height = float(data.get('eyeHeight', DEFAULT_EYE_HEIGHT))
+        azimuths = data.get('viewAzimuths', [0, 90, 180, 270])
+        background_luminance = float(data.get('backgroundLuminance', DEFAULT_BACKGROUND_LUMINANCE))
+        ugr_limit = float(data.get('ugrLimit', DEFAULT_UGR_LIMIT))
+
+        if spacing <= 0:
+            return jsonify({'error': 'gridSpacing must be positive'}), 400
+        rows, cols = grid_shape(bounds, spacing)
+        if rows * cols * len(azimuths) > MAX_GRID_POINTS:
+            return jsonify({'error': f'{rows * cols * len(azimuths)} observers exceeds limit of {MAX_GRID_POINTS}'}), 400
+
+        started = timer.perf_counter()
+        result = glare_map(lights, bounds, spacing, eye_height, azimuths, background_luminance, ugr_limit)
+        result['computeMs'] = (timer.perf_counter() - started) * 1000
+
+        logger.info(f"Glare map: {len(lights)} fixtures, max UGR {result['stats']['maxUgr']:.1f}")
+
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error calculating glare: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/natural-lighting', methods=['POST'])
 def calculate_natural_lighting():
     """Calculate natural lighting from sun position"""
@@ -459,16 +820,225 @@ def calculate_natural_lighting():
         else:
             date = datetime.now()
 
-        result = natural_light.calculate(
-            latitude, longitude, date, time, cloud_cover, building_orientation
+        key = None
+        if natural_light_cache is not None:
+            key = natural_light_cache.key(latitude, date.timetuple().tm_yday, time, cloud_cover)
+        if key is None:
+            result = natural_light.calculate(
+                latitude, longitude, date, time, cloud_cover, building_orientation
+            )
+            logger.info(f"Calculated natural lighting: altitude={result['sunPosition']['altitude']:.1f}°")
+            return jsonify(result)
+
+        # Cached responses are stored serialised, so a hit skips the model and JSON encoding
+        with stage('cacheLookup'):
+            body = natural_light_cache.get(key)
+        cache_status = 'HIT'
+        if body is None:
+            with stage('sunTable'):
+                result = natural_light.calculate_from_table(natural_light_cache, key)
+            with stage('serialize'):
+                body = app.json.dumps(result).encode()
+            natural_light_cache.put(key, body)
+            cache_status = 'MISS'
+            logger.info(f"Calculated natural lighting: altitude={result['sunPosition']['altitude']:.1f}°")
+
+        return app.response_class(body, mimetype='application/json', headers={'X-Cache': cache_status})
+
+    except Exception as e:
+        logger.error(f"Error calculating natural lighting: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/natural-lighting/series', methods=['POST'])
+def calculate_sun_path():
+    """Sun positions over a time range, e.g. a full year for solar studies"""
+    try:
+        data = request.get_json()
+
+        latitude = data.get('latitude', 40.7128)
+        longitude = data.get('longitude', -74.0060)
+        step_minutes = float(data.get('stepMinutes', 60))
+        cloud_cover = data.get('cloudCover', 0)
+        daylight_only = data.get('daylightOnly', False)
+
+        if data.get('start'):
+            start = datetime.fromisoformat(data['start'].replace('Z', '+00:00'))
+        else:
+            start = datetime(datetime.now().year, 1, 1)
+        if data.get('end'):
+            end = datetime.fromisoformat(data['end'].replace('Z', '+00:00'))
+        else:
+            end = start.replace(year=start.year + 1)
+
+        if step_minutes <= 0:
+            return jsonify({'error': 'stepMinutes must be positive'}), 400
+        samples = (end - start).total_seconds() / 60 / step_minutes
+        if samples > MAX_SUN_PATH_SAMPLES:
+            return jsonify({'error': f'{int(samples)} timestamps exceeds limit of {MAX_SUN_PATH_SAMPLES}'}), 400
+
+        result = natural_light.calculate_series(
+            latitude, longitude, start, end, step_minutes, cloud_cover, daylight_only
         )
 
-        logger.info(f"Calculated natural lighting: altitude={result['sunPosition']['altitude']:.1f}°")
+        logger.info(f"Calculated sun path: {result['count']} timestamps, {result['daylightHours']:.0f} daylight hours")
 
         return jsonify(result)
 
     except Exception as e:
-        logger.error(f"Error calculating natural lighting: {str(e)}")
+        logger.error(f"Error calculating sun path: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/sun-hours', methods=['POST'])
+def calculate_sun_hours():
+    """Direct sun hours over sample points, shadowed by scene meshes"""
+    try:
+        data = request.get_json()
+
+        latitude = data.get('latitude', 40.7128)
+        step_minutes = float(data.get('stepMinutes', 30))
+        building_orientation = data.get('buildingOrientation', 0)
+        triangles = mesh_triangles(data.get('meshes', []))
+
+        if data.get('start'):
+            start = datetime.fromisoformat(data['start'].replace('Z', '+00:00'))
+        else:
+            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if data.get('end'):
+            end = datetime.fromisoformat(data['end'].replace('Z', '+00:00'))
+        else:
+            end = start + timedelta(days=1)
+
+        grid = None
+        if data.get('points'):
+            points = np.asarray(data['points'], dtype=np.float64).reshape(-1, 3)
+        else:
+            grid = data.get('grid', {})
+            bounds = grid.get('bounds', {'minX': -10, 'maxX': 10, 'minZ': -10, 'maxZ': 10})
+            points, shape = floor_grid(bounds, float(grid.get('spacing', 1.0)), float(grid.get('height', 0.0)))
+
+        if step_minutes <= 0:
+            return jsonify({'error': 'stepMinutes must be positive'}), 400
+        rays = len(points) * (end - start).total_seconds() / 60 / step_minutes
+        if rays > MAX_SUN_RAYS:
+            return jsonify({'error': f'{int(rays)} rays exceeds limit of {MAX_SUN_RAYS}'}), 400
+
+        result = natural_light.sun_hours(
+            latitude, start, end, step_minutes, building_orientation, triangles, points
+        )
+        hours = result['sunHours']
+        result['stats'] = {
+            'min': float(hours.min()) if len(hours) else 0.0,
+            'avg': float(hours.mean()) if len(hours) else 0.0,
+            'max': float(hours.max()) if len(hours) else 0.0
+        }
+        if grid is not None:
+            result['grid'] = {'rows': shape[0], 'cols': shape[1], 'bounds': bounds, 'height': float(grid.get('height', 0.0))}
+            result['sunHours'] = np.round(hours.reshape(shape), 2).tolist()
+        else:
+            result['sunHours'] = np.round(hours, 2).tolist()
+
+        logger.info(f"Sun hours: {len(points)} points, {result['sunPositions']} sun positions, "
+                    f"{result['triangles']} triangles in {result['computeMs']:.0f}ms")
+
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error calculating sun hours: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/weather', methods=['POST'])
+def upload_weather():
+    """Parse an EPW weather file once and return its id for /climate-daylight"""
+    try:
+        # Read at most one byte past the limit, so bodies without Content-Length are bounded too
+        limit = int(MAX_WEATHER_UPLOAD_MB * 1024 * 1024)
+        too_large = (request.content_length or 0) > limit
+        if not too_large:
+            body = request.stream.read(limit + 1)
+            too_large = len(body) > limit
+        if too_large:
+            return jsonify({'error': f'Weather file larger than {MAX_WEATHER_UPLOAD_MB:g} MB'}), 413
+
+        if request.is_json:
+            text = json.loads(body or b'{}').get('epw', '')
+        else:
+            text = body.decode('utf-8', 'replace')
+        if not text:
+            return jsonify({'error': 'EPW weather file is required'}), 400
+
+        weather_id, weather = weather_cache.add(text)
+        return jsonify({
+            'weatherId': weather_id,
+            'location': {
+                'city': weather['city'],
+                'country': weather['country'],
+                'latitude': weather['latitude'],
+                'longitude': weather['longitude'],
+                'timezone': weather['timezone']
+            },
+            'hours': int(len(weather['hour']))
+        })
+
+    except Exception as e:
+        logger.error(f"Error parsing weather file: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/climate-daylight', methods=['POST'])
+def calculate_climate_daylight():
+    """Spatial daylight autonomy (sDA) and annual sun exposure (ASE) over sample points"""
+    try:
+        data = request.get_json()
+
+        if data.get('weatherId'):
+            weather = weather_cache.get(data['weatherId'])
+            if weather is None:
+                return jsonify({'error': f"Unknown weatherId {data['weatherId']}"}), 404
+        elif data.get('epw'):
+            _, weather = weather_cache.add(data['epw'])
+        else:
+            return jsonify({'error': 'weatherId or epw is required'}), 400
+
+        building_orientation = data.get('buildingOrientation', 0)
+        triangles = mesh_triangles(data.get('meshes', []))
+
+        grid = None
+        if data.get('points'):
+            points = np.asarray(data['points'], dtype=np.float64).reshape(-1, 3)
+        else:
+            grid = data.get('grid', {})
+            bounds = grid.get('bounds', {'minX': -10, 'maxX': 10, 'minZ': -10, 'maxZ': 10})
+            points, shape = floor_grid(bounds, float(grid.get('spacing', 1.0)), float(grid.get('height', 0.8)))
+
+        # Upper bound: every sky patch plus one sun direction per occupied hour
+        rays = len(points) * (SKY_PATCH_COUNT + len(weather['hour']))
+        if rays > MAX_SUN_RAYS:
+            return jsonify({'error': f'{int(rays)} rays exceeds limit of {MAX_SUN_RAYS}'}), 400
+
+        result = natural_light.climate_daylight(
+            weather, triangles, points, building_orientation, data.get('thresholds', {})
+        )
+        autonomy = result.pop('daylightAutonomy')
+        sun_hours = result.pop('directSunHours')
+        sky_factor = result.pop('skyFactor')
+        if grid is not None:
+            result['grid'] = {'rows': shape[0], 'cols': shape[1], 'bounds': bounds, 'height': float(grid.get('height', 0.8))}
+            autonomy, sun_hours, sky_factor = autonomy.reshape(shape), sun_hours.reshape(shape), sky_factor.reshape(shape)
+        result['daylightAutonomy'] = np.round(autonomy, 3).tolist()
+        result['directSunHours'] = sun_hours.tolist()
+        result['skyFactor'] = np.round(sky_factor, 3).tolist()
+        result['location'] = {'latitude': weather['latitude'], 'longitude': weather['longitude']}
+
+        logger.info(f"Climate daylight: {len(points)} points, {result['occupiedHours']} hours, "
+                    f"{result['sunDirections']} sun directions in {result['computeMs']:.0f}ms")
+
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error calculating climate daylight: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -485,7 +1055,28 @@ def optimize_lighting():
         target_illuminance = data.get('targetIlluminance', 500)
         lighting_goal = data.get('lightingGoal', 'even')
 
-        result = optimizer.optimize(scene_bounds, target_illuminance, lighting_goal)
+        if data.get('mode') == 'search':
+            light_count = data.get('lightCount', 4)
+            if isinstance(light_count, bool) or not isinstance(light_count, int) \
+                    or not 1 <= light_count <= MAX_SEARCH_LIGHTS:
+                return jsonify({'error': f'lightCount must be an integer from 1 to {MAX_SEARCH_LIGHTS}'}), 400
+
+            result = optimizer.search(
+                scene_bounds, target_illuminance,
+                light_count=light_count,
+                mounting_height=float(data.get('mountingHeight', 3.0)),
+                work_plane_height=float(data.get('workPlaneHeight', 0.8)),
+                min_uniformity=float(data.get('minUniformity', 0.6)),
+                max_total_intensity=data.get('maxTotalIntensity'),
+                restarts=int(data.get('restarts', 4)),
+                max_evaluations=int(data.get('maxEvaluations', 2000)),
+                seed=int(data.get('seed', 0)),
+                max_ugr=data.get('maxUgr'),
+                fixture_area=float(data.get('fixtureArea', DEFAULT_FIXTURE_AREA))
+            )
+            lighting_goal = 'search'
+        else:
+            result = optimizer.optimize(scene_bounds, target_illuminance, lighting_goal)
 
         logger.info(f"Optimized lighting: {len(result['lights'])} lights, goal={lighting_goal}")
 
@@ -0,0 +1,269 @@
+"""
+Direct sun exposure against scene geometry
+Triangle BVH with vectorised ray traversal, and sun-hour maps over sample points
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Triangles per BVH leaf
+LEAF_SIZE = 8
+
+# Rays stepped through the BVH together, bounding the (rays x leaf triangles) blocks
+RAY_BATCH = 65536
+
+# Ray origins are lifted off their surface by this much to avoid self-hits
+RAY_EPSILON = 1e-4
+
+
+def mesh_triangles(meshes: List[Dict]) -> np.ndarray:
+    """Triangles (n, 3, 3) from meshes of 'vertices' and optional 'indices' (flat or nested)"""
+    triangles = []
+    for mesh in meshes:
+        vertices = np.asarray(mesh.get('vertices', []), dtype=np.float64).reshape(-1, 3)
+        if 'indices' in mesh:
+            indices = np.asarray(mesh['indices'], dtype=np.int64).reshape(-1, 3)
+            triangles.append(vertices[indices])
+        else:
+            triangles.append(vertices[:len(vertices) // 3 * 3].reshape(-1, 3, 3))
+    if not triangles:
+        return np.empty((0, 3, 3), dtype=np.float64)
+    return np.concatenate(triangles)
+
+
+def sun_vectors(altitude: np.ndarray, azimuth: np.ndarray, north_angle: float = 0.0) -> np.ndarray:
+    """Unit vectors (n, 3) pointing towards the sun
+
+    azimuth is a compass bearing, clockwise from north; convert sun_path
+    azimuths with solar.compass_bearing first. Scene axes are y up, +x east
+    and -z north. north_angle rotates the scene's north clockwise from -z,
+    i.e. the building orientation.
+    """
+    alt = np.radians(altitude)
+    az = np.radians(np.asarray(azimuth) - north_angle)
+    return np.stack([np.sin(az) * np.cos(alt), np.sin(alt), -np.cos(az) * np.cos(alt)], axis=1)
+
+
+class TriangleBVH:
+    """Bounding volume hierarchy over triangles, answering any-hit (shadow) queries for ray batches
+
+    Nodes are stored in flat arrays. Triangles are reordered so that every
+    leaf is a contiguous range. Traversal is depth-first over ray packets:
+    each node is tested against all rays that reached it in one slab test,
+    and each leaf against its rays in one Möller-Trumbore block.
+    """
+
+    def __init__(self, triangles: np.ndarray):
+        self.triangle_count = len(triangles)
+        bounds_min, bounds_max, children, ranges = [], [], [], []
+        order = np.arange(len(triangles))
+        centroids = triangles.mean(axis=1)
+        lo, hi = triangles.min(axis=1), triangles.max(axis=1)
+
+        # Iterative median split along the longest centroid axis
+        stack = [(0, len(triangles), -1, 0)]
+        while stack:
+            start, end, parent, side = stack.pop()
+            node = len(bounds_min)
+            if parent >= 0:
+                children[parent][side] = node
+            members = order[start:end]
+            bounds_min.append(lo[members].min(axis=0) if len(members) else np.zeros(3))
+            bounds_max.append(hi[members].max(axis=0) if len(members) else np.zeros(3))
+            children.append([-1, -1])
+            ranges.append((start, end))
+            if end - start <= LEAF_SIZE:
+                continue
+            spread = np.ptp(centroids[members], axis=0)
+            axis = int(np.argmax(spread))
+            mid = (end - start) // 2
+            split = np.argpartition(centroids[members, axis], mid)
+            order[start:end] = members[split]
+            stack.append((start + mid, end, node, 1))
+            stack.append((start, start + mid, node, 0))
+
+        self.bounds_min = np.asarray(bounds_min)
+        self.bounds_max = np.asarray(bounds_max)
+        self.children = np.asarray(children, dtype=np.int64)
+        self.ranges = np.asarray(ranges, dtype=np.int64)
+
+        ordered = triangles[order]
+        self.v0 = ordered[:, 0]
+        self.e1 = ordered[:, 1] - ordered[:, 0]
+        self.e2 = ordered[:, 2] - ordered[:, 0]
+
+    # Arrays that fully describe a built BVH
+    ARRAYS = ('bounds_min', 'bounds_max', 'children', 'ranges', 'v0', 'e1', 'e2')
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'TriangleBVH':
+        """BVH over already-built node and triangle arrays, e.g. views of shared memory"""
+        bvh = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(bvh, name, arrays[name])
+        bvh.triangle_count = len(bvh.v0)
+        return bvh
+
+    def occluded(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        """True for each ray (origin, direction) that hits any triangle at t > 0"""
+        hit = np.zeros(len(origins), dtype=bool)
+        if self.triangle_count == 0:
+            return hit
+        for start in range(0, len(origins), RAY_BATCH):
+            hit[start:start + RAY_BATCH] = self._occluded_batch(
+                origins[start:start + RAY_BATCH], directions[start:start + RAY_BATCH]
+            )
+        return hit
+
+    def _occluded_batch(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        hit = np.zeros(len(origins), dtype=bool)
+        safe = np.where(np.abs(directions) < 1e-12, 1e-12, directions)
+        inverse = 1.0 / safe
+
+        stack = [(0, np.arange(len(origins)))]
+        while stack:
+            node, rays = stack.pop()
+            rays = rays[~hit[rays]]
+            if len(rays) == 0:
+                continue
+
+            # Slab test against the node's box
+            t0 = (self.bounds_min[node] - origins[rays]) * inverse[rays]
+            t1 = (self.bounds_max[node] - origins[rays]) * inverse[rays]
+            near = np.minimum(t0, t1).max(axis=1)
+            far = np.maximum(t0, t1).min(axis=1)
+            rays = rays[(far >= np.maximum(near, 0.0))]
+            if len(rays) == 0:
+                continue
+
+            left, right = self.children[node]
+            if left >= 0:
+                stack.append((right, rays))
+                stack.append((left, rays))
+                continue
+
+            start, end = self.ranges[node]
+            hit[rays] = self._intersect(origins[rays], directions[rays], slice(start, end))
+        return hit
+
+    def _intersect(self, origins: np.ndarray, directions: np.ndarray, triangles: slice) -> np.ndarray:
+        """Möller-Trumbore for every (ray, triangle) pair; True where a ray hits any triangle"""
+        v0, e1, e2 = self.v0[triangles], self.e1[triangles], self.e2[triangles]
+        pvec = np.cross(directions[:, None, :], e2[None, :, :])
+        det = np.einsum('mk,nmk->nm', e1, pvec)
+        valid = np.abs(det) > 1e-12
+        inv_det = np.where(valid, 1.0 / np.where(valid, det, 1.0), 0.0)
+
+        tvec = origins[:, None, :] - v0[None, :, :]
+        u = np.einsum('nmk,nmk->nm', tvec, pvec) * inv_det
+        qvec = np.cross(tvec, e1[None, :, :])
+        v = np.einsum('nk,nmk->nm', directions, qvec) * inv_det
+        t = np.einsum('mk,nmk->nm', e2, qvec) * inv_det
+        return (valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > RAY_EPSILON)).any(axis=1)
+
+
+class SharedScene:
+    """A BVH and its sample points copied into one shared memory block for pool workers
+
+    Tasks carry only the small descriptor; workers map the block and read
+    the arrays in place, so the scene is neither pickled nor copied per task.
+    The creator unlinks the block on exit.
+    """
+
+    def __init__(self, bvh: TriangleBVH, points: np.ndarray):
+        arrays = {name: np.ascontiguousarray(getattr(bvh, name)) for name in TriangleBVH.ARRAYS}
+        arrays['points'] = np.ascontiguousarray(points)
+        layout, offset = [], 0
+        for name, array in arrays.items():
+            layout.append((name, array.dtype.str, array.shape, offset))
+            offset += -(-array.nbytes // 64) * 64
+        self.memory = SharedMemory(create=True, size=max(offset, 1))
+        for (name, dtype, shape, start), array in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype, self.memory.buf, start)[...] = array
+        self.descriptor = (self.memory.name, layout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.memory.close()
+        self.memory.unlink()
+
+
+def visible_directions(bvh: TriangleBVH, points: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    """(points, directions) mask of directions each point sees unoccluded"""
+    origins = np.repeat(points, len(directions), axis=0)
+    rays = np.tile(directions, (len(points), 1))
+    return ~bvh.occluded(origins, rays).reshape(len(points), len(directions))
+
+
+def _visible_in_worker(descriptor, directions: np.ndarray) -> np.ndarray:
+    """Cast one chunk against a SharedScene; the block is mapped only for the task"""
+    name, layout = descriptor
+    memory = SharedMemory(name=name)
+    arrays = points = None
+    try:
+        arrays = {key: np.ndarray(shape, dtype, memory.buf, start) for key, dtype, shape, start in layout}
+        points = arrays.pop('points')
+        return visible_directions(TriangleBVH.from_arrays(arrays), points, directions)
+    finally:
+        # Views into the block must be gone before it can be closed
+        arrays = points = None
+        try:
+            memory.close()
+        except BufferError:
+            # A traceback still holds views; the mapping is released with it
+            pass
+
+
+# Long-lived ray casting pool, shared by all requests
+_ray_pool = WorkerPool()
+
+
+def ray_pool(workers: int) -> ProcessPoolExecutor:
+    """The ray casting pool, started on first use with at least workers processes"""
+    return _ray_pool.get(workers)
+
+
+def visibility(bvh: TriangleBVH, points: np.ndarray, directions: np.ndarray, workers: int = 1) -> np.ndarray:
+    """(points, directions) mask of directions not blocked by the scene, seen from each point
+
+    Directions are split into chunks cast across the long-lived ray pool. The
+    BVH and points reach the workers through shared memory rather than pickling.
+    """
+    points = points + np.array([0.0, RAY_EPSILON, 0.0])
+    if len(directions) == 0 or len(points) == 0:
+        return np.ones((len(points), len(directions)), dtype=bool)
+
+    # Keep each task to roughly RAY_BATCH rays, and give every worker something to do
+    per_task = max(min(RAY_BATCH // len(points), -(-len(directions) // max(workers, 1))), 1)
+    chunks = [directions[i:i + per_task] for i in range(0, len(directions), per_task)]
+
+    if workers <= 1 or len(chunks) == 1:
+        return np.concatenate([visible_directions(bvh, points, chunk) for chunk in chunks], axis=1)
+
+    pool = ray_pool(workers)
+    with SharedScene(bvh, points) as scene:
+        futures = [pool.submit(_visible_in_worker, scene.descriptor, chunk) for chunk in chunks]
+        try:
+            return np.concatenate([future.result() for future in futures], axis=1)
+        finally:
+            # The block is unlinked on exit, so no queued task may still need it
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+
+
+def sun_exposure(bvh: TriangleBVH, points: np.ndarray, directions: np.ndarray, workers: int = 1) -> np.ndarray:
+    """Per point count of sun directions not blocked by the scene"""
+    return visibility(bvh, points, directions, workers).sum(axis=1)
@@ -0,0 +1,74 @@
+"""
+Vectorised sun position model
+Declination, hour angle, altitude, azimuth and intensity for arrays of timestamps
+"""
+
+from datetime import datetime
+from typing import Dict
+
+import numpy as np
+
+
+def sun_path(latitude: float, day_of_year: np.ndarray, hours: np.ndarray, cloud_cover: float = 0.0) -> Dict[str, np.ndarray]:
+    """Sun position and light characteristics for each (day of year, solar hour) pair
+
+    Same model as the single-timestamp calculation: hours are local solar time
+    and longitude does not enter the calculation.
+    """
+    day_of_year = np.asarray(day_of_year, dtype=np.float64)
+    hours = np.asarray(hours, dtype=np.float64)
+
+    # Solar declination (angle of sun relative to equator)
+    declination = 23.45 * np.sin(np.radians((360 / 365) * (day_of_year - 81)))
+    # Hour angle (position of sun in the sky at given time)
+    hour_angle = 15 * (hours - 12)
+
+    lat_rad = np.radians(latitude)
+    dec_rad = np.radians(declination)
+    hour_rad = np.radians(hour_angle)
+
+    sin_altitude = np.sin(lat_rad) * np.sin(dec_rad) + np.cos(lat_rad) * np.cos(dec_rad) * np.cos(hour_rad)
+    altitude = np.degrees(np.arcsin(np.clip(sin_altitude, -1.0, 1.0)))
+    azimuth = np.degrees(np.arctan2(
+        np.sin(hour_rad),
+        np.cos(hour_rad) * np.sin(lat_rad) - np.tan(dec_rad) * np.cos(lat_rad)
+    ))
+    azimuth = (azimuth + 360) % 360
+
+    intensity = np.maximum(0, np.sin(np.radians(altitude))) * (1 - cloud_cover * 0.7)
+
+    return {
+        'declination': declination,
+        'hourAngle': hour_angle,
+        'altitude': altitude,
+        'azimuth': azimuth,
+        'intensity': intensity,
+        'skyLightIntensity': 0.3 * intensity,
+        # 2000K at horizon, 6500K at zenith
+        'colorTemperature': 2000 + (altitude / 90) * 4500
+    }
+
+
+def compass_bearing(azimuth: np.ndarray) -> np.ndarray:
+    """Clockwise bearing from north (0 = N, 90 = E) for a sun_path azimuth
+
+    sun_path measures azimuth from south, positive towards west, so a
+    morning sun in the east is near 270 there and near 90 here.
+    """
+    return (np.asarray(azimuth, dtype=np.float64) + 180) % 360
+
+
+def time_range(start: datetime, end: datetime, step_minutes: float) -> np.ndarray:
+    """Timestamps from start (inclusive) to end (exclusive), as datetime64[s]"""
+    step = np.timedelta64(int(round(step_minutes * 60)), 's')
+    if step <= np.timedelta64(0, 's'):
+        raise ValueError('stepMinutes must be positive')
+    return np.arange(np.datetime64(start.replace(tzinfo=None), 's'), np.datetime64(end.replace(tzinfo=None), 's'), step)
+
+
+def day_and_hour(timestamps: np.ndarray):
+    """Day of year (1-based) and fractional clock hour for datetime64 timestamps"""
+    days = timestamps.astype('datetime64[D]')
+    day_of_year = (days - timestamps.astype('datetime64[Y]').astype('datetime64[D]')).astype(np.int64) + 1
+    hours = (timestamps - days) / np.timedelta64(1, 'h')
+    return day_of_year, hours
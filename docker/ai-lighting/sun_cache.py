@@ -0,0 +1,108 @@
+"""
+Natural lighting result cache
+Quantised request keys over per location-day sun position tables
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from solar import sun_path
+
+
+class NaturalLightCache:
+    """LRU cache of serialised natural lighting responses keyed by quantised inputs
+
+    Latitude, time of day and cloud cover are rounded to latlon_step degrees,
+    time_step_minutes and cloud_step, so nearby requests from the same site
+    share an entry. Misses are filled from a sun position table for the whole
+    (latitude, day of year), which is itself kept in a smaller LRU. The
+    sun model does not depend on longitude or building orientation, so they
+    are not part of the key.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_tables: int = 64, latlon_step: float = 0.01,
+                 time_step_minutes: float = 5, cloud_step: float = 0.05):
+        self.max_entries = max_entries
+        self.max_tables = max_tables
+        self.latlon_step = latlon_step
+        self.time_step = time_step_minutes / 60
+        self.cloud_step = cloud_step
+        self.slots_per_day = int(round(24 / self.time_step))
+
+        self._entries: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._tables: 'OrderedDict[tuple, Dict[str, np.ndarray]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tables_built = 0
+
+    def key(self, latitude: float, day_of_year: int, time: float, cloud_cover: float) -> Optional[Tuple]:
+        """(latitude, day, time slot, cloud) after quantisation; None for times outside the day"""
+        if not 0 <= time <= 24:
+            return None
+        if self.latlon_step:
+            latitude = round(round(latitude / self.latlon_step) * self.latlon_step, 6)
+        slot = int(round(time / self.time_step))
+        cloud = round(round(cloud_cover / self.cloud_step) * self.cloud_step, 6) if self.cloud_step else cloud_cover
+        return latitude, day_of_year, slot, cloud
+
+    def slot_time(self, slot: int) -> float:
+        return slot * self.time_step
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Tuple, body: bytes):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def day_table(self, latitude: float, day_of_year: int) -> Dict[str, np.ndarray]:
+        """Cloud-free sun path for every time slot of the day, slot 0 to slots_per_day inclusive"""
+        table_key = (latitude, day_of_year)
+        with self._lock:
+            table = self._tables.get(table_key)
+            if table is not None:
+                self._tables.move_to_end(table_key)
+                return table
+
+        slots = np.arange(self.slots_per_day + 1)
+        table = sun_path(latitude, np.full(len(slots), day_of_year), slots * self.time_step)
+
+        with self._lock:
+            self._tables[table_key] = table
+            self.tables_built += 1
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+        return table
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tables.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'tables': len(self._tables),
+                'maxTables': self.max_tables,
+                'tablesBuilt': self.tables_built,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,56 @@
+"""
+Sun orientation tests for climate-based daylight
+Run with: python -m pytest test_climate_daylight.py
+"""
+
+import numpy as np
+
+from climate_daylight import climate_daylight, hourly_sun
+
+# Days before each month in a non-leap year
+MONTH_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def midday_weather(latitude: float = 40.0) -> dict:
+    """A year of hour-ending-13:00 records with clear-sky direct light, on the time zone meridian"""
+    month = np.repeat(np.arange(1, 13), MONTH_DAYS).astype(np.int8)
+    day = np.concatenate([np.arange(1, days + 1) for days in MONTH_DAYS]).astype(np.int8)
+    count = len(month)
+    return {
+        'city': 'Test', 'country': '', 'latitude': latitude, 'longitude': -75.0, 'timezone': -5.0,
+        'month': month, 'day': day, 'hour': np.full(count, 13, dtype=np.int8),
+        'directNormal': np.full(count, 80000, dtype=np.float32),
+        'diffuseHorizontal': np.full(count, 10000, dtype=np.float32)
+    }
+
+
+def wall(z: float) -> np.ndarray:
+    """Tall wall across the x axis at scene z (north is -z, south is +z)"""
+    return np.array([
+        [[-50.0, 0.0, z], [50.0, 0.0, z], [-50.0, 100.0, z]],
+        [[50.0, 0.0, z], [50.0, 100.0, z], [-50.0, 100.0, z]]
+    ])
+
+
+def test_noon_sun_is_south_at_northern_latitudes():
+    sun = hourly_sun(midday_weather(), 0.0)
+    # Scene south is +z, and the sun is close to the meridian at 12:30 solar time
+    assert (sun['direction'][:, 2] > 0).all()
+    assert (np.abs(sun['direction'][:, 0]) < sun['direction'][:, 2]).all()
+
+
+def test_south_facing_aperture_gets_direct_sun_at_noon():
+    points = np.zeros((1, 3))
+    # Open to the south, a wall behind on the north side
+    open_south = climate_daylight(midday_weather(), points, wall(-1.0), occupied_hours=(12, 13))
+    # Open to the north, the wall on the south side
+    open_north = climate_daylight(midday_weather(), points, wall(1.0), occupied_hours=(12, 13))
+    assert open_south['directSunHours'][0] == 365
+    assert open_north['directSunHours'][0] == 0
+
+
+def test_orientation_turns_the_building_away_from_the_sun():
+    points = np.zeros((1, 3))
+    # Scene north rotated 180°: the wall at scene -z now stands due south
+    rotated = climate_daylight(midday_weather(), points, wall(-1.0), orientation=180.0, occupied_hours=(12, 13))
+    assert rotated['directSunHours'][0] == 0
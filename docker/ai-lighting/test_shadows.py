@@ -0,0 +1,56 @@
+"""
+Sun direction tests for the shadow model
+Run with: python -m pytest test_shadows.py
+"""
+
+import numpy as np
+
+from shadows import TriangleBVH, sun_exposure, sun_vectors
+from solar import compass_bearing, sun_path
+
+# 40°N on the June solstice
+LATITUDE = 40.0
+SOLSTICE = 172
+
+
+def solstice_vector(hour: float, north_angle: float = 0.0) -> np.ndarray:
+    path = sun_path(LATITUDE, [SOLSTICE], [hour])
+    return sun_vectors(path['altitude'], compass_bearing(path['azimuth']), north_angle)[0]
+
+
+def test_morning_sun_is_in_the_east():
+    x, y, _ = solstice_vector(9.0)
+    assert y > 0
+    assert x > 0.5
+
+
+def test_afternoon_sun_is_in_the_west():
+    x, _, _ = solstice_vector(15.0)
+    assert x < -0.5
+
+
+def test_noon_sun_is_due_south():
+    # Scene south is +z
+    x, _, z = solstice_vector(12.0)
+    assert abs(x) < 1e-9
+    assert z > 0
+
+
+def test_building_orientation_rotates_the_sun_into_scene_axes():
+    # With the scene's north turned 90° clockwise, true east lies along scene -z
+    x, _, z = solstice_vector(6.0, north_angle=90.0)
+    assert z < 0 and abs(z) > abs(x)
+
+
+def test_west_wall_shades_a_morning_point_only_in_the_afternoon():
+    # Tall wall just west of the origin: the morning sun (east) is unobstructed
+    wall = np.array([
+        [[-1.0, 0.0, -50.0], [-1.0, 50.0, -50.0], [-1.0, 0.0, 50.0]],
+        [[-1.0, 50.0, -50.0], [-1.0, 50.0, 50.0], [-1.0, 0.0, 50.0]]
+    ])
+    bvh = TriangleBVH(wall)
+    points = np.zeros((1, 3))
+    morning = sun_exposure(bvh, points, solstice_vector(9.0)[None, :])
+    afternoon = sun_exposure(bvh, points, solstice_vector(15.0)[None, :])
+    assert morning[0] == 1
+    assert afternoon[0] == 0
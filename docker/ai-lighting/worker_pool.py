@@ -0,0 +1,81 @@
+"""
+Long-lived worker process pools
+Forkserver pools whose workers import only the modules they run, never the Flask app
+"""
+
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import context, forkserver, popen_forkserver, reduction, spawn, util
+from typing import Optional
+
+# Modules holding worker entry points. The forkserver preloads all of them, so
+# the preload does not depend on which pool happens to start first.
+WORKER_MODULES = ['shadows', 'placement_search']
+
+
+class _WorkerPopen(popen_forkserver.Popen):
+    """Forkserver launch that does not re-run the parent's main script in the child
+
+    multiprocessing normally imports the parent's __main__ in every worker
+    (as __mp_main__), which here is server.py and the whole Flask app. The
+    main module entries are dropped from the preparation data; the rest of
+    the launch is the stock forkserver one.
+    """
+
+    def _launch(self, process_obj):
+        prep_data = spawn.get_preparation_data(process_obj._name)
+        prep_data.pop('init_main_from_path', None)
+        prep_data.pop('init_main_from_name', None)
+        buf = io.BytesIO()
+        context.set_spawning_popen(self)
+        try:
+            reduction.dump(prep_data, buf)
+            reduction.dump(process_obj, buf)
+        finally:
+            context.set_spawning_popen(None)
+
+        self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+        _parent_w = os.dup(w)
+        self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+        with open(w, 'wb', closefd=True) as f:
+            f.write(buf.getbuffer())
+        self.pid = forkserver.read_signed(self.sentinel)
+
+
+class _WorkerProcess(context.ForkServerProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        return _WorkerPopen(process_obj)
+
+
+class _WorkerContext(context.ForkServerContext):
+    """Forkserver context whose workers import only WORKER_MODULES"""
+    Process = _WorkerProcess
+
+
+class WorkerPool:
+    """A process pool started on first use and shared by all requests
+
+    Workers come from a forkserver rather than fork, so they never inherit
+    the locks or threads of the serving process. A caller asking for more
+    workers than the pool has replaces it with a larger one; tasks already
+    queued on the old pool still run.
+    """
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def get(self, workers: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None or self._workers < workers:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                worker_context = _WorkerContext()
+                worker_context.set_forkserver_preload(WORKER_MODULES)
+                self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=worker_context)
+                self._workers = workers
+            return self._pool
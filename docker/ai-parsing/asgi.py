@@ -0,0 +1,400 @@
+"""
+ASGI serving mode for ai-parsing
+Async request I/O, decoding in a thread pool and inference on bounded executors
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 8003
+
+Uploads are read on the event loop, so slow clients hold no threads or
+executor slots. Every analysis request must then get a slot on its executor
+before it is decoded; when all workers are busy and the queue is full the
+request is rejected with 429 and Retry-After instead of piling up. /health
+never touches an executor. The upload size limit is enforced on the bytes
+actually received, so chunked uploads without Content-Length are cut off too.
+/yolo/detect-batch and /pdf/detect run on the detection executor as well; a
+PDF holds its slot until the last page has been streamed.
+Endpoints without a native route are served by the Flask app.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import server
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '4'))
+INFERENCE_QUEUE_SIZE = int(os.environ.get('INFERENCE_QUEUE_SIZE', '8'))
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', '4'))
+
+
+class BoundedExecutor:
+    """Thread pool that admits at most workers + queue_size tasks at a time"""
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        """Reserve a slot without waiting; False when the executor is saturated"""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+
+    async def run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'capacity': self.capacity,
+                'inFlight': self._in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected
+            }
+
+
+detection_pool = BoundedExecutor('detect', INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+ocr_pool = BoundedExecutor('scale', server.OCR_WORKERS, INFERENCE_QUEUE_SIZE)
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='decode')
+
+
+async def in_decode_pool(fn: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(decode_executor, fn, *args)
+
+
+def error(message: str, status: int, headers: Dict[str, str] = None) -> JSONResponse:
+    return JSONResponse({'error': message}, status_code=status, headers=headers)
+
+
+def busy() -> JSONResponse:
+    return error('Server busy, retry later', 429, {'Retry-After': '1'})
+
+
+class UploadTooLarge(Exception):
+    """The request body exceeded MAX_CONTENT_LENGTH"""
+
+
+def limited(request: Request) -> Optional[Request]:
+    """The request with its body capped at MAX_CONTENT_LENGTH, or None when Content-Length is already over
+
+    Received bytes are counted as they arrive, so the cap also holds for
+    chunked uploads that send no Content-Length; reading past it raises
+    UploadTooLarge.
+    """
+    limit = server.app.config['MAX_CONTENT_LENGTH']
+    if int(request.headers.get('content-length') or 0) > limit:
+        return None
+
+    receive = request.receive
+    received = 0
+
+    async def counted_receive():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise UploadTooLarge()
+        return message
+
+    return Request(request.scope, counted_receive)
+
+
+async def read_payloads(request: Request, field: str):
+    """(params, encoded bytes per supplied image) from a raw image/*, multipart or base64 JSON body
+
+    Like server.request_payloads, base64 entries that fail to decode are None.
+    """
+    params = {key: server.parse_param(value) for key, value in request.query_params.items()}
+    content_type = request.headers.get('content-type', '')
+
+    if content_type.startswith('image/'):
+        return params, [await request.body()]
+
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        payloads = []
+        for key, value in form.multi_items():
+            if hasattr(value, 'read'):
+                if key in (field, field.rstrip('s')):
+                    payloads.append(await value.read())
+            else:
+                params[key] = server.parse_param(value)
+        return params, payloads
+
+    body = await request.body()
+    if not body:
+        return params, []
+    params.update(await in_decode_pool(json.loads, body))
+    value = params.get(field)
+    if not value:
+        return params, []
+    values = value if isinstance(value, list) else [value]
+    return params, [await in_decode_pool(server.decode_base64, image_data) for image_data in values]
+
+
+async def read_request(request: Request):
+    """(params, encoded image bytes or None) from a raw image/*, multipart or base64 JSON body"""
+    params, payloads = await read_payloads(request, 'image')
+    return params, payloads[0] if payloads else None
+
+
+async def analysis(request: Request, endpoint: str, analyze: Callable, pool: BoundedExecutor) -> Response:
+    """Shared pipeline: read, admit, cache lookup, decode, infer, cache store"""
+    request = limited(request)
+    if request is None:
+        return error('Upload too large', 413)
+
+    # The upload is read on the event loop; a slow client holds no slot while it sends
+    try:
+        params, payload = await read_request(request)
+    except UploadTooLarge:
+        return error('Upload too large', 413)
+    except Exception as e:
+        logger.error(f"{endpoint} request error: {e}")
+        return error(str(e), 400)
+    if payload is None:
+        return error('No image provided' if 'image' not in params else 'Invalid image data', 400)
+
+    # Shed load before decoding and inference
+    if not pool.try_acquire():
+        return busy()
+
+    try:
+        key = key_params = bucket = image_hash = None
+        if server.result_cache is not None:
+            key, key_params, body = server.cache_lookup(endpoint, params, payload)
+            if body is not None:
+                return Response(body, media_type='application/json', headers={'X-Cache': 'HIT'})
+
+        image = await in_decode_pool(server.decode_image_bytes, payload)
+        if image is None:
+            return error('Invalid image data', 400)
+
+        if server.result_cache is not None:
+            bucket, image_hash, body = await in_decode_pool(
+                server.cache_lookup_similar, endpoint, key_params, key, image
+            )
+            if body is not None:
+                return Response(body, media_type='application/json', headers={'X-Cache': 'HIT'})
+
+        result = await pool.run(analyze, image, params)
+        body = await in_decode_pool(server.app.json.dumps, result)
+        body = body.encode()
+        if server.result_cache is not None:
+            server.result_cache.put(key, body, bucket, image_hash)
+        return Response(body, media_type='application/json', headers={'X-Cache': 'MISS'})
+
+    except Exception as e:
+        logger.error(f"{endpoint} error: {e}")
+        return error(str(e), 500)
+    finally:
+        pool.release()
+
+
+def decode_images(payloads: List[Optional[bytes]]) -> list:
+    return [server.decode_image_bytes(payload) if payload is not None else None for payload in payloads]
+
+
+async def detect_batch(request: Request) -> Response:
+    """/yolo/detect-batch: all images of the request as one batch on the detection executor"""
+    request = limited(request)
+    if request is None:
+        return error('Upload too large', 413)
+
+    try:
+        params, payloads = await read_payloads(request, 'images')
+    except UploadTooLarge:
+        return error('Upload too large', 413)
+    except Exception as e:
+        logger.error(f"yolo/detect-batch request error: {e}")
+        return error(str(e), 400)
+    if not payloads:
+        return error('No images provided', 400)
+
+    if not detection_pool.try_acquire():
+        return busy()
+
+    try:
+        images = await in_decode_pool(decode_images, payloads)
+        result = await detection_pool.run(server.batch_detection, images, params)
+        body = await in_decode_pool(server.app.json.dumps, result)
+        return Response(body, media_type='application/json')
+    except Exception as e:
+        logger.error(f"Batch detection error: {e}")
+        return error(str(e), 500)
+    finally:
+        detection_pool.release()
+
+
+def write_temp_pdf(data: Optional[bytes] = None, source=None) -> str:
+    """Temp file holding a PDF from bytes or a file object; the path"""
+    handle, path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(handle, 'wb') as out:
+        if source is not None:
+            shutil.copyfileobj(source, out, 1024 * 1024)
+        elif data is not None:
+            out.write(data)
+    return path
+
+
+async def read_pdf(request: Request):
+    """(params, temp file path) for a raw application/pdf, multipart 'file'/'pdf' or base64 JSON body"""
+    params = {key: server.parse_param(value) for key, value in request.query_params.items()}
+    content_type = request.headers.get('content-type', '')
+
+    if content_type.startswith('application/pdf'):
+        # Spooled chunk by chunk as it arrives, never held whole in memory;
+        # the disk writes run on the decode threads, off the event loop
+        handle, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(handle, 'wb') as out:
+                async for chunk in request.stream():
+                    await in_decode_pool(out.write, chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return params, path
+
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        upload = None
+        for key, value in form.multi_items():
+            if hasattr(value, 'read'):
+                if upload is None and key in ('file', 'pdf'):
+                    upload = value
+            else:
+                params[key] = server.parse_param(value)
+        source = upload.file if upload is not None else None
+        return params, await in_decode_pool(write_temp_pdf, None, source)
+
+    body = await request.body()
+    if body:
+        params.update(await in_decode_pool(json.loads, body))
+    data = await in_decode_pool(server.decode_base64, params['pdf']) if params.get('pdf') else None
+    return params, await in_decode_pool(write_temp_pdf, data)
+
+
+async def pdf_detect(request: Request) -> Response:
+    """/pdf/detect: NDJSON per page, each page group detected on the detection executor"""
+    request = limited(request)
+    if request is None:
+        return error('Upload too large', 413)
+
+    try:
+        params, path = await read_pdf(request)
+    except UploadTooLarge:
+        return error('Upload too large', 413)
+    except Exception as e:
+        logger.error(f"pdf/detect request error: {e}")
+        return error(str(e), 400)
+    if os.path.getsize(path) == 0:
+        os.remove(path)
+        return error('No PDF provided', 400)
+
+    if not detection_pool.try_acquire():
+        os.remove(path)
+        return busy()
+
+    try:
+        job = await in_decode_pool(server.pdf_job, path, params)
+    except Exception as e:
+        os.remove(path)
+        detection_pool.release()
+        return error(str(e), 400 if isinstance(e, ValueError) else 500)
+
+    lines = server.pdf_detection_lines(path, params, job)
+
+    async def stream():
+        # Each step rasterises and detects one ready group of pages on the executor
+        step = None
+        try:
+            while True:
+                step = asyncio.ensure_future(detection_pool.run(next, lines, None))
+                line = await asyncio.shield(step)
+                if line is None:
+                    break
+                yield line
+        finally:
+            # A client that disconnects mid-step leaves it running; the slot is held until it ends
+            if step is not None and not step.done():
+                await asyncio.wait([step])
+            await detection_pool.run(lines.close)
+            if os.path.exists(path):
+                os.remove(path)
+            detection_pool.release()
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+
+async def health(request: Request) -> JSONResponse:
+    """Health check answered on the event loop, independent of the executors"""
+    status = server.health_status()
+    status['executors'] = {'detection': detection_pool.stats(), 'scale': ocr_pool.stats()}
+    return JSONResponse(status)
+
+
+def analysis_route(path: str, analyze: Callable, pool: BoundedExecutor) -> Route:
+    endpoint = path.strip('/')
+
+    async def handle(request: Request) -> Response:
+        return await analysis(request, endpoint, analyze, pool)
+
+    return Route(path, handle, methods=['POST'])
+
+
+@asynccontextmanager
+async def lifespan(app):
+    logger.info(f"Pre-loading models: {', '.join(server.PRELOAD_MODELS)}")
+    await asyncio.get_running_loop().run_in_executor(None, server.models.preload, server.PRELOAD_MODELS)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health, methods=['GET']),
+        analysis_route('/yolo/detect', server.detect_objects, detection_pool),
+        Route('/yolo/detect-batch', detect_batch, methods=['POST']),
+        Route('/pdf/detect', pdf_detect, methods=['POST']),
+        analysis_route('/analyze-floor-plan', server.floor_plan_analysis, detection_pool),
+        analysis_route('/analyze-plan', server.plan_analysis, detection_pool),
+        analysis_route('/detect-scale', server.scale_info, ocr_pool),
+        analysis_route('/wall-geometry', server.plan_geometry, ocr_pool),
+        Mount('/', WSGIMiddleware(server.app))
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
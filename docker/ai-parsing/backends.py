@@ -0,0 +1,85 @@
+"""
+Inference backends for YOLO models
+PyTorch weights or exported ONNX Runtime graphs, optionally INT8-quantised
+"""
+
+import logging
+import os
+from typing import Dict
+
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+def parse_backend_map(spec: str) -> Dict[str, str]:
+    """Parse 'yolov8n=onnx,yolov8s=onnx-int8' into a model -> backend mapping"""
+    mapping = {}
+    for entry in spec.split(','):
+        if '=' not in entry:
+            continue
+        model_type, backend = (part.strip() for part in entry.split('=', 1))
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend {backend} for {model_type}, expected one of {", ".join(BACKENDS)}')
+        mapping[model_type] = backend
+    return mapping
+
+
+def weights_path(model_type: str, models_dir: str) -> str:
+    """PyTorch weights from the models directory, or the name for ultralytics to download"""
+    path = os.path.join(models_dir, f'{model_type}.pt')
+    return path if os.path.exists(path) else f'{model_type}.pt'
+
+
+def export_onnx(model_type: str, models_dir: str) -> str:
+    """Export PyTorch weights to ONNX once and keep the graph next to them
+
+    The graph is exported with dynamic axes so the batch size and input
+    resolution stay as flexible as with the PyTorch model.
+    """
+    onnx_path = os.path.join(models_dir, f'{model_type}.onnx')
+    if os.path.exists(onnx_path):
+        return onnx_path
+
+    logger.info(f"Exporting {model_type} to ONNX")
+    exported = YOLO(weights_path(model_type, models_dir)).export(format='onnx', dynamic=True)
+    if os.path.abspath(exported) != os.path.abspath(onnx_path):
+        os.makedirs(models_dir, exist_ok=True)
+        os.replace(exported, onnx_path)
+    return onnx_path
+
+
+def quantize_onnx(model_type: str, models_dir: str) -> str:
+    """Dynamically quantise the exported graph's weights to INT8"""
+    int8_path = os.path.join(models_dir, f'{model_type}-int8.onnx')
+    if os.path.exists(int8_path):
+        return int8_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info(f"Quantising {model_type} to INT8")
+    quantize_dynamic(export_onnx(model_type, models_dir), int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def model_task(model_type: str) -> str:
+    """Exported graphs carry no task metadata ultralytics can rely on, so pass it explicitly"""
+    return 'segment' if model_type.endswith('-seg') else 'detect'
+
+
+def load_model(model_type: str, backend: str = 'torch', models_dir: str = '/app/models') -> YOLO:
+    """Load a model for the given backend
+
+    Every backend returns an ultralytics YOLO object, so callers get the same
+    Results (boxes, masks, names) regardless of the runtime underneath.
+    ONNX Runtime sessions are created with all graph optimisations enabled.
+    """
+    if backend == 'torch':
+        return YOLO(weights_path(model_type, models_dir))
+    if backend == 'onnx':
+        return YOLO(export_onnx(model_type, models_dir), task=model_task(model_type))
+    if backend == 'onnx-int8':
+        return YOLO(quantize_onnx(model_type, models_dir), task=model_task(model_type))
+    raise ValueError(f'Unknown backend {backend}, expected one of {", ".join(BACKENDS)}')
@@ -0,0 +1,96 @@
+"""
+Dynamic micro-batching for YOLO inference
+Coalesce concurrent single-image requests into one model batch
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collect requests for a short window and run them through the model together
+
+    Requests are grouped by key (model and thresholds), because a batch can
+    only share one set of inference arguments. The first request in an empty
+    queue starts the window; the batch is dispatched when the window closes
+    or max_batch_size requests have arrived, whichever comes first.
+    """
+
+    def __init__(self, run_batch: Callable[[Hashable, List[Any]], List[Any]],
+                 window_ms: float = 10, max_batch_size: int = 16):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self._queue: 'queue.Queue[Tuple[Hashable, Any, Future]]' = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, key: Hashable, item: Any) -> Future:
+        """Queue one item and return a future for its result"""
+        future = Future()
+        self._queue.put((key, item, future))
+        return future
+
+    def __call__(self, key: Hashable, item: Any, timeout: float = None) -> Any:
+        """Queue one item and block until its result is ready"""
+        return self.submit(key, item).result(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'batches': self._batches,
+                'items': self._items,
+                'avgBatchSize': self._items / self._batches if self._batches else 0.0,
+                'windowMs': self.window * 1000,
+                'maxBatchSize': self.max_batch_size,
+                'queued': self._queue.qsize()
+            }
+
+    def _collect(self) -> List[Tuple[Hashable, Any, Future]]:
+        """Block for the first request, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            groups: Dict[Hashable, List[Tuple[Any, Future]]] = {}
+            for key, item, future in batch:
+                groups.setdefault(key, []).append((item, future))
+
+            for key, entries in groups.items():
+                try:
+                    results = self.run_batch(key, [item for item, _ in entries])
+                    for (_, future), result in zip(entries, results):
+                        future.set_result(result)
+                except Exception as e:
+                    logger.error(f"Batched inference error: {e}")
+                    for _, future in entries:
+                        future.set_exception(e)
+
+                with self._stats_lock:
+                    self._batches += 1
+                    self._items += len(entries)
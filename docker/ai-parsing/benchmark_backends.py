@@ -0,0 +1,172 @@
+"""
+Inference backend benchmark
+Compare latency, throughput and detections of PyTorch against ONNX Runtime backends
+
+Usage:
+    python benchmark_backends.py plans/ --model yolov8n
+    python benchmark_backends.py --synthetic 32 --backends torch onnx onnx-int8
+
+The corpus is every image in the given directories, or a fixed set of
+generated floor plans (same seed, same images) when --synthetic is used.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, load_model
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+
+def synthetic_plan(rng: np.random.Generator, size: int = 1280) -> np.ndarray:
+    """Draw a simple floor plan: outer walls, partition walls, door arcs and windows"""
+    image = np.full((size, size, 3), 255, dtype=np.uint8)
+    margin = size // 10
+    cv2.rectangle(image, (margin, margin), (size - margin, size - margin), (0, 0, 0), 8)
+
+    for _ in range(rng.integers(3, 7)):
+        if rng.random() < 0.5:
+            x = int(rng.integers(margin * 2, size - margin * 2))
+            cv2.line(image, (x, margin), (x, size - margin), (0, 0, 0), 4)
+        else:
+            y = int(rng.integers(margin * 2, size - margin * 2))
+            cv2.line(image, (margin, y), (size - margin, y), (0, 0, 0), 4)
+
+    for _ in range(rng.integers(4, 10)):
+        center = (int(rng.integers(margin, size - margin)), int(rng.integers(margin, size - margin)))
+        radius = int(rng.integers(30, 60))
+        cv2.ellipse(image, center, (radius, radius), 0, 0, 90, (0, 0, 0), 2)
+        cv2.line(image, center, (center[0] + radius, center[1]), (0, 0, 0), 2)
+
+    for _ in range(rng.integers(2, 6)):
+        x = int(rng.integers(margin * 2, size - margin * 3))
+        cv2.rectangle(image, (x, margin - 6), (x + 80, margin + 6), (0, 0, 0), 2)
+
+    return image
+
+
+def load_corpus(paths, synthetic: int, seed: int):
+    images = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*'))) if os.path.isdir(path) else [path]
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                image = cv2.imread(file)
+                if image is not None:
+                    images.append(image)
+
+    rng = np.random.default_rng(seed)
+    images.extend(synthetic_plan(rng) for _ in range(synthetic))
+    return images
+
+
+def detections(result):
+    boxes = result.boxes
+    return boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy().astype(np.int64)
+
+
+def box_agreement(reference, candidate, iou_threshold: float = 0.5) -> float:
+    """Fraction of reference boxes matched by a candidate box of the same class"""
+    ref_xyxy, _, ref_cls = reference
+    cand_xyxy, _, cand_cls = candidate
+    if len(ref_xyxy) == 0:
+        return 1.0 if len(cand_xyxy) == 0 else 0.0
+    if len(cand_xyxy) == 0:
+        return 0.0
+
+    x1 = np.maximum(ref_xyxy[:, None, 0], cand_xyxy[None, :, 0])
+    y1 = np.maximum(ref_xyxy[:, None, 1], cand_xyxy[None, :, 1])
+    x2 = np.minimum(ref_xyxy[:, None, 2], cand_xyxy[None, :, 2])
+    y2 = np.minimum(ref_xyxy[:, None, 3], cand_xyxy[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    ref_area = (ref_xyxy[:, 2] - ref_xyxy[:, 0]) * (ref_xyxy[:, 3] - ref_xyxy[:, 1])
+    cand_area = (cand_xyxy[:, 2] - cand_xyxy[:, 0]) * (cand_xyxy[:, 3] - cand_xyxy[:, 1])
+    iou = intersection / np.maximum(ref_area[:, None] + cand_area[None, :] - intersection, 1e-9)
+
+    matched = (iou >= iou_threshold) & (ref_cls[:, None] == cand_cls[None, :])
+    return float(matched.any(axis=1).mean())
+
+
+def benchmark(model_type: str, backend: str, images, models_dir: str, batch_size: int, warmup: int) -> dict:
+    started = time.perf_counter()
+    model = load_model(model_type, backend, models_dir)
+    load_seconds = time.perf_counter() - started
+
+    for image in images[:warmup]:
+        model(image, verbose=False)
+
+    latencies = []
+    outputs = []
+    for image in images:
+        started = time.perf_counter()
+        result = model(image, verbose=False)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        outputs.append(detections(result))
+
+    started = time.perf_counter()
+    for start in range(0, len(images), batch_size):
+        model(images[start:start + batch_size], verbose=False)
+    batch_seconds = time.perf_counter() - started
+
+    latencies = np.asarray(latencies)
+    return {
+        'backend': backend,
+        'loadSeconds': load_seconds,
+        'latencyMs': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95))
+        },
+        'throughput': len(images) / batch_seconds if batch_seconds > 0 else 0.0,
+        'detections': int(sum(len(o[1]) for o in outputs)),
+        '_outputs': outputs
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='plan images or directories of plan images')
+    parser.add_argument('--synthetic', type=int, default=0, help='number of generated plans to add to the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default='yolov8n')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_corpus(args.paths, args.synthetic, args.seed)
+    if not images:
+        parser.error('corpus is empty: pass plan images or --synthetic N')
+
+    results = [
+        benchmark(args.model, backend, images, args.models_dir, args.batch_size, args.warmup)
+        for backend in args.backends
+    ]
+
+    reference = results[0]
+    for row in results:
+        row['agreement'] = float(np.mean([
+            box_agreement(ref, out) for ref, out in zip(reference['_outputs'], row['_outputs'])
+        ]))
+        print(
+            f"{row['backend']:10s} p50 {row['latencyMs']['p50']:8.1f} ms  p95 {row['latencyMs']['p95']:8.1f} ms  "
+            f"{row['throughput']:7.1f} img/s  {row['detections']:6d} boxes  "
+            f"agreement with {reference['backend']} {row['agreement']:.3f}",
+            file=sys.stderr
+        )
+    for row in results:
+        del row['_outputs']
+
+    print(json.dumps({'model': args.model, 'images': len(images), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
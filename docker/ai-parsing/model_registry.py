@@ -0,0 +1,146 @@
+"""
+Model registry for ai-parsing
+Thread-safe loading, warm preload and LRU eviction under a memory budget
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_model_bytes(model: Any) -> int:
+    """Approximate resident size of a loaded model from its tensors"""
+    try:
+        module = getattr(model, 'model', model)
+        # Exported models keep the path to the graph, whose size is a fair proxy
+        if isinstance(module, str):
+            return os.path.getsize(module) if os.path.exists(module) else 0
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+class ModelRegistry:
+    """Loads each model once and keeps the most recently used ones resident
+
+    A per-model lock serialises concurrent first requests, so a cold start
+    under a threaded server loads the weights once while the other requests
+    wait for it. Models that would push the total estimated size over the
+    memory budget evict the least recently used ones; a model that is still
+    referenced by an in-flight request stays valid until that request ends.
+
+    Model objects are not safe to call from several threads at once (YOLO
+    predictors keep per-call state), so callers hold inference_lock(name)
+    around every forward pass.
+    """
+
+    def __init__(self, loader: Callable[[str], Any], memory_budget_mb: float = 2048,
+                 size_estimator: Callable[[Any], int] = estimate_model_bytes):
+        self.loader = loader
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.size_estimator = size_estimator
+
+        self._models: 'OrderedDict[str, Any]' = OrderedDict()
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._inference_locks: Dict[str, threading.Lock] = {}
+        self.evictions = 0
+
+    def get(self, name: str) -> Any:
+        """Return a loaded model, loading it at most once across threads"""
+        with self._lock:
+            if name in self._models:
+                return self._touch(name)
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                if name in self._models:
+                    return self._touch(name)
+
+            started = time.perf_counter()
+            model = self.loader(name)
+            load_seconds = time.perf_counter() - started
+            size = self.size_estimator(model)
+
+            with self._lock:
+                self._models[name] = model
+                self._info[name] = {
+                    'loadSeconds': load_seconds,
+                    'bytes': size,
+                    'loadedAt': time.time(),
+                    'lastUsed': time.time(),
+                    'hits': 0
+                }
+                self._evict(keep=name)
+
+            logger.info(f"Loaded model {name} in {load_seconds:.2f}s ({size / 1e6:.1f} MB)")
+            return model
+
+    def inference_lock(self, name: str) -> threading.Lock:
+        """Lock serialising forward passes through one model"""
+        with self._lock:
+            return self._inference_locks.setdefault(name, threading.Lock())
+
+    def _touch(self, name: str) -> Any:
+        """Mark a model as most recently used (caller holds the registry lock)"""
+        self._models.move_to_end(name)
+        self._info[name]['lastUsed'] = time.time()
+        self._info[name]['hits'] += 1
+        return self._models[name]
+
+    def _evict(self, keep: str):
+        """Drop least recently used models until under budget (caller holds the lock)"""
+        evicted = False
+        while self.resident_bytes() > self.memory_budget and len(self._models) > 1:
+            name = next(iter(self._models))
+            if name == keep:
+                break
+            del self._models[name]
+            info = self._info.pop(name)
+            self.evictions += 1
+            evicted = True
+            logger.info(f"Evicted model {name} ({info['bytes'] / 1e6:.1f} MB) to stay within budget")
+        if evicted:
+            gc.collect()
+
+    def resident_bytes(self) -> int:
+        return sum(self._info[name]['bytes'] for name in self._models)
+
+    def preload(self, names: Iterable[str]):
+        """Load a configured set of models, logging failures instead of raising"""
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Failed to preload model {name}: {e}")
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._models.keys())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'models': {
+                    name: {
+                        'loadSeconds': round(info['loadSeconds'], 3),
+                        'memoryMb': round(info['bytes'] / (1024 * 1024), 1),
+                        'hits': info['hits'],
+                        'idleSeconds': round(time.time() - info['lastUsed'], 1)
+                    }
+                    for name, info in self._info.items()
+                },
+                'residentMb': round(self.resident_bytes() / (1024 * 1024), 1),
+                'budgetMb': round(self.memory_budget / (1024 * 1024), 1),
+                'evictions': self.evictions
+            }
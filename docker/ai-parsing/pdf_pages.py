@@ -0,0 +1,206 @@
+"""
+PDF plan set ingestion
+Rasterise pages in a process pool and hand them out as they finish
+"""
+
+import io
+import logging
+import math
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import context, forkserver, popen_forkserver, reduction, spawn, util
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (page index, BGR image or None, error or None)
+Page = Tuple[int, Optional[np.ndarray], Optional[str]]
+
+# Document opened by this worker process, reused across pages of the same file
+_open_document = {'path': None, 'doc': None}
+
+
+def _document(path: str):
+    import fitz
+
+    if _open_document['path'] != path:
+        if _open_document['doc'] is not None:
+            _open_document['doc'].close()
+        _open_document['doc'] = fitz.open(path)
+        _open_document['path'] = path
+    return _open_document['doc']
+
+
+def page_count(path: str) -> int:
+    import fitz
+
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def page_bytes(path: str, indices: List[int], dpi: int) -> List[int]:
+    """Size of each page's RGB pixmap at dpi, read from the page boxes without rendering"""
+    import fitz
+
+    zoom = dpi / 72
+    with fitz.open(path) as doc:
+        sizes = []
+        for index in indices:
+            rect = doc.load_page(index).rect
+            sizes.append(math.ceil(rect.width * zoom) * math.ceil(rect.height * zoom) * 3)
+        return sizes
+
+
+def parse_pages(spec, count: int) -> List[int]:
+    """Zero-based page indices from [1, 3], '1-5,8' or None (all pages); input is one-based"""
+    if spec is None or spec == '':
+        return list(range(count))
+    if isinstance(spec, int):
+        spec = [spec]
+    if isinstance(spec, str):
+        numbers = []
+        for part in spec.split(','):
+            if '-' in part:
+                first, last = part.split('-', 1)
+                numbers.extend(range(int(first), int(last) + 1))
+            else:
+                numbers.append(int(part))
+        spec = numbers
+    return [n - 1 for n in spec if 1 <= n <= count]
+
+
+def rasterize_page(path: str, index: int, dpi: int) -> Tuple[int, bytes, Tuple[int, int, int]]:
+    """Render one page to RGB pixels in a worker process: (index, samples, shape)"""
+    page = _document(path).load_page(index)
+    pixmap = page.get_pixmap(dpi=dpi, alpha=False)
+    return index, pixmap.samples, (pixmap.height, pixmap.width, pixmap.n)
+
+
+def to_bgr(samples: bytes, shape: Tuple[int, int, int]) -> np.ndarray:
+    """Raw pixmap samples as a BGR image, the layout cv2.imdecode produces"""
+    pixels = np.frombuffer(samples, dtype=np.uint8).reshape(shape)
+    if shape[2] == 1:
+        return cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+
+
+class _WorkerPopen(popen_forkserver.Popen):
+    """Forkserver launch that does not re-run the parent's main script in the child
+
+    multiprocessing normally imports the parent's __main__ in every worker
+    (as __mp_main__). Here that is server.py, whose module-level setup loads
+    ultralytics and starts the micro-batcher thread. Page workers only need
+    this module, so the main module entries are dropped from the preparation
+    data; the rest of the launch is the stock forkserver one.
+    """
+
+    def _launch(self, process_obj):
+        prep_data = spawn.get_preparation_data(process_obj._name)
+        prep_data.pop('init_main_from_path', None)
+        prep_data.pop('init_main_from_name', None)
+        buf = io.BytesIO()
+        context.set_spawning_popen(self)
+        try:
+            reduction.dump(prep_data, buf)
+            reduction.dump(process_obj, buf)
+        finally:
+            context.set_spawning_popen(None)
+
+        self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+        _parent_w = os.dup(w)
+        self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+        with open(w, 'wb', closefd=True) as f:
+            f.write(buf.getbuffer())
+        self.pid = forkserver.read_signed(self.sentinel)
+
+
+class _WorkerProcess(context.ForkServerProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        return _WorkerPopen(process_obj)
+
+
+class _WorkerContext(context.ForkServerContext):
+    """Forkserver context whose workers import only pdf_pages"""
+    Process = _WorkerProcess
+
+
+class PageRasterizer:
+    """Process pool rendering PDF pages, yielding each page as soon as it is ready
+
+    At most max_pending pages, and at most max_pending_bytes of pixmaps, are
+    rendered ahead of the consumer, so memory stays bounded for large sets
+    and large sheets while every core stays busy. A single page larger than
+    the byte budget is still rendered, on its own.
+    """
+
+    def __init__(self, workers: int, max_pending: Optional[int] = None, max_pending_bytes: int = 512 * 1024 * 1024):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.max_pending_bytes = max_pending_bytes
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        # The server is multithreaded by the time the first PDF arrives, so workers
+        # come from a forkserver rather than forking this process. The forkserver
+        # preloads only this module, never server.py and its models and threads.
+        with self._pool_lock:
+            if self._pool is None:
+                worker_context = _WorkerContext()
+                worker_context.set_forkserver_preload(['pdf_pages'])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=worker_context)
+            return self._pool
+
+    def iter_pages(self, path: str, indices: List[int], dpi: int) -> Iterator[List[Page]]:
+        """Yield the pages finished since the last call, in completion order
+
+        Each item is a list of (index, BGR image, None) or (index, None, error),
+        so the consumer can batch whatever is ready instead of waiting on a
+        fixed batch size.
+        """
+        sizes = page_bytes(path, indices, dpi)
+        queue = list(zip(indices, sizes))[::-1]
+        pending = {}
+        pending_bytes = 0
+
+        def fill():
+            nonlocal pending_bytes
+            while queue and len(pending) < self.max_pending:
+                index, size = queue[-1]
+                if pending and pending_bytes + size > self.max_pending_bytes:
+                    break
+                queue.pop()
+                pending[self.pool.submit(rasterize_page, path, index, dpi)] = (index, size)
+                pending_bytes += size
+
+        fill()
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                ready = []
+                for future in done:
+                    index, size = pending.pop(future)
+                    pending_bytes -= size
+                    try:
+                        _, samples, shape = future.result()
+                        ready.append((index, to_bgr(samples, shape), None))
+                    except Exception as e:
+                        logger.error(f"Error rasterising page {index + 1}: {e}")
+                        ready.append((index, None, str(e)))
+                fill()
+                yield ready
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,143 @@
+"""
+Result cache for repeated plan analyses
+Exact lookups by content hash, optional perceptual matching of re-encoded copies
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Side of the difference-hash grid: HASH_SIZE * HASH_SIZE bits per image
+HASH_SIZE = 16
+
+
+def params_key(params: Dict[str, Any], exclude=('image', 'images')) -> str:
+    """Canonical string of the request parameters that affect the result"""
+    return json.dumps({k: v for k, v in params.items() if k not in exclude}, sort_keys=True, default=str)
+
+
+def content_key(endpoint: str, payload, params: str) -> str:
+    """Key for the exact encoded bytes of an upload"""
+    digest = hashlib.blake2b(payload, digest_size=16).hexdigest()
+    return f'{endpoint}:{params}:{digest}'
+
+
+def dhash(image: np.ndarray) -> np.ndarray:
+    """Difference hash: sign of horizontal gradients on a small grayscale thumbnail
+
+    Re-encoding (PNG to JPEG, different compression) barely moves the hash,
+    while a different drawing flips many bits.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    thumb = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    return np.packbits(thumb[:, 1:] > thumb[:, :-1])
+
+
+class ResultCache:
+    """TTL + LRU cache of serialised responses
+
+    Entries are stored by content key. With perceptual matching enabled, each
+    entry is also indexed by (endpoint, params, image shape) and its dHash so a
+    re-encoded copy of the same drawing can reuse the result when the Hamming
+    distance is at most max_distance bits.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600, perceptual: bool = False,
+                 max_distance: int = 4):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+
+        self._entries: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+        self._hashes: Dict[tuple, Dict[str, np.ndarray]] = {}
+        self._bucket_of: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._lookup(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return body
+
+    def get_similar(self, bucket: tuple, image_hash: np.ndarray) -> Optional[bytes]:
+        """Closest perceptual match within max_distance bits, if any"""
+        with self._lock:
+            candidates = self._hashes.get(bucket)
+            if not candidates:
+                return None
+            keys = list(candidates)
+            hashes = np.stack([candidates[k] for k in keys])
+            distances = np.unpackbits(hashes ^ image_hash, axis=1).sum(axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+            body = self._lookup(keys[best])
+            if body is not None:
+                self.perceptual_hits += 1
+                # The miss recorded by get() turned out to be a hit
+                self.misses -= 1
+                self.hits += 1
+            return body
+
+    def put(self, key: str, body: bytes, bucket: tuple = None, image_hash: np.ndarray = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            if bucket is not None and image_hash is not None:
+                self._hashes.setdefault(bucket, {})[key] = image_hash
+                self._bucket_of[key] = bucket
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hashes.clear()
+            self._bucket_of.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttlSeconds': self.ttl,
+                'hits': self.hits,
+                'perceptualHits': self.perceptual_hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0
+            }
+
+    def _lookup(self, key: str) -> Optional[bytes]:
+        """Fresh entry for key, marked most recently used (caller holds the lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, body = entry
+        if expires < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        bucket = self._bucket_of.pop(key, None)
+        if bucket is not None:
+            hashes = self._hashes.get(bucket, {})
+            hashes.pop(key, None)
+            if not hashes:
+                self._hashes.pop(bucket, None)
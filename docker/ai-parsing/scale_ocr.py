@@ -0,0 +1,129 @@
+"""
+Region-targeted OCR for scale detection
+Locate text-like regions, OCR only those crops in parallel and stop at the highest-priority scale match
+"""
+
+import logging
+import re
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCALE_PATTERNS = [
+    re.compile(r'1[:\s-](\d+)', re.IGNORECASE),
+    re.compile(r'scale[:\s]*1[:\s-](\d+)', re.IGNORECASE),
+    re.compile(r'(\d+)["\']?\s*=\s*(\d+)["\']?', re.IGNORECASE)
+]
+
+# Region search runs on a copy downscaled to this longest side
+DETECTION_SIDE = 2000
+
+# Crops are scaled so text lines are about this tall before OCR
+OCR_LINE_HEIGHT = 48
+
+# Box (x, y, width, height) in full-resolution pixels
+Box = Tuple[int, int, int, int]
+
+
+def find_scale(text: str) -> Optional[int]:
+    """Scale denominator from OCR text, trying the patterns in order"""
+    for pattern in SCALE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def text_regions(gray: np.ndarray, max_regions: int = 24) -> List[Box]:
+    """Candidate text-line boxes, title block and legend corners first
+
+    Long horizontal and vertical strokes (walls, borders, dimension lines)
+    are removed with morphological opening, the remaining glyphs are smeared
+    into lines and connected components with a text-like shape are kept.
+    """
+    height, width = gray.shape[:2]
+    factor = min(1.0, DETECTION_SIDE / max(height, width))
+    small = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA) if factor < 1 else gray
+
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1)))
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40)))
+    glyphs = cv2.bitwise_and(binary, cv2.bitwise_not(cv2.bitwise_or(horizontal, vertical)))
+    lines = cv2.dilate(glyphs, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3)))
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(lines, connectivity=8)
+    stats = stats[1:count]
+    x, y, w, h, area = stats.T
+
+    keep = (h >= 6) & (h <= 60) & (w >= 1.5 * h) & (w <= 0.6 * small.shape[1]) & (area >= 0.3 * w * h)
+    x, y, w, h = x[keep], y[keep], w[keep], h[keep]
+    if len(x) == 0:
+        return []
+
+    # Distance of each box centre to the nearest corner, bottom-right (title block) weighted first
+    cx = (x + w / 2) / small.shape[1]
+    cy = (y + h / 2) / small.shape[0]
+    corners = np.array([[1.0, 1.0, 0.5], [0.0, 1.0, 1.0], [1.0, 0.0, 1.0], [0.0, 0.0, 1.0]])
+    distances = np.hypot(cx[:, None] - corners[:, 0], cy[:, None] - corners[:, 1]) * corners[:, 2]
+    order = np.argsort(distances.min(axis=1), kind='stable')[:max_regions]
+
+    # Pad the boxes a little and map them back to full resolution
+    pad = 4
+    boxes = []
+    for i in order:
+        x0 = max(int((x[i] - pad) / factor), 0)
+        y0 = max(int((y[i] - pad) / factor), 0)
+        x1 = min(int((x[i] + w[i] + pad) / factor), width)
+        y1 = min(int((y[i] + h[i] + pad) / factor), height)
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+    return boxes
+
+
+def ocr_crop(gray: np.ndarray, box: Box) -> str:
+    """OCR one text line crop"""
+    import pytesseract
+
+    x, y, w, h = box
+    crop = gray[y:y + h, x:x + w]
+    scale = OCR_LINE_HEIGHT / max(h, 1)
+    if scale > 1.2 or scale < 0.5:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA)
+    crop = cv2.copyMakeBorder(crop, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=255)
+    return pytesseract.image_to_string(crop, config='--psm 7')
+
+
+def detect_scale_text(gray: np.ndarray, executor: Executor, max_regions: int = 24,
+                      full_page_fallback: bool = False) -> Dict[str, Any]:
+    """OCR candidate regions in parallel and return the highest-priority scale found
+
+    Crops are OCR'd concurrently but their results are read in region
+    priority order, so a match is accepted only once every higher-priority
+    region has been ruled out; the answer does not depend on which crop
+    finishes first. Lower-priority crops are cancelled at the first match.
+    Without a match the whole page is OCR'd only when full_page_fallback is set.
+    """
+    boxes = text_regions(gray, max_regions)
+    futures = [executor.submit(ocr_crop, gray, box) for box in boxes]
+    scanned = 0
+
+    try:
+        for future, box in zip(futures, boxes):
+            scanned += 1
+            ratio = find_scale(future.result())
+            if ratio is not None:
+                return {'ratio': ratio, 'region': box, 'regionsScanned': scanned, 'regions': len(boxes)}
+    finally:
+        for future in futures[scanned:]:
+            future.cancel()
+
+    if full_page_fallback:
+        import pytesseract
+        ratio = find_scale(pytesseract.image_to_string(gray))
+        if ratio is not None:
+            return {'ratio': ratio, 'region': None, 'regionsScanned': scanned, 'regions': len(boxes)}
+
+    return {'ratio': None, 'region': None, 'regionsScanned': scanned, 'regions': len(boxes)}
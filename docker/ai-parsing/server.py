@@ -3,127 +3,633 @@ AI Parsing Server - Detectron2/YOLO Backend
 Production-ready object detection and image analysis
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
 import base64
+import json
 import os
+import shutil
+import tempfile
+import time
 from ultralytics import YOLO
 import logging
+from batching import MicroBatcher
+from model_registry import ModelRegistry
+from backends import load_model, parse_backend_map
+from scale_ocr import detect_scale_text
+from result_cache import ResultCache, content_key, dhash, params_key
+from tiling import tiled_inference
+from pdf_pages import PageRasterizer, page_count, parse_pages
+from wall_geometry import extract_geometry, geometry_response, metres_per_pixel
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
 CORS(app)
 
+# Reject oversized uploads before reading them
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get('MAX_UPLOAD_MB', '200')) * 1024 * 1024)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Models preloaded at startup and the budget for resident models
+PRELOAD_MODELS = [m for m in os.environ.get('PRELOAD_MODELS', 'yolov8n').split(',') if m]
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', '2048'))
+
+# Runtime per model: MODEL_BACKEND applies to every model unless MODEL_BACKENDS
+# overrides it, e.g. "yolov8n=onnx,yolov8s-seg=onnx-int8"
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'torch')
+MODEL_BACKENDS = parse_backend_map(os.environ.get('MODEL_BACKENDS', ''))
+
+# Batching: explicit batches are split into chunks of BATCH_SIZE images, and
+# concurrent single-image requests are coalesced for MICRO_BATCH_WINDOW_MS
+# (0 disables micro-batching)
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '16'))
+MICRO_BATCH_WINDOW_MS = float(os.environ.get('MICRO_BATCH_WINDOW_MS', '10'))
+
+# Tiled inference for large-format drawings: images whose longest side
+# exceeds TILED_MIN_SIDE are split into overlapping TILE_SIZE tiles unless
+# the request sets 'tiled' explicitly
+TILE_SIZE = int(os.environ.get('TILE_SIZE', '640'))
+TILE_OVERLAP = float(os.environ.get('TILE_OVERLAP', '0.2'))
+TILE_WORKERS = int(os.environ.get('TILE_WORKERS', '2'))
+TILED_MIN_SIDE = int(os.environ.get('TILED_MIN_SIDE', '4096'))
+
+# IoU used by YOLO when the request leaves it unset
+YOLO_DEFAULT_IOU = 0.7
+
+# PDF plan sets: pages are rasterised at PDF_DPI by PDF_WORKERS processes
+PDF_DPI = int(os.environ.get('PDF_DPI', '150'))
+PDF_MAX_DPI = int(os.environ.get('PDF_MAX_DPI', '300'))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', str(os.cpu_count() or 1)))
+PDF_MAX_PENDING_MB = float(os.environ.get('PDF_MAX_PENDING_MB', '512'))
+page_rasterizer = PageRasterizer(PDF_WORKERS, max_pending_bytes=int(PDF_MAX_PENDING_MB * 1024 * 1024))
+
+# Cache of responses for resubmitted plans (RESULT_CACHE_SIZE=0 disables it).
+# Perceptual matching also reuses results for re-encoded copies of a plan, but
+# can return a stale result for a plan with a very small edit, so it is opt-in.
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '256'))
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_SIZE,
+    ttl_seconds=float(os.environ.get('RESULT_CACHE_TTL', '600')),
+    perceptual=os.environ.get('RESULT_CACHE_PERCEPTUAL', 'false').lower() in ('1', 'true', 'yes'),
+    max_distance=int(os.environ.get('RESULT_CACHE_MAX_DISTANCE', '4'))
+) if RESULT_CACHE_SIZE > 0 else None
+
+tile_executor = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix='tiles')
+
+# OCR and wall geometry run next to detection in /analyze-plan
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', '2'))
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix='ocr')
+
+# Scale detection OCRs up to SCALE_OCR_MAX_REGIONS text regions in parallel,
+# falling back to the whole page only when SCALE_OCR_FULL_PAGE is set
+SCALE_OCR_MAX_REGIONS = int(os.environ.get('SCALE_OCR_MAX_REGIONS', '24'))
+SCALE_OCR_FULL_PAGE = os.environ.get('SCALE_OCR_FULL_PAGE', 'false').lower() in ('1', 'true', 'yes')
+ocr_region_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SCALE_OCR_WORKERS', '4')), thread_name_prefix='ocr-regions'
+)
+
+def model_backend(model_type):
+    return MODEL_BACKENDS.get(model_type, MODEL_BACKEND)
+
+# Backend each model was actually loaded with, which differs from the
+# configured one after a fallback
+loaded_backends = {}
+
+def load_yolo_model(model_type):
+    """Load a YOLO model with its configured backend, downloading weights if needed"""
+    backend = model_backend(model_type)
+    try:
+        model = load_model(model_type, backend, '/app/models')
+        logger.info(f"Loaded model {model_type} ({backend})")
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        # Fallback to nano model
+        logger.warning(f"Serving {model_type} with yolov8n on torch instead of {backend}")
+        model = YOLO('yolov8n.pt')
+        backend = 'torch'
+
+    loaded_backends[model_type] = backend
+    return model
+
 # Model cache
-models = {}
+models = ModelRegistry(load_yolo_model, memory_budget_mb=MODEL_MEMORY_BUDGET_MB)
 
 def get_yolo_model(model_type='yolov8n'):
     """Load and cache YOLO model"""
-    if model_type not in models:
-        try:
-            model_path = f'/app/models/{model_type}.pt'
-            if os.path.exists(model_path):
-                models[model_type] = YOLO(model_path)
-                logger.info(f"Loaded model from {model_path}")
-            else:
-                # Download model if not exists
-                models[model_type] = YOLO(f'{model_type}.pt')
-                logger.info(f"Downloaded model {model_type}")
-        except Exception as e:
-            logger.error(f"Error loading model: {e}")
-            # Fallback to nano model
-            models[model_type] = YOLO('yolov8n.pt')
-
-    return models[model_type]
-
-def decode_image(image_data):
-    """Decode base64 image to numpy array"""
+    return models.get(model_type)
+
+def inference_kwargs(conf_threshold=None, iou_threshold=None):
+    """Only pass thresholds the caller set, leaving YOLO defaults otherwise"""
+    kwargs = {'verbose': False}
+    if conf_threshold is not None:
+        kwargs['conf'] = conf_threshold
+    if iou_threshold is not None:
+        kwargs['iou'] = iou_threshold
+    return kwargs
+
+def run_yolo_batch(key, images):
+    """Run a list of images through one model as a single batch
+
+    Forward passes through a model are serialised: the micro-batcher, tile
+    workers and batch endpoints all share one predictor per model.
+    """
+    model_type, conf_threshold, iou_threshold = key
+    model = get_yolo_model(model_type)
+    lock = models.inference_lock(model_type)
+    results = []
+    for start in range(0, len(images), BATCH_SIZE):
+        chunk = images[start:start + BATCH_SIZE]
+        with lock:
+            results.extend(model(chunk, **inference_kwargs(conf_threshold, iou_threshold)))
+    return results
+
+micro_batcher = MicroBatcher(
+    run_yolo_batch, window_ms=MICRO_BATCH_WINDOW_MS, max_batch_size=BATCH_SIZE
+) if MICRO_BATCH_WINDOW_MS > 0 else None
+
+def infer(image, model_type='yolov8n', conf_threshold=None, iou_threshold=None):
+    """Run inference on one image, coalescing with concurrent requests when enabled"""
+    key = (model_type, conf_threshold, iou_threshold)
+    if micro_batcher is not None:
+        return micro_batcher(key, image)
+    return run_yolo_batch(key, [image])[0]
+
+def result_boxes(result):
+    """Move a result's boxes to NumPy once: (N, 4) xyxy, (N,) confidence, (N,) class id"""
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy().astype(np.float32, copy=False)
+    conf = boxes.conf.cpu().numpy().astype(np.float32, copy=False)
+    cls = boxes.cls.cpu().numpy().astype(np.int64)
+    return xyxy, conf, cls
+
+def xyxy_to_xywh(xyxy):
+    xywh = xyxy.copy()
+    xywh[:, 2:] -= xyxy[:, :2]
+    return xywh
+
+def result_arrays(result):
+    """Columnar (N, 4) xywh, (N,) confidence, (N,) class id arrays for one result"""
+    xyxy, conf, cls = result_boxes(result)
+    return xyxy_to_xywh(xyxy), conf, cls
+
+def use_tiling(params, image):
+    """Tile when requested, or automatically for large-format images"""
+    tiled = str(params.get('tiled', 'auto')).lower()
+    if tiled == 'auto':
+        return max(image.shape[:2]) > TILED_MIN_SIDE
+    return tiled in ('1', 'true', 'yes')
+
+def detect_arrays(image, params, model_type='yolov8n', conf_threshold=None, iou_threshold=None):
+    """Detect on one image, tiled or whole, returning columnar xywh/conf/cls arrays"""
+    if not use_tiling(params, image):
+        return result_arrays(infer(image, model_type, conf_threshold, iou_threshold))
+
+    key = (model_type, conf_threshold, iou_threshold)
+    xyxy, conf, cls = tiled_inference(
+        image,
+        lambda tiles: [result_boxes(result) for result in run_yolo_batch(key, tiles)],
+        tile_size=int(params.get('tile_size', TILE_SIZE)),
+        overlap=float(params.get('tile_overlap', TILE_OVERLAP)),
+        iou_threshold=iou_threshold if iou_threshold is not None else YOLO_DEFAULT_IOU,
+        batch_size=BATCH_SIZE,
+        executor=tile_executor
+    )
+    return xyxy_to_xywh(xyxy), conf, cls
+
+def detect_many(images, params, model_type='yolov8n', conf_threshold=None, iou_threshold=None):
+    """Columnar detections for several images: large-format ones tiled, the rest in one batch"""
+    key = (model_type, conf_threshold, iou_threshold)
+    arrays = [None] * len(images)
+    whole = [i for i, image in enumerate(images) if not use_tiling(params, image)]
+    if whole:
+        for i, result in zip(whole, run_yolo_batch(key, [images[i] for i in whole])):
+            arrays[i] = result_arrays(result)
+    for i, image in enumerate(images):
+        if arrays[i] is None:
+            arrays[i] = detect_arrays(image, params, model_type, conf_threshold, iou_threshold)
+    return arrays
+
+def class_labels(cls, names, lowercase=False):
+    """Map class ids to names with a single table lookup"""
+    table = np.array([names[i].lower() if lowercase else names[i] for i in range(len(names))], dtype=object)
+    return table[cls].tolist()
+
+def detection_list(xywh, conf, cls, names, bbox_key='bbox', lowercase=False):
+    """Row-per-detection response built from columnar arrays"""
+    labels = class_labels(cls, names, lowercase)
+    return [
+        {
+            'class': label,
+            'confidence': confidence,
+            bbox_key: {'x': x, 'y': y, 'width': width, 'height': height}
+        }
+        for label, confidence, (x, y, width, height) in zip(labels, conf.tolist(), xywh.tolist())
+    ]
+
+def detection_columns(xywh, conf, cls, names, lowercase=False):
+    """Compact columnar response: parallel arrays, boxes as [x, y, width, height]"""
+    return {
+        'count': int(len(conf)),
+        'classes': class_labels(cls, names, lowercase),
+        'confidences': conf.tolist(),
+        'boxes': xywh.tolist()
+    }
+
+def detections_from_result(result, names, compact=False):
+    """Convert one YOLO result to the /yolo/detect detection format"""
+    xywh, conf, cls = result_arrays(result)
+    if compact:
+        return detection_columns(xywh, conf, cls, names)
+    return detection_list(xywh, conf, cls, names)
+
+# Floor plan categories, matched against lowercase class names in order
+FURNITURE_TERMS = ['chair', 'table', 'couch', 'bed']
+
+def categorize_classes(names):
+    """Category index per class id: 0 walls, 1 doors, 2 windows, 3 furniture"""
+    categories = np.zeros(len(names), dtype=np.int8)
+    for i in range(len(names)):
+        class_name = names[i].lower()
+        if 'door' in class_name:
+            categories[i] = 1
+        elif 'window' in class_name:
+            categories[i] = 2
+        elif any(term in class_name for term in FURNITURE_TERMS):
+            categories[i] = 3
+    return categories
+
+def decode_base64(image_data):
+    """Decode a base64 string (optionally a data URL) to the encoded image bytes"""
     try:
         # Remove data URL prefix if present
         if ',' in image_data:
-            image_data = image_data.split(',')[1]
+            image_data = image_data[image_data.index(',') + 1:]
+        return base64.b64decode(image_data)
+    except Exception as e:
+        logger.error(f"Error decoding image: {e}")
+        return None
 
-        # Decode base64
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+def decode_image(image_data):
+    """Decode base64 image to numpy array"""
+    image_bytes = decode_base64(image_data)
+    return decode_image_bytes(image_bytes) if image_bytes is not None else None
 
-        return image
+def decode_image_bytes(buffer):
+    """Decode encoded image bytes (any buffer) to numpy array without copying them"""
+    try:
+        nparr = np.frombuffer(buffer, np.uint8)
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     except Exception as e:
         logger.error(f"Error decoding image: {e}")
         return None
 
+def read_into_buffer(stream, size=None):
+    """Read a stream into one preallocated buffer instead of accumulating chunks"""
+    if size is None:
+        try:
+            position = stream.tell()
+            size = stream.seek(0, os.SEEK_END) - position
+            stream.seek(position)
+        except (AttributeError, OSError, ValueError):
+            return stream.read()
+
+    if not hasattr(stream, 'readinto'):
+        return stream.read()
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    filled = 0
+    while filled < size:
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return view[:filled]
+
+def parse_param(value):
+    """Interpret a form or query-string value as JSON when possible ('0.3', 'true')"""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def request_params():
+    """Request parameters from a JSON body, or from form fields and the query string"""
+    if request.is_json:
+        return request.get_json(silent=True) or {}
+
+    params = {key: parse_param(value) for key, value in request.args.items()}
+    params.update({key: parse_param(value) for key, value in request.form.items()})
+    return params
+
+def request_payloads(params, field='image'):
+    """Encoded image bytes from a raw image/* body, multipart files or base64 JSON
+
+    Returns a list with one entry per supplied image (None where base64
+    decoding failed), or an empty list when the request carries no image.
+    """
+    if request.mimetype.startswith('image/'):
+        return [read_into_buffer(request.stream, request.content_length)]
+
+    if request.files:
+        uploads = request.files.getlist(field) or request.files.getlist(field.rstrip('s'))
+        return [read_into_buffer(upload.stream) for upload in uploads]
+
+    value = params.get(field)
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [decode_base64(image_data) for image_data in value]
+    return [decode_base64(value)]
+
+def request_images(params, field='image'):
+    """Decoded image(s) of the request, None where decoding failed"""
+    return [
+        decode_image_bytes(payload) if payload is not None else None
+        for payload in request_payloads(params, field)
+    ]
+
+def request_payload(params):
+    """Single-image variant of request_payloads: (encoded bytes, error response or None)"""
+    payloads = request_payloads(params)
+    if not payloads:
+        return None, (jsonify({'error': 'No image provided'}), 400)
+    if payloads[0] is None:
+        return None, (jsonify({'error': 'Invalid image data'}), 400)
+    return payloads[0], None
+
+def request_image(params):
+    """Single decoded image of the request: (image, error response or None)"""
+    payload, error = request_payload(params)
+    if error:
+        return None, error
+    image = decode_image_bytes(payload)
+    if image is None:
+        return None, (jsonify({'error': 'Invalid image data'}), 400)
+    return image, None
+
+def cache_lookup(endpoint, params, payload):
+    """Exact-match lookup on the upload bytes: (key, params key, cached body or None)"""
+    key_params = params_key(params)
+    key = content_key(endpoint, payload, key_params)
+    return key, key_params, result_cache.get(key)
+
+def cache_lookup_similar(endpoint, key_params, key, image):
+    """Perceptual lookup after an exact miss: (bucket, hash, cached body or None)"""
+    if not result_cache.perceptual:
+        return None, None, None
+    bucket = (endpoint, key_params, image.shape)
+    image_hash = dhash(image)
+    body = result_cache.get_similar(bucket, image_hash)
+    if body is not None:
+        result_cache.put(key, body, bucket, image_hash)
+    return bucket, image_hash, body
+
+def json_response(body, cache_status):
+    return app.response_class(body, mimetype='application/json', headers={'X-Cache': cache_status})
+
+def cached_analysis(endpoint, params, analyze):
+    """Serve analyze(image, params) from the result cache, computing it on a miss
+
+    The exact upload bytes are hashed before decoding, so an identical
+    resubmission skips decoding and inference entirely.
+    """
+    if result_cache is None:
+        image, error = request_image(params)
+        if error:
+            return error
+        return jsonify(analyze(image, params))
+
+    payload, error = request_payload(params)
+    if error:
+        return error
+
+    key, key_params, body = cache_lookup(endpoint, params, payload)
+    if body is not None:
+        return json_response(body, 'HIT')
+
+    image = decode_image_bytes(payload)
+    if image is None:
+        return jsonify({'error': 'Invalid image data'}), 400
+
+    bucket, image_hash, body = cache_lookup_similar(endpoint, key_params, key, image)
+    if body is not None:
+        return json_response(body, 'HIT')
+
+    body = app.json.dumps(analyze(image, params)).encode()
+    result_cache.put(key, body, bucket, image_hash)
+    return json_response(body, 'MISS')
+
+def health_status():
+    return {
+        'status': 'healthy',
+        'service': 'ai-parsing',
+        'models_loaded': models.loaded(),
+        'models': models.stats(),
+        'backends': {name: loaded_backends.get(name, model_backend(name)) for name in models.loaded()},
+        'batching': micro_batcher.stats() if micro_batcher else None,
+        'resultCache': result_cache.stats() if result_cache else None
+    }
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'ai-parsing',
-        'models_loaded': list(models.keys())
-    })
+    return jsonify(health_status())
+
+def detect_objects(image, data):
+    """YOLO detection response for one decoded image"""
+    # Get parameters
+    conf_threshold = data.get('conf_threshold', 0.25)
+    iou_threshold = data.get('iou_threshold', 0.45)
+    model_type = data.get('model', 'yolov8n')
+
+    # Run inference (tiled for large drawings, otherwise batched with concurrent requests)
+    xywh, conf, cls = detect_arrays(image, data, model_type, conf_threshold, iou_threshold)
+
+    # Parse results
+    names = get_yolo_model(model_type).names
+    build = detection_columns if data.get('compact', False) else detection_list
+    detections = build(xywh, conf, cls, names)
+
+    return {
+        'detections': detections,
+        'image_width': image.shape[1],
+        'image_height': image.shape[0],
+        'model_used': model_type,
+        'tiled': use_tiling(data, image)
+    }
 
 @app.route('/yolo/detect', methods=['POST'])
 def yolo_detect():
     """YOLO object detection endpoint"""
     try:
-        data = request.get_json()
-
-        if not data or 'image' not in data:
-            return jsonify({'error': 'No image provided'}), 400
-
-        # Decode image
-        image = decode_image(data['image'])
-        if image is None:
-            return jsonify({'error': 'Invalid image data'}), 400
-
-        # Get parameters
-        conf_threshold = data.get('conf_threshold', 0.25)
-        iou_threshold = data.get('iou_threshold', 0.45)
-        model_type = data.get('model', 'yolov8n')
-
-        # Load model
-        model = get_yolo_model(model_type)
-
-        # Run inference
-        results = model(image, conf=conf_threshold, iou=iou_threshold)
-
-        # Parse results
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                class_name = model.names[cls]
-
-                detections.append({
-                    'class': class_name,
-                    'confidence': conf,
-                    'bbox': {
-                        'x': float(x1),
-                        'y': float(y1),
-                        'width': float(x2 - x1),
-                        'height': float(y2 - y1)
-                    }
-                })
+        data = request_params()
 
-        return jsonify({
-            'detections': detections,
-            'image_width': image.shape[1],
-            'image_height': image.shape[0],
-            'model_used': model_type
-        })
+        # Image from a raw body, multipart upload or base64 JSON; repeats are served from cache
+        return cached_analysis('yolo/detect', data, detect_objects)
 
     except Exception as e:
         logger.error(f"Detection error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def batch_detection(images, data):
+    """Batch detection response for decoded images, None entries reported as invalid"""
+    # Get parameters
+    conf_threshold = data.get('conf_threshold', 0.25)
+    iou_threshold = data.get('iou_threshold', 0.45)
+    model_type = data.get('model', 'yolov8n')
+
+    valid = [i for i, image in enumerate(images) if image is not None]
+
+    # Run inference as one batch
+    results = run_yolo_batch(
+        (model_type, conf_threshold, iou_threshold),
+        [images[i] for i in valid]
+    )
+    names = get_yolo_model(model_type).names
+
+    responses = [{'index': i, 'error': 'Invalid image data'} for i in range(len(images))]
+    for i, result in zip(valid, results):
+        responses[i] = {
+            'index': i,
+            'detections': detections_from_result(result, names, data.get('compact', False)),
+            'image_width': images[i].shape[1],
+            'image_height': images[i].shape[0]
+        }
+
+    return {
+        'results': responses,
+        'model_used': model_type
+    }
+
+@app.route('/yolo/detect-batch', methods=['POST'])
+def yolo_detect_batch():
+    """YOLO detection for several images (e.g. a multi-page plan set) in one batch"""
+    try:
+        data = request_params()
+
+        # Decode images, remembering which ones failed
+        images = request_images(data, 'images')
+        if not images:
+            return jsonify({'error': 'No images provided'}), 400
+
+        return jsonify(batch_detection(images, data))
+
+    except Exception as e:
+        logger.error(f"Batch detection error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def save_pdf_upload(params):
+    """Write the request's PDF (raw body, multipart file or base64 JSON) to a temp file"""
+    handle, path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(handle, 'wb') as out:
+        if request.mimetype == 'application/pdf':
+            shutil.copyfileobj(request.stream, out, 1024 * 1024)
+        elif request.files:
+            upload = request.files.get('file') or request.files.get('pdf')
+            if upload is not None:
+                shutil.copyfileobj(upload.stream, out, 1024 * 1024)
+        elif params.get('pdf'):
+            pdf_bytes = decode_base64(params['pdf'])
+            if pdf_bytes is not None:
+                out.write(pdf_bytes)
+    return path
+
+def pdf_job(path, data):
+    """Resolved parameters for a PDF detection job; ValueError when the file is not a PDF"""
+    try:
+        count = page_count(path)
+    except Exception as e:
+        logger.error(f"Error opening PDF: {e}")
+        raise ValueError('Invalid PDF data')
+
+    return {
+        'count': count,
+        'conf_threshold': data.get('conf_threshold', 0.25),
+        'iou_threshold': data.get('iou_threshold', 0.45),
+        'model': data.get('model', 'yolov8n'),
+        'compact': data.get('compact', False),
+        'dpi': min(int(data.get('dpi', PDF_DPI)), PDF_MAX_DPI),
+        'indices': parse_pages(data.get('pages'), count)
+    }
+
+def pdf_detection_lines(path, data, job):
+    """NDJSON lines for a PDF detection job, one per page and a summary; removes path when done"""
+    started = time.perf_counter()
+    processed = 0
+    model_type = job['model']
+    try:
+        names = get_yolo_model(model_type).names
+        # Rasterisation keeps running in the process pool while each ready group is detected
+        for ready in page_rasterizer.iter_pages(path, job['indices'], job['dpi']):
+            lines = [
+                {'page': index + 1, 'error': error}
+                for index, image, error in ready if image is None
+            ]
+            pages = [(index, image) for index, image, _ in ready if image is not None]
+            # Sheets above TILED_MIN_SIDE are tiled like /yolo/detect; the rest share one batch
+            arrays = detect_many(
+                [image for _, image in pages], data, model_type,
+                job['conf_threshold'], job['iou_threshold']
+            )
+            build = detection_columns if job['compact'] else detection_list
+            for (index, image), (xywh, conf, cls) in zip(pages, arrays):
+                lines.append({
+                    'page': index + 1,
+                    'detections': build(xywh, conf, cls, names),
+                    'image_width': image.shape[1],
+                    'image_height': image.shape[0],
+                    'tiled': use_tiling(data, image)
+                })
+            processed += len(ready)
+            for line in lines:
+                yield json.dumps(line) + '\n'
+
+        yield json.dumps({
+            'done': True,
+            'pages': processed,
+            'pageCount': job['count'],
+            'dpi': job['dpi'],
+            'model_used': model_type,
+            'seconds': time.perf_counter() - started
+        }) + '\n'
+    except Exception as e:
+        logger.error(f"PDF detection error: {e}")
+        yield json.dumps({'error': str(e)}) + '\n'
+    finally:
+        os.remove(path)
+
+@app.route('/pdf/detect', methods=['POST'])
+def pdf_detect():
+    """YOLO detection for every page of a PDF plan set, streamed as NDJSON per page"""
+    path = None
+    try:
+        data = request_params()
+        path = save_pdf_upload(data)
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+            return jsonify({'error': 'No PDF provided'}), 400
+
+        try:
+            job = pdf_job(path, data)
+        except ValueError as e:
+            os.remove(path)
+            return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        if path and os.path.exists(path):
+            os.remove(path)
+        logger.error(f"PDF detection error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    return Response(
+        stream_with_context(pdf_detection_lines(path, data, job)), mimetype='application/x-ndjson'
+    )
+
 @app.route('/detectron2/predict', methods=['POST'])
 def detectron2_predict():
     """Detectron2 prediction endpoint (fallback to YOLO if not available)"""
@@ -148,154 +654,202 @@ def detectron2_predict():
         logger.error(f"Detectron2 error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def scale_info(image, data):
+    """Scale detection response for one decoded image"""
+    # Convert to grayscale for text detection
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # Scale detection by OCR of candidate text regions (if tesseract available)
+    try:
+        import pytesseract
+
+        found = detect_scale_text(
+            gray, ocr_region_executor,
+            max_regions=int(data.get('max_regions', SCALE_OCR_MAX_REGIONS)),
+            full_page_fallback=bool(data.get('full_page', SCALE_OCR_FULL_PAGE))
+        )
+        scale_found = found['ratio'] is not None
+        scale_ratio = found['ratio'] if scale_found else 100
+
+        response = {
+            'scaleRatio': scale_ratio,
+            'scaleFound': scale_found,
+            'scaleLine': {
+                'start': {'x': 50, 'y': image.shape[0] - 50},
+                'end': {'x': 150, 'y': image.shape[0] - 50},
+                'length': 5,
+                'unit': 'meters'
+            },
+            'confidence': 0.85 if scale_found else 0.3,
+            'regionsScanned': found['regionsScanned']
+        }
+        if found['region'] is not None:
+            x, y, width, height = found['region']
+            response['scaleRegion'] = {'x': x, 'y': y, 'width': width, 'height': height}
+        return response
+
+    except ImportError:
+        logger.warning("Tesseract not available")
+        # Return default scale
+        return {
+            'scaleRatio': 100,
+            'scaleFound': False,
+            'confidence': 0.3
+        }
+
 @app.route('/detect-scale', methods=['POST'])
 def detect_scale():
     """Detect scale information in architectural drawings"""
     try:
-        data = request.get_json()
-
-        if not data or 'image' not in data:
-            return jsonify({'error': 'No image provided'}), 400
+        data = request_params()
 
-        # Decode image
-        image = decode_image(data['image'])
-        if image is None:
-            return jsonify({'error': 'Invalid image data'}), 400
-
-        # Convert to grayscale for text detection
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-        # Simple scale detection using OCR (if tesseract available)
-        try:
-            import pytesseract
-            text = pytesseract.image_to_string(gray)
-
-            # Look for scale patterns
-            import re
-            scale_patterns = [
-                r'1[:\s-](\d+)',
-                r'scale[:\s]*1[:\s-](\d+)',
-                r'(\d+)["\']?\s*=\s*(\d+)["\']?'
-            ]
-
-            scale_found = False
-            scale_ratio = 100
-
-            for pattern in scale_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    scale_ratio = int(match.group(1))
-                    scale_found = True
-                    break
-
-            return jsonify({
-                'scaleRatio': scale_ratio,
-                'scaleFound': scale_found,
-                'scaleLine': {
-                    'start': {'x': 50, 'y': image.shape[0] - 50},
-                    'end': {'x': 150, 'y': image.shape[0] - 50},
-                    'length': 5,
-                    'unit': 'meters'
-                },
-                'confidence': 0.85 if scale_found else 0.3
-            })
-
-        except ImportError:
-            logger.warning("Tesseract not available")
-            # Return default scale
-            return jsonify({
-                'scaleRatio': 100,
-                'scaleFound': False,
-                'confidence': 0.3
-            })
+        # Image from a raw body, multipart upload or base64 JSON; repeats are served from cache
+        return cached_analysis('detect-scale', data, scale_info)
 
     except Exception as e:
         logger.error(f"Scale detection error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def categorized_objects(xywh, conf, cls, names, image, compact=False):
+    """Floor plan response from detection arrays, with one mask per category"""
+    category = categorize_classes(names)[cls]
+    build = detection_columns if compact else detection_list
+    kwargs = {'lowercase': True} if compact else {'bbox_key': 'boundingBox', 'lowercase': True}
+
+    walls, doors, windows, furniture = [
+        build(xywh[category == index], conf[category == index], cls[category == index], names, **kwargs)
+        for index in range(4)
+    ]
+    counts = [int(np.count_nonzero(category == index)) for index in range(4)]
+
+    return {
+        'objects': {
+            'walls': walls,
+            'doors': doors,
+            'windows': windows,
+            'furniture': furniture
+        },
+        'statistics': {
+            'totalWalls': counts[0],
+            'totalDoors': counts[1],
+            'totalWindows': counts[2],
+            'totalFurniture': counts[3]
+        },
+        'imageSize': {
+            'width': image.shape[1],
+            'height': image.shape[0]
+        }
+    }
+
+def pixel_geometry(image, data):
+    """Wall segments and room polygons in image pixels, tuned by the request parameters"""
+    return extract_geometry(
+        image,
+        min_wall_thickness=int(data.get('min_wall_thickness', 3)),
+        door_gap=float(data.get('door_gap', 0.015))
+    )
+
+def plan_geometry(image, data):
+    """Wall polylines (joined segments) and room polygons, in metres when scale_ratio and dpi are given"""
+    metres = metres_per_pixel(data.get('scale_ratio'), data.get('dpi'))
+    return geometry_response(pixel_geometry(image, data), metres)
+
+def floor_plan_analysis(image, data):
+    """Categorised floor plan detections for one decoded image"""
+    geometry_future = ocr_executor.submit(plan_geometry, image, data) if data.get('geometry', False) else None
+
+    # Run YOLO detection
+    model = get_yolo_model('yolov8n')
+    xywh, conf, cls = detect_arrays(image, data, 'yolov8n')
+    response = categorized_objects(xywh, conf, cls, model.names, image, data.get('compact', False))
+    if geometry_future is not None:
+        response['geometry'] = geometry_future.result()
+    return response
+
+def plan_analysis(image, data):
+    """Detection, scale and floor plan categories from one decode and one YOLO pass
+
+    OCR scale detection runs on the OCR executor while YOLO runs, and the
+    floor plan categories are derived from the same detections. Thresholds
+    default to YOLO's own, as in floor_plan_analysis, so floorPlan matches
+    /analyze-floor-plan for the same image.
+    """
+    conf_threshold = data.get('conf_threshold')
+    iou_threshold = data.get('iou_threshold')
+    model_type = data.get('model', 'yolov8n')
+    compact = data.get('compact', False)
+
+    scale_future = ocr_executor.submit(scale_info, image, data)
+    geometry_future = ocr_executor.submit(pixel_geometry, image, data) if data.get('geometry', False) else None
+    xywh, conf, cls = detect_arrays(image, data, model_type, conf_threshold, iou_threshold)
+    names = get_yolo_model(model_type).names
+
+    build = detection_columns if compact else detection_list
+    scale = scale_future.result()
+    floor_plan = categorized_objects(xywh, conf, cls, names, image, compact)
+    if geometry_future is not None:
+        # Scale the geometry with the ratio OCR found unless the request gave one
+        ratio = data.get('scale_ratio', scale['scaleRatio'] if scale.get('scaleFound') else None)
+        floor_plan['geometry'] = geometry_response(
+            geometry_future.result(), metres_per_pixel(ratio, data.get('dpi'))
+        )
+
+    return {
+        'detections': build(xywh, conf, cls, names),
+        'scale': scale,
+        'floorPlan': floor_plan,
+        'image_width': image.shape[1],
+        'image_height': image.shape[0],
+        'model_used': model_type,
+        'tiled': use_tiling(data, image)
+    }
+
 @app.route('/analyze-floor-plan', methods=['POST'])
 def analyze_floor_plan():
     """Comprehensive floor plan analysis"""
     try:
-        data = request.get_json()
-
-        if not data or 'image' not in data:
-            return jsonify({'error': 'No image provided'}), 400
-
-        # Decode image
-        image = decode_image(data['image'])
-        if image is None:
-            return jsonify({'error': 'Invalid image data'}), 400
-
-        # Run YOLO detection
-        model = get_yolo_model('yolov8n')
-        results = model(image)
-
-        # Categorize detections
-        walls = []
-        doors = []
-        windows = []
-        furniture = []
-
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                class_name = model.names[cls].lower()
-
-                obj = {
-                    'class': class_name,
-                    'confidence': conf,
-                    'boundingBox': {
-                        'x': float(x1),
-                        'y': float(y1),
-                        'width': float(x2 - x1),
-                        'height': float(y2 - y1)
-                    }
-                }
-
-                # Categorize
-                if 'door' in class_name:
-                    doors.append(obj)
-                elif 'window' in class_name:
-                    windows.append(obj)
-                elif any(term in class_name for term in ['chair', 'table', 'couch', 'bed']):
-                    furniture.append(obj)
-                else:
-                    walls.append(obj)
-
-        return jsonify({
-            'objects': {
-                'walls': walls,
-                'doors': doors,
-                'windows': windows,
-                'furniture': furniture
-            },
-            'statistics': {
-                'totalWalls': len(walls),
-                'totalDoors': len(doors),
-                'totalWindows': len(windows),
-                'totalFurniture': len(furniture)
-            },
-            'imageSize': {
-                'width': image.shape[1],
-                'height': image.shape[0]
-            }
-        })
+        data = request_params()
+
+        # Image from a raw body, multipart upload or base64 JSON; repeats are served from cache
+        return cached_analysis('analyze-floor-plan', data, floor_plan_analysis)
 
     except Exception as e:
         logger.error(f"Floor plan analysis error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/wall-geometry', methods=['POST'])
+def wall_geometry():
+    """Wall polylines and closed room polygons extracted from a plan image"""
+    try:
+        data = request_params()
+
+        # Image from a raw body, multipart upload or base64 JSON; repeats are served from cache
+        return cached_analysis('wall-geometry', data, plan_geometry)
+
+    except Exception as e:
+        logger.error(f"Wall geometry error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analyze-plan', methods=['POST'])
+def analyze_plan():
+    """Combined detection, scale detection and floor plan analysis in a single pass"""
+    try:
+        data = request_params()
+
+        # Image from a raw body, multipart upload or base64 JSON; repeats are served from cache
+        return cached_analysis('analyze-plan', data, plan_analysis)
+
+    except Exception as e:
+        logger.error(f"Plan analysis error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     # Create models directory if it doesn't exist
     os.makedirs('/app/models', exist_ok=True)
 
-    # Pre-load default model
-    logger.info("Pre-loading YOLOv8n model...")
-    get_yolo_model('yolov8n')
+    # Pre-load configured models
+    logger.info(f"Pre-loading models: {', '.join(PRELOAD_MODELS)}")
+    models.preload(PRELOAD_MODELS)
 
     # Start server
     app.run(host='0.0.0.0', port=8003, debug=False)
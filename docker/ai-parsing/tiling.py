@@ -0,0 +1,135 @@
+"""
+Tiled inference for large-format drawings
+Overlapping tiles, batched, shifted and merged in parallel with global NMS
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (N, 4) xyxy boxes, (N,) confidences, (N,) class ids
+Detections = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """Overlapping tile windows (x0, y0, x1, y1) covering the whole image
+
+    The last tile in each row and column is shifted back to end exactly at
+    the image edge, so every tile has the full size when the image allows it.
+    """
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def box_nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+            iou_threshold: float, containment_threshold: float = 0.8) -> np.ndarray:
+    """Class-aware greedy NMS, returning indices of kept boxes by descending score
+
+    Besides IoU, a box is suppressed when most of it lies inside a higher
+    scoring box of the same class (intersection over the smaller area). That
+    removes the clipped partial boxes produced where an object crosses a tile
+    edge, whose IoU with the complete box is often low.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Shift each class into its own coordinate range so one pass handles all classes
+    offsets = classes.astype(np.float64)[:, None] * (boxes.max() + 1)
+    shifted = boxes.astype(np.float64) + offsets
+    areas = (shifted[:, 2] - shifted[:, 0]) * (shifted[:, 3] - shifted[:, 1])
+
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+
+        ix1 = np.maximum(shifted[best, 0], shifted[rest, 0])
+        iy1 = np.maximum(shifted[best, 1], shifted[rest, 1])
+        ix2 = np.minimum(shifted[best, 2], shifted[rest, 2])
+        iy2 = np.minimum(shifted[best, 3], shifted[rest, 3])
+        intersection = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        containment = intersection / np.maximum(np.minimum(areas[best], areas[rest]), 1e-9)
+
+        order = rest[(iou <= iou_threshold) & (containment <= containment_threshold)]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def tiled_inference(image: np.ndarray, predict: Callable[[List[np.ndarray]], Sequence[Detections]],
+                    tile_size: int = 640, overlap: float = 0.2, iou_threshold: float = 0.45,
+                    batch_size: int = 16, workers: int = 2, full_image_pass: bool = True,
+                    executor: ThreadPoolExecutor = None) -> Detections:
+    """Run predict over overlapping tiles and merge the detections in image coordinates
+
+    predict receives a list of images and returns one (xyxy, conf, cls) tuple
+    per image and must be safe to call from several threads; the service's
+    predict serialises the model itself, so the pool overlaps one batch's
+    forward pass with the coordinate shift of the others. Tiles are numpy
+    views into the original image, grouped into batches of batch_size. With
+    full_image_pass the downscaled whole image is added as one more input so
+    objects larger than a tile are still found.
+    """
+    height, width = image.shape[:2]
+    windows = tile_grid(width, height, tile_size, overlap)
+
+    inputs = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+    origins = [(x0, y0) for x0, y0, _, _ in windows]
+    if full_image_pass and len(windows) > 1:
+        inputs.append(image)
+        origins.append((0, 0))
+
+    batches = [
+        (inputs[start:start + batch_size], origins[start:start + batch_size])
+        for start in range(0, len(inputs), batch_size)
+    ]
+
+    def run(batch):
+        images, batch_origins = batch
+        shifted = []
+        for (xyxy, conf, cls), (x0, y0) in zip(predict(images), batch_origins):
+            xyxy = xyxy.astype(np.float32, copy=True)
+            xyxy[:, [0, 2]] += x0
+            xyxy[:, [1, 3]] += y0
+            shifted.append((xyxy, conf, cls))
+        return shifted
+
+    if executor is not None:
+        per_batch = list(executor.map(run, batches))
+    elif workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            per_batch = list(pool.map(run, batches))
+    else:
+        per_batch = [run(batch) for batch in batches]
+
+    parts = [detections for batch in per_batch for detections in batch]
+    if not parts:
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.int64)
+
+    xyxy = np.concatenate([p[0] for p in parts]).reshape(-1, 4)
+    conf = np.concatenate([p[1] for p in parts])
+    cls = np.concatenate([p[2] for p in parts]).astype(np.int64)
+
+    keep = box_nms(xyxy, conf, cls, iou_threshold)
+    logger.info(f"Tiled inference: {len(windows)} tiles, {len(conf)} raw -> {len(keep)} merged detections")
+
+    return xyxy[keep], conf[keep], cls[keep]
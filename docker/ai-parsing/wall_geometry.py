@@ -0,0 +1,357 @@
+"""
+Wall and room geometry from plan images
+Binarisation, morphological line extraction, segment merging, wall polylines and room polygons
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Geometry is extracted on a copy downscaled to this longest side
+PROCESSING_SIDE = 3000
+
+# Metres per inch, to turn drawing scale and DPI into metres per pixel
+METRES_PER_INCH = 0.0254
+
+
+def metres_per_pixel(scale_ratio: Optional[float], dpi: Optional[float]) -> Optional[float]:
+    """Real-world size of one image pixel for a 1:scale_ratio drawing scanned at dpi"""
+    if not scale_ratio or not dpi:
+        return None
+    return scale_ratio * METRES_PER_INCH / dpi
+
+
+def _axis_segments(mask: np.ndarray, horizontal: bool) -> np.ndarray:
+    """Centre lines of axis-aligned strokes: rows of (x0, y0, x1, y1, thickness)"""
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    x, y, w, h = stats[1:count, :4].T.astype(np.float32)
+    if horizontal:
+        cy = y + h / 2
+        return np.stack([x, cy, x + w, cy, h], axis=1)
+    cx = x + w / 2
+    return np.stack([cx, y, cx, y + h, w], axis=1)
+
+
+def _merge_collinear(segments: np.ndarray, horizontal: bool, offset_tol: float, gap_tol: float) -> np.ndarray:
+    """Join segments on (nearly) the same line whose ends overlap or are within gap_tol"""
+    if len(segments) == 0:
+        return segments
+    # Work in (offset, start, end) coordinates along the segment axis
+    if horizontal:
+        offset, start, end = segments[:, 1], segments[:, 0], segments[:, 2]
+    else:
+        offset, start, end = segments[:, 0], segments[:, 1], segments[:, 3]
+    thickness = segments[:, 4]
+
+    order = np.lexsort((start, np.round(offset / offset_tol)))
+    merged = []
+    current = None
+    for i in order:
+        if (current is not None and abs(offset[i] - current[0]) <= offset_tol
+                and start[i] <= current[2] + gap_tol):
+            length_i = end[i] - start[i]
+            length_c = current[2] - current[1]
+            # Length-weighted offset and thickness keep long walls dominant
+            total = max(length_i + length_c, 1e-6)
+            current[0] = (current[0] * length_c + offset[i] * length_i) / total
+            current[3] = (current[3] * length_c + thickness[i] * length_i) / total
+            current[2] = max(current[2], end[i])
+        else:
+            if current is not None:
+                merged.append(current)
+            current = [offset[i], start[i], end[i], thickness[i]]
+    merged.append(current)
+
+    merged = np.asarray(merged, dtype=np.float32)
+    off, s, e, t = merged.T
+    if horizontal:
+        return np.stack([s, off, e, off, t], axis=1)
+    return np.stack([off, s, off, e, t], axis=1)
+
+
+def _diagonal_segments(residual: np.ndarray, min_length: float, thickness: float) -> np.ndarray:
+    """Straight strokes that are neither horizontal nor vertical, via probabilistic Hough
+
+    A thick stroke yields several parallel Hough lines, so lines with similar
+    angle and normal offset are merged into one segment spanning their extent.
+    """
+    lines = cv2.HoughLinesP(residual, 1, np.pi / 180, threshold=int(min_length / 2),
+                            minLineLength=min_length, maxLineGap=thickness * 2)
+    if lines is None:
+        return np.empty((0, 5), dtype=np.float32)
+    lines = lines.reshape(-1, 4).astype(np.float32)
+    angles = np.arctan2(lines[:, 3] - lines[:, 1], lines[:, 2] - lines[:, 0]) % np.pi
+    degrees = np.degrees(angles)
+    # Axis-aligned strokes are already covered by the morphological pass
+    diagonal = np.minimum(np.abs(degrees - 90), np.minimum(degrees, 180 - degrees)) > 10
+    lines, angles = lines[diagonal], angles[diagonal]
+    if len(lines) == 0:
+        return np.empty((0, 5), dtype=np.float32)
+
+    # Normal offset (rho) of each line, and its direction for projecting endpoints
+    direction = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    normal = np.stack([-direction[:, 1], direction[:, 0]], axis=1)
+    rho = np.einsum('ij,ij->i', lines[:, :2], normal)
+
+    angle_tol = np.radians(3)
+    # Both edges of a thick wall are detected, so allow for typical wall widths
+    rho_tol = max(thickness * 3.0, max(residual.shape) * 0.005)
+
+    # Greedy clustering around the longest remaining line
+    lengths = np.hypot(lines[:, 2] - lines[:, 0], lines[:, 3] - lines[:, 1])
+    unassigned = np.ones(len(lines), dtype=bool)
+    segments = []
+    for seed in np.argsort(-lengths):
+        if not unassigned[seed]:
+            continue
+        angle_diff = np.abs(angles - angles[seed])
+        angle_diff = np.minimum(angle_diff, np.pi - angle_diff)
+        group = np.flatnonzero(unassigned & (angle_diff <= angle_tol) & (np.abs(rho - rho[seed]) <= rho_tol))
+        unassigned[group] = False
+
+        points = lines[group].reshape(-1, 2)
+        along = points @ direction[seed]
+        start, end = points[np.argmin(along)], points[np.argmax(along)]
+        width = float(np.ptp(rho[group])) + thickness
+        segments.append([start[0], start[1], end[0], end[1], width])
+    return np.asarray(segments, dtype=np.float32)
+
+
+def _room_polygons(walls: np.ndarray, shape, door_gap: int, min_area: float, epsilon: float) -> List[Dict[str, Any]]:
+    """Closed rooms: enclosed free-space regions between the wall segments"""
+    mask = np.zeros(shape, dtype=np.uint8)
+    for x0, y0, x1, y1, t in walls:
+        cv2.line(mask, (int(x0), int(y0)), (int(x1), int(y1)), 255, max(int(round(t)), 1))
+    # Close door openings so rooms separated by a door are not merged
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (door_gap, door_gap)))
+
+    free = cv2.bitwise_not(mask)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(free, connectivity=4)
+
+    x, y, w, h, area = stats.T
+    touches_border = (x == 0) | (y == 0) | (x + w >= shape[1]) | (y + h >= shape[0])
+    # Label 0 is the wall mask itself; regions reaching the border are outside the building
+    candidates = np.flatnonzero(~touches_border & (area >= min_area))
+    candidates = candidates[candidates != 0]
+
+    rooms = []
+    for label in candidates:
+        x0, y0, rw, rh = x[label], y[label], w[label], h[label]
+        region = (labels[y0:y0 + rh, x0:x0 + rw] == label).astype(np.uint8)
+        contours, _ = cv2.findContours(region, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            continue
+        contour = max(contours, key=cv2.contourArea)
+        polygon = cv2.approxPolyDP(contour, epsilon, True)[:, 0, :] + (x0, y0)
+        rooms.append({'polygon': polygon.astype(np.float32), 'area': float(area[label])})
+    return rooms
+
+
+def extract_geometry(image: np.ndarray, min_wall_thickness: int = 3, min_wall_length: float = 0.02,
+                     door_gap: float = 0.015, min_room_area: float = 0.002) -> Dict[str, Any]:
+    """Wall centre lines and room polygons in image pixels
+
+    Length and gap parameters are fractions of the image's longest side, so
+    results do not depend on scan resolution. Strokes thinner than
+    min_wall_thickness pixels (at full resolution) such as dimension and hatch
+    lines are removed before lines are extracted.
+    """
+    started = time.perf_counter()
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+    factor = min(1.0, PROCESSING_SIDE / max(height, width))
+    small = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA) if factor < 1 else gray
+    side = max(small.shape)
+
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+    # Keep only strokes at least wall-thick, then pull out long horizontal and vertical runs
+    thickness = max(int(round(min_wall_thickness * factor)), 1)
+    if thickness > 1:
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (thickness, thickness)))
+    length = max(int(side * min_wall_length), 3)
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (length, 1)))
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, length)))
+
+    offset_tol = max(thickness * 2.0, 2.0)
+    gap_tol = max(side * door_gap * 0.25, 2.0)
+    h_segments = _merge_collinear(_axis_segments(horizontal, True), True, offset_tol, gap_tol)
+    v_segments = _merge_collinear(_axis_segments(vertical, False), False, offset_tol, gap_tol)
+
+    residual = cv2.bitwise_and(binary, cv2.bitwise_not(cv2.bitwise_or(horizontal, vertical)))
+    d_segments = _diagonal_segments(residual, length, thickness)
+
+    walls = np.vstack([h_segments.reshape(-1, 5), v_segments.reshape(-1, 5), d_segments])
+
+    rooms = _room_polygons(
+        walls, small.shape[:2],
+        door_gap=max(int(side * door_gap), 3),
+        min_area=side * side * min_room_area,
+        epsilon=max(thickness, 2.0)
+    )
+
+    # Back to full-resolution pixels
+    scale = 1.0 / factor
+    walls *= scale
+    for room in rooms:
+        room['polygon'] *= scale
+        room['area'] *= scale * scale
+
+    logger.info(f"Wall geometry: {len(walls)} walls, {len(rooms)} rooms in {time.perf_counter() - started:.2f}s")
+    return {'walls': walls, 'rooms': rooms}
+
+
+def _corner(a: np.ndarray, b: np.ndarray, fallback: np.ndarray, reach: float) -> np.ndarray:
+    """Intersection of the lines through segments a and b (x0, y0, x1, y1), or fallback when parallel or far off"""
+    da, db = a[2:4] - a[:2], b[2:4] - b[:2]
+    cross = da[0] * db[1] - da[1] * db[0]
+    if abs(cross) < 1e-6 * np.hypot(*da) * np.hypot(*db):
+        return fallback
+    t = ((b[0] - a[0]) * db[1] - (b[1] - a[1]) * db[0]) / cross
+    point = a[:2] + t * da
+    return point if np.hypot(*(point - fallback)) <= reach else fallback
+
+
+def _drop_straight(points: List[np.ndarray], closed: bool, max_turn: float = np.radians(3)) -> List[np.ndarray]:
+    """Remove interior vertices where the polyline continues straight on"""
+    kept = [points[0]]
+    for i in range(1, len(points) - 1):
+        before, after = points[i] - kept[-1], points[i + 1] - points[i]
+        turn = abs(np.arctan2(before[0] * after[1] - before[1] * after[0], before @ after))
+        if turn > max_turn:
+            kept.append(points[i])
+    kept.append(points[-1])
+    return kept if not closed or len(kept) > 3 else points
+
+
+def join_walls(walls: np.ndarray) -> List[Dict[str, Any]]:
+    """Chain wall segments that meet end to end into polylines
+
+    Segment ends closer than the walls' mean thickness are one node. Where
+    exactly two walls meet, they are chained and the vertex is placed at the
+    intersection of their centre lines (clean corners), and straight-through
+    vertices are dropped, so a wall broken by the extraction comes back as
+    one polyline. Junctions of three or more walls and free ends stop a
+    polyline. Each entry is {'points': (k, 2) array, 'thickness', 'closed'}
+    with a length-weighted thickness; a closed polyline repeats its first point.
+    """
+    count = len(walls)
+    if count == 0:
+        return []
+    ends = walls[:, :4].reshape(-1, 2).astype(np.float64)     # end 2i is the start of wall i, 2i + 1 its end
+    reach = np.repeat(walls[:, 4].astype(np.float64), 2)
+
+    # Union-find over segment ends, candidate pairs from a grid with cells as large as the thickest wall
+    parent = np.arange(2 * count)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    cell = max(float(reach.max()), 1.0)
+    grid: Dict[tuple, List[int]] = {}
+    for i, (x, y) in enumerate(ends):
+        grid.setdefault((int(x // cell), int(y // cell)), []).append(i)
+    for (gx, gy), members in grid.items():
+        nearby = [j for dx in (-1, 0, 1) for dy in (-1, 0, 1) for j in grid.get((gx + dx, gy + dy), ())]
+        for i in members:
+            for j in nearby:
+                if j > i and j // 2 != i // 2 and \
+                        np.hypot(*(ends[i] - ends[j])) <= (reach[i] + reach[j]) / 2 + 1:
+                    parent[find(i)] = find(j)
+
+    roots = np.array([find(i) for i in range(2 * count)])
+    node_ends: Dict[int, List[int]] = {}
+    for i, root in enumerate(roots):
+        node_ends.setdefault(int(root), []).append(i)
+
+    # Shared vertex of each two-wall node; other ends keep their own position
+    position = ends.copy()
+    partner = np.full(2 * count, -1)
+    for members in node_ends.values():
+        if len(members) != 2:
+            continue
+        i, j = members
+        partner[i], partner[j] = j, i
+        corner = _corner(walls[i // 2, :4].astype(np.float64), walls[j // 2, :4].astype(np.float64),
+                         (ends[i] + ends[j]) / 2, max(reach[i], reach[j]) * 2)
+        position[i] = position[j] = corner
+
+    def walk(end: int, visited: np.ndarray, chain: List[int]) -> int:
+        """Follow chained walls from end (leaving its wall); the last end reached"""
+        while partner[end] >= 0 and not visited[partner[end] // 2]:
+            nxt = partner[end]
+            visited[nxt // 2] = True
+            chain.append(nxt)
+            end = nxt ^ 1
+        return end
+
+    visited = np.zeros(count, dtype=bool)
+    polylines = []
+    for wall in range(count):
+        if visited[wall]:
+            continue
+        visited[wall] = True
+        # Extend backwards from the start, then forwards from the end
+        backward: List[int] = []
+        walk(2 * wall, visited, backward)
+        forward: List[int] = []
+        last = walk(2 * wall + 1, visited, forward)
+
+        # Ends in order along the polyline: each wall contributes the end it is entered by, then its other end
+        order = [e ^ 1 for e in reversed(backward)] + [2 * wall] + forward
+        points = [position[order[0]]] + [position[e ^ 1] for e in order]
+        members = [e // 2 for e in order]
+        closed = partner[last] >= 0 and partner[last] // 2 == members[0] and len(members) > 2
+
+        points = _drop_straight(points, closed)
+        lengths = np.hypot(walls[members, 2] - walls[members, 0], walls[members, 3] - walls[members, 1])
+        thickness = float(np.average(walls[members, 4], weights=np.maximum(lengths, 1e-6)))
+        polylines.append({'points': np.asarray(points, dtype=np.float64), 'thickness': thickness, 'closed': bool(closed)})
+    return polylines
+
+
+def geometry_response(geometry: Dict[str, Any], metres: Optional[float] = None) -> Dict[str, Any]:
+    """JSON-ready geometry, with lengths and areas in metres when the pixel size is known
+
+    Walls are serialised as polylines from join_walls.
+    """
+    wall_list = []
+    total = 0.0
+    for polyline in join_walls(geometry['walls']):
+        points = polyline['points']
+        wall_length = float(np.hypot(*np.diff(points, axis=0).T).sum())
+        thickness = polyline['thickness']
+        total += wall_length
+        wall = {
+            'points': points.tolist(),
+            'thickness': thickness,
+            'length': wall_length,
+            'closed': polyline['closed']
+        }
+        if metres:
+            wall['lengthM'] = wall_length * metres
+            wall['thicknessM'] = thickness * metres
+        wall_list.append(wall)
+
+    room_list = []
+    for room in geometry['rooms']:
+        entry = {'polygon': room['polygon'].tolist(), 'area': room['area']}
+        if metres:
+            entry['areaM2'] = room['area'] * metres * metres
+        room_list.append(entry)
+
+    return {
+        'walls': wall_list,
+        'rooms': room_list,
+        'metresPerPixel': metres,
+        'totalWallLength': total,
+        'totalWallLengthM': total * metres if metres else None
+    }
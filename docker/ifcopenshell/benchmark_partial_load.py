@@ -0,0 +1,171 @@
+"""
+Partial-load memory benchmark
+Compare peak RSS of a full ifcopenshell.open against storey-by-storey processing
+
+Usage:
+    python benchmark_partial_load.py model-a.ifc model-b.ifc
+    python benchmark_partial_load.py --synthetic 4 8 16 --walls-per-storey 2000
+
+Each measurement runs in a fresh subprocess so ru_maxrss reflects a single run.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import ifcopenshell
+import ifcopenshell.guid
+
+
+def generate_model(path: str, storeys: int, walls_per_storey: int) -> str:
+    """Write a synthetic IFC4 model with extruded walls and property sets"""
+    f = ifcopenshell.file(schema='IFC4')
+
+    owner = None
+    origin = f.createIfcCartesianPoint((0.0, 0.0, 0.0))
+    axis = f.createIfcAxis2Placement3D(origin, None, None)
+    context = f.createIfcGeometricRepresentationContext(None, 'Model', 3, 1.0e-5, axis, None)
+    units = f.createIfcUnitAssignment([f.createIfcSIUnit(None, 'LENGTHUNIT', None, 'METRE')])
+    project = f.createIfcProject(ifcopenshell.guid.new(), owner, 'Benchmark', None, None, None, None, [context], units)
+
+    site_placement = f.createIfcLocalPlacement(None, axis)
+    site = f.createIfcSite(ifcopenshell.guid.new(), owner, 'Site', None, None, site_placement,
+                           None, None, 'ELEMENT', None, None, None, None, None)
+    building_placement = f.createIfcLocalPlacement(site_placement, axis)
+    building = f.createIfcBuilding(ifcopenshell.guid.new(), owner, 'Building', None, None,
+                                   building_placement, None, None, 'ELEMENT', None, None, None)
+    f.createIfcRelAggregates(ifcopenshell.guid.new(), owner, None, None, project, [site])
+    f.createIfcRelAggregates(ifcopenshell.guid.new(), owner, None, None, site, [building])
+
+    profile = f.createIfcRectangleProfileDef('AREA', None, None, 4.0, 0.2)
+    direction = f.createIfcDirection((0.0, 0.0, 1.0))
+
+    storey_entities = []
+    for level in range(storeys):
+        storey_axis = f.createIfcAxis2Placement3D(f.createIfcCartesianPoint((0.0, 0.0, level * 3.0)), None, None)
+        storey_placement = f.createIfcLocalPlacement(building_placement, storey_axis)
+        storey = f.createIfcBuildingStorey(ifcopenshell.guid.new(), owner, f'Level {level}', None, None,
+                                           storey_placement, None, None, 'ELEMENT', level * 3.0)
+        storey_entities.append(storey)
+
+        walls = []
+        for index in range(walls_per_storey):
+            point = f.createIfcCartesianPoint((float(index % 50) * 5.0, float(index // 50) * 5.0, 0.0))
+            placement = f.createIfcLocalPlacement(storey_placement, f.createIfcAxis2Placement3D(point, None, None))
+            solid = f.createIfcExtrudedAreaSolid(profile, None, direction, 3.0)
+            shape = f.createIfcShapeRepresentation(context, 'Body', 'SweptSolid', [solid])
+            representation = f.createIfcProductDefinitionShape(None, None, [shape])
+            wall = f.createIfcWall(ifcopenshell.guid.new(), owner, f'Wall {level}-{index}', None, None,
+                                   placement, representation, None, None)
+            walls.append(wall)
+
+            pset = f.createIfcPropertySet(ifcopenshell.guid.new(), owner, 'Pset_WallCommon', None, [
+                f.createIfcPropertySingleValue('IsExternal', None, f.create_entity('IfcBoolean', index % 4 == 0), None),
+                f.createIfcPropertySingleValue('FireRating', None, f.create_entity('IfcLabel', 'EI60'), None),
+            ])
+            f.createIfcRelDefinesByProperties(ifcopenshell.guid.new(), owner, None, None, [wall], pset)
+
+            quantities = f.createIfcElementQuantity(ifcopenshell.guid.new(), owner, 'Qto_WallBaseQuantities', None, None, [
+                f.createIfcQuantityArea('NetSideArea', None, None, 12.0, None),
+                f.createIfcQuantityVolume('NetVolume', None, None, 2.4, None),
+            ])
+            f.createIfcRelDefinesByProperties(ifcopenshell.guid.new(), owner, None, None, [wall], quantities)
+
+        f.createIfcRelContainedInSpatialStructure(ifcopenshell.guid.new(), owner, None, None, walls, storey)
+
+    f.createIfcRelAggregates(ifcopenshell.guid.new(), owner, None, None, building, storey_entities)
+    f.write(path)
+    return path
+
+
+def _measure_full(path: str) -> dict:
+    """Open the whole file and process every wall"""
+    import ifcopenshell.geom
+    settings = ifcopenshell.geom.settings()
+
+    ifc_file = ifcopenshell.open(path)
+    shapes = 0
+    for element in ifc_file.by_type('IfcWall'):
+        ifcopenshell.geom.create_shape(settings, element)
+        shapes += 1
+    return {'shapes': shapes}
+
+
+def _measure_partial(path: str) -> dict:
+    """Process the file one storey at a time through StoreyIndex"""
+    import ifcopenshell.geom
+    from storey_loader import StoreyIndex
+    settings = ifcopenshell.geom.settings()
+
+    shapes = 0
+    with StoreyIndex(path) as index:
+        for _, storey_file in index.iter_storeys():
+            for element in storey_file.by_type('IfcWall'):
+                ifcopenshell.geom.create_shape(settings, element)
+                shapes += 1
+            del storey_file
+    return {'shapes': shapes}
+
+
+def _run_child(mode: str, path: str):
+    """Entry point for the measuring subprocess"""
+    started = time.perf_counter()
+    result = _measure_full(path) if mode == 'full' else _measure_partial(path)
+    result['seconds'] = time.perf_counter() - started
+    # ru_maxrss is kilobytes on Linux
+    result['peakRssMb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+def measure(mode: str, path: str) -> dict:
+    """Run one measurement in a fresh interpreter"""
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, path],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='IFC files to measure')
+    parser.add_argument('--synthetic', nargs='*', type=int, default=[],
+                        help='generate synthetic models with these storey counts')
+    parser.add_argument('--walls-per-storey', type=int, default=1000)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(*args.child)
+        return
+
+    files = list(args.files)
+    temp_dir = tempfile.mkdtemp()
+    for storeys in args.synthetic:
+        path = os.path.join(temp_dir, f'synthetic-{storeys}x{args.walls_per_storey}.ifc')
+        generate_model(path, storeys, args.walls_per_storey)
+        files.append(path)
+
+    results = []
+    for path in files:
+        row = {'file': os.path.basename(path), 'sizeMb': os.path.getsize(path) / (1024 * 1024)}
+        for mode in ('full', 'partial'):
+            row[mode] = measure(mode, path)
+        results.append(row)
+        print(
+            f"{row['file']:40s} {row['sizeMb']:8.1f} MB  "
+            f"full {row['full']['peakRssMb']:8.1f} MB / {row['full']['seconds']:6.1f} s  "
+            f"partial {row['partial']['peakRssMb']:8.1f} MB / {row['partial']['seconds']:6.1f} s",
+            file=sys.stderr
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+IFC element search index
+Inverted index over element names, types, property sets and values with numeric ranges
+"""
+
+import re
+import time
+import logging
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import ifcopenshell
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+(?:\.\d+)?')
+
+# Quantity classes store their value as the fourth attribute
+QUANTITY_VALUE_INDEX = 3
+
+RANGE_OPERATORS = {'gt', 'gte', 'lt', 'lte', 'between'}
+
+
+def tokenize(text: Any) -> List[str]:
+    """Split names, CamelCase identifiers and values into lowercase tokens"""
+    if text is None:
+        return []
+    return [token.lower() for token in TOKEN_PATTERN.findall(str(text))]
+
+
+class PropertySearchIndex:
+    """Inverted index for element search
+
+    Postings are built as Python lists while models are added, then frozen
+    into sorted NumPy arrays so that queries are array intersections and
+    numeric ranges are two binary searches.
+    """
+
+    def __init__(self, schema: Optional[str] = None):
+        self.schema = schema
+        self.element_ids: List[int] = []
+        self.element_types: List[str] = []
+
+        self._doc_lookup: Dict[int, int] = {}
+        self._terms: Dict[str, List[int]] = {}
+        self._types: Dict[str, List[int]] = {}
+        self._values: Dict[str, Dict[str, List[int]]] = {}
+        self._numbers: Dict[str, List[tuple]] = {}
+
+        self._vocabulary: List[str] = []
+        self._numeric: Dict[str, tuple] = {}
+        self._frozen = False
+        self.build_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_file(cls, ifc_file: ifcopenshell.file) -> 'PropertySearchIndex':
+        """Index a fully opened model"""
+        index = cls(ifc_file.schema)
+        index.add_model(ifc_file)
+        return index.finalize()
+
+    def add_model(self, ifc_file: ifcopenshell.file):
+        """Add every product of an open file (or storey partition) to the index"""
+        started = time.perf_counter()
+        if self.schema is None:
+            self.schema = ifc_file.schema
+
+        for product in ifc_file.by_type('IfcProduct'):
+            self._add_document(product)
+
+        # Walk relationships once rather than IsDefinedBy per element
+        for rel in ifc_file.by_type('IfcRelDefinesByProperties'):
+            docs = self._docs_for(rel.RelatedObjects)
+            if docs:
+                self._add_property_definition(docs, rel.RelatingPropertyDefinition)
+
+        for rel in ifc_file.by_type('IfcRelDefinesByType'):
+            docs = self._docs_for(rel.RelatedObjects)
+            element_type = rel.RelatingType
+            if not docs or element_type is None:
+                continue
+            self._add_terms(docs, element_type.is_a())
+            self._add_terms(docs, getattr(element_type, 'Name', None))
+            for definition in getattr(element_type, 'HasPropertySets', None) or []:
+                self._add_property_definition(docs, definition)
+
+        self.build_seconds += time.perf_counter() - started
+
+    def _add_document(self, product):
+        if product.id() in self._doc_lookup:
+            return
+        doc = len(self.element_ids)
+        self._doc_lookup[product.id()] = doc
+        self.element_ids.append(product.id())
+        self.element_types.append(product.is_a())
+
+        self._types.setdefault(product.is_a(), []).append(doc)
+        self._add_terms([doc], product.is_a())
+        self._add_terms([doc], getattr(product, 'Name', None))
+        self._add_terms([doc], getattr(product, 'Description', None))
+        self._add_terms([doc], getattr(product, 'ObjectType', None))
+        self._add_value([doc], 'name', getattr(product, 'Name', None))
+
+    def _docs_for(self, objects: Iterable) -> List[int]:
+        return [self._doc_lookup[o.id()] for o in objects or [] if o.id() in self._doc_lookup]
+
+    def _add_property_definition(self, docs: List[int], definition):
+        if definition is None:
+            return
+        set_name = getattr(definition, 'Name', None) or ''
+        self._add_terms(docs, set_name)
+
+        if definition.is_a('IfcPropertySet'):
+            for prop in definition.HasProperties:
+                if prop.is_a('IfcPropertySingleValue'):
+                    value = prop.NominalValue.wrappedValue if prop.NominalValue else None
+                    self._add_property(docs, set_name, prop.Name, value)
+                elif prop.is_a('IfcPropertyEnumeratedValue'):
+                    for value in prop.EnumerationValues or []:
+                        self._add_property(docs, set_name, prop.Name, value.wrappedValue)
+        elif definition.is_a('IfcElementQuantity'):
+            for quantity in definition.Quantities:
+                if quantity.is_a('IfcPhysicalSimpleQuantity'):
+                    self._add_property(docs, set_name, quantity.Name, quantity[QUANTITY_VALUE_INDEX])
+
+    def _add_property(self, docs: List[int], set_name: str, name: str, value: Any):
+        self._add_terms(docs, name)
+        for key in (f'{set_name}.{name}'.lower(), name.lower()):
+            self._add_value(docs, key, value)
+
+    def _add_value(self, docs: List[int], key: str, value: Any):
+        if value is None:
+            return
+        if isinstance(value, bool):
+            self._values.setdefault(key, {}).setdefault(str(value).lower(), []).extend(docs)
+        elif isinstance(value, (int, float)):
+            self._numbers.setdefault(key, []).extend((float(value), doc) for doc in docs)
+        else:
+            self._values.setdefault(key, {}).setdefault(str(value).lower(), []).extend(docs)
+            self._add_terms(docs, value)
+
+    def _add_terms(self, docs: List[int], text: Any):
+        for token in tokenize(text):
+            self._terms.setdefault(token, []).extend(docs)
+
+    def finalize(self) -> 'PropertySearchIndex':
+        """Freeze postings into sorted, de-duplicated arrays"""
+        started = time.perf_counter()
+
+        def freeze(postings):
+            return np.unique(np.asarray(postings, dtype=np.int32))
+
+        self._terms = {term: freeze(docs) for term, docs in self._terms.items()}
+        self._types = {name: freeze(docs) for name, docs in self._types.items()}
+        self._values = {
+            key: {value: freeze(docs) for value, docs in values.items()}
+            for key, values in self._values.items()
+        }
+        for key, pairs in self._numbers.items():
+            values = np.fromiter((v for v, _ in pairs), dtype=np.float64, count=len(pairs))
+            docs = np.fromiter((d for _, d in pairs), dtype=np.int32, count=len(pairs))
+            order = np.argsort(values, kind='stable')
+            self._numeric[key] = (values[order], docs[order])
+        self._numbers = {}
+
+        self._vocabulary = sorted(self._terms)
+        self._frozen = True
+        self.build_seconds += time.perf_counter() - started
+
+        logger.info(
+            f"Search index: {len(self.element_ids)} elements, {len(self._vocabulary)} terms, "
+            f"{len(self._numeric)} numeric attributes in {self.build_seconds:.2f}s"
+        )
+        return self
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def search(self, text: Optional[str] = None, types: Optional[List[str]] = None,
+               filters: Optional[List[Dict[str, Any]]] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Return element ids matching all of the text, type and attribute criteria"""
+        if not self._frozen:
+            raise RuntimeError('Search index must be finalized before querying')
+
+        started = time.perf_counter()
+        candidates = None
+
+        for token in tokenize(text):
+            candidates = self._intersect(candidates, self._prefix_postings(token))
+
+        if types:
+            candidates = self._intersect(candidates, self._type_postings(types))
+
+        for condition in filters or []:
+            candidates = self._intersect(candidates, self._filter_postings(condition))
+
+        if candidates is None:
+            candidates = np.arange(len(self.element_ids), dtype=np.int32)
+
+        total = len(candidates)
+        if limit is not None:
+            candidates = candidates[:limit]
+
+        return {
+            'elementIds': [f'#{self.element_ids[doc]}' for doc in candidates],
+            'total': int(total),
+            'tookMs': (time.perf_counter() - started) * 1000
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'elements': len(self.element_ids),
+            'terms': len(self._vocabulary),
+            'attributes': len(set(self._values) | set(self._numeric)),
+            'buildSeconds': self.build_seconds
+        }
+
+    @staticmethod
+    def _intersect(current, postings):
+        if current is None:
+            return postings
+        return np.intersect1d(current, postings, assume_unique=True)
+
+    def _prefix_postings(self, token: str) -> np.ndarray:
+        """Union of postings of every term starting with token"""
+        start = bisect_left(self._vocabulary, token)
+        matches = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            matches.append(self._terms[term])
+        if not matches:
+            return np.empty(0, dtype=np.int32)
+        return matches[0] if len(matches) == 1 else np.unique(np.concatenate(matches))
+
+    def _type_postings(self, types: List[str]) -> np.ndarray:
+        """Postings for the requested IFC classes, including their subtypes"""
+        wanted = {t.lower() for t in types}
+        matches = [docs for name, docs in self._types.items() if self._is_subtype(name, wanted)]
+        if not matches:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(matches))
+
+    def _is_subtype(self, type_name: str, wanted: Set[str]) -> bool:
+        try:
+            declaration = ifcopenshell.ifcopenshell_wrapper.schema_by_name(self.schema).declaration_by_name(type_name)
+        except Exception:
+            return type_name.lower() in wanted
+        while declaration is not None:
+            if declaration.name().lower() in wanted:
+                return True
+            declaration = declaration.supertype()
+        return False
+
+    def _filter_postings(self, condition: Dict[str, Any]) -> np.ndarray:
+        """Postings for one attribute condition
+
+        condition: {'property': 'Pset_WallCommon.IsExternal', 'op': 'eq', 'value': True}
+        op is one of eq, gt, gte, lt, lte, between (value [low, high]) or exists.
+        """
+        key = condition['property'].lower()
+        op = condition.get('op', 'eq')
+        value = condition.get('value')
+
+        if op == 'exists':
+            parts = [docs for docs in self._values.get(key, {}).values()]
+            if key in self._numeric:
+                parts.append(self._numeric[key][1])
+            return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int32)
+
+        if op in RANGE_OPERATORS or (op == 'eq' and isinstance(value, (int, float)) and not isinstance(value, bool)):
+            return self._range_postings(key, op, value)
+
+        if op == 'eq':
+            return self._values.get(key, {}).get(str(value).lower(), np.empty(0, dtype=np.int32))
+
+        raise ValueError(f'Unsupported filter operator: {op}')
+
+    def _range_postings(self, key: str, op: str, value: Any) -> np.ndarray:
+        if key not in self._numeric:
+            return np.empty(0, dtype=np.int32)
+        values, docs = self._numeric[key]
+
+        if op == 'between':
+            low, high = value
+            start, end = np.searchsorted(values, low, 'left'), np.searchsorted(values, high, 'right')
+        elif op == 'eq':
+            start, end = np.searchsorted(values, value, 'left'), np.searchsorted(values, value, 'right')
+        elif op == 'gt':
+            start, end = np.searchsorted(values, value, 'right'), len(values)
+        elif op == 'gte':
+            start, end = np.searchsorted(values, value, 'left'), len(values)
+        elif op == 'lt':
+            start, end = 0, np.searchsorted(values, value, 'left')
+        else:
+            start, end = 0, np.searchsorted(values, value, 'right')
+
+        return np.unique(docs[start:end])
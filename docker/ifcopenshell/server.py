@@ -13,6 +13,12 @@ import tempfile
 import os
 from urllib.parse import urlparse
 import urllib.request
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from storey_loader import StoreyIndex, spatial_node
+from search_index import PropertySearchIndex
 
 app = Flask(__name__)
 CORS(app)
@@ -21,6 +27,85 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Files above this size are processed one storey at a time unless the
+# request sets 'partial' explicitly
+PARTIAL_LOAD_THRESHOLD_MB = float(os.environ.get('PARTIAL_LOAD_THRESHOLD_MB', '500'))
+
+class ModelCache:
+    """Thread-safe LRU cache of per-model artifacts with a time-to-live
+
+    Expensive artifacts are built under build_lock(key), so concurrent misses
+    for one model wait for a single build instead of each running their own.
+    """
+
+    def __init__(self, max_entries=32, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    @contextmanager
+    def build_lock(self, key):
+        """Hold the per-key build lock; callers re-check the cache once inside"""
+        with self._lock:
+            lock = self._build_locks.setdefault(key, threading.Lock())
+        with lock:
+            try:
+                yield
+            finally:
+                # Waiters already hold the lock object; later callers find the built entry
+                with self._lock:
+                    if self._build_locks.get(key) is lock:
+                        del self._build_locks[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttlSeconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+# Derived per-model data (spatial trees, search indexes), keyed by artifact and file URL
+model_cache = ModelCache(
+    max_entries=int(os.environ.get('MODEL_CACHE_SIZE', '32')),
+    ttl_seconds=float(os.environ.get('MODEL_CACHE_TTL', '3600'))
+)
+
+# Search indexes are far larger than the other artifacts, so they get their own, smaller bound
+search_cache = ModelCache(
+    max_entries=int(os.environ.get('SEARCH_INDEX_CACHE_SIZE', '4')),
+    ttl_seconds=float(os.environ.get('MODEL_CACHE_TTL', '3600'))
+)
+
 def download_ifc_file(file_url):
     """Download IFC file from URL"""
     try:
@@ -31,13 +116,232 @@ def download_ifc_file(file_url):
         logger.error(f"Error downloading file: {e}")
         return None
 
+def use_partial_load(data, file_path):
+    """Decide whether to process a file storey by storey"""
+    if 'partial' in data:
+        return bool(data['partial'])
+    return os.path.getsize(file_path) > PARTIAL_LOAD_THRESHOLD_MB * 1024 * 1024
+
+def storey_index(data, file_path):
+    """Storey index for a downloaded model, reused while the model's content is unchanged
+
+    Every download lands in a new temp file, so the index is cached by file
+    URL and checked against the file's size and content digest, which is
+    much cheaper than re-indexing. The returned view reads from file_path.
+    """
+    cache_key = ('storey-index', data['fileUrl'])
+    index = model_cache.get(cache_key)
+    if index is None or data.get('refresh') or not index.matches(file_path):
+        with model_cache.build_lock(cache_key):
+            index = model_cache.get(cache_key)
+            if index is None or data.get('refresh') or not index.matches(file_path):
+                index = StoreyIndex(file_path)
+                model_cache.put(cache_key, index)
+    return index.bind(file_path)
+
+def parse_entity_id(entity_id):
+    """Convert '#123' or 123 to an integer step id"""
+    return int(str(entity_id).replace('#', ''))
+
+def extract_entity_geometry(settings, entity):
+    """Triangulate a single element into the /geometry response format"""
+    # Create geometry
+    shape = ifcopenshell.geom.create_shape(settings, entity)
+
+    # Extract vertices and faces
+    geometry_data = shape.geometry
+
+    verts = geometry_data.verts
+    faces = geometry_data.faces
+
+    # Convert to lists
+    vertices = [[verts[i], verts[i+1], verts[i+2]]
+               for i in range(0, len(verts), 3)]
+    faces_list = [[faces[i], faces[i+1], faces[i+2]]
+                 for i in range(0, len(faces), 3)]
+
+    # Get material
+    materials = []
+    if hasattr(entity, 'HasAssociations'):
+        for association in entity.HasAssociations:
+            if association.is_a('IfcRelAssociatesMaterial'):
+                material = association.RelatingMaterial
+                if material.is_a('IfcMaterial'):
+                    materials.append({
+                        'name': material.Name or 'Unnamed',
+                        'color': {'r': 0.8, 'g': 0.8, 'b': 0.8, 'a': 1.0}
+                    })
+
+    return {
+        'type': 'mesh',
+        'vertices': vertices[:100],  # Limit for response size
+        'faces': faces_list[:100],
+        'materials': materials
+    }
+
+def extract_property_sets(entity):
+    """Collect property sets for an element, falling back to basic attributes"""
+    property_sets = []
+
+    # Get property sets
+    if hasattr(entity, 'IsDefinedBy'):
+        for definition in entity.IsDefinedBy:
+            if definition.is_a('IfcRelDefinesByProperties'):
+                property_set = definition.RelatingPropertyDefinition
+
+                if property_set.is_a('IfcPropertySet'):
+                    properties = []
+
+                    for prop in property_set.HasProperties:
+                        if prop.is_a('IfcPropertySingleValue'):
+                            prop_value = prop.NominalValue
+                            properties.append({
+                                'name': prop.Name,
+                                'value': prop_value.wrappedValue if prop_value else None,
+                                'type': prop_value.is_a() if prop_value else 'IfcLabel',
+                                'unit': None
+                            })
+
+                    property_sets.append({
+                        'name': property_set.Name,
+                        'description': property_set.Description or '',
+                        'properties': properties
+                    })
+
+    # If no property sets, return basic properties
+    if not property_sets:
+        basic_properties = []
+        if hasattr(entity, 'Name'):
+            basic_properties.append({
+                'name': 'Name',
+                'value': entity.Name,
+                'type': 'IfcLabel'
+            })
+        if hasattr(entity, 'Description'):
+            basic_properties.append({
+                'name': 'Description',
+                'value': entity.Description,
+                'type': 'IfcText'
+            })
+
+        property_sets.append({
+            'name': 'Basic Properties',
+            'description': 'Basic element properties',
+            'properties': basic_properties
+        })
+
+    return property_sets
+
+def build_spatial_tree(ifc_file):
+    """Project->Site->Building->Storey->Space->Element tree of an open model"""
+    projects = ifc_file.by_type('IfcProject')
+    if not projects:
+        return None
+
+    def build(entity, visited):
+        visited.add(entity.id())
+        children = []
+        for rel in getattr(entity, 'IsDecomposedBy', []):
+            children.extend(rel.RelatedObjects)
+        for rel in getattr(entity, 'ContainsElements', []):
+            children.extend(rel.RelatedElements)
+        return spatial_node(
+            entity.id(),
+            entity.is_a(),
+            getattr(entity, 'Name', None),
+            [build(child, visited) for child in children if child.id() not in visited]
+        )
+
+    return build(projects[0], set())
+
+def count_tree_nodes(node):
+    """Total number of nodes below and including a tree node"""
+    return 1 + sum(count_tree_nodes(child) for child in node.get('children', []))
+
+def get_search_index(data):
+    """Return the cached search index for a model, building it once on first use"""
+    cache_key = ('search-index', data['fileUrl'])
+    if data.get('refresh'):
+        search_cache.invalidate(cache_key)
+
+    index = search_cache.get(cache_key)
+    if index is not None:
+        return index, True
+
+    with search_cache.build_lock(cache_key):
+        # Another request may have built it while we waited
+        index = search_cache.get(cache_key)
+        if index is not None:
+            return index, True
+
+        file_path = download_ifc_file(data['fileUrl'])
+        if not file_path:
+            raise IOError('Failed to download file')
+
+        try:
+            if use_partial_load(data, file_path):
+                with storey_index(data, file_path) as storeys:
+                    index = PropertySearchIndex(storeys.schema)
+                    for _, storey_file in storeys.iter_storeys():
+                        index.add_model(storey_file)
+                        del storey_file
+                    index.finalize()
+            else:
+                index = PropertySearchIndex.from_file(ifcopenshell.open(file_path))
+        finally:
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+
+        search_cache.put(cache_key, index)
+    return index, False
+
+def storey_elements(storey):
+    """Elements contained in a storey or in the spaces that decompose it"""
+    elements = []
+    spatial = [storey]
+    while spatial:
+        structure = spatial.pop()
+        for rel in getattr(structure, 'ContainsElements', []):
+            elements.extend(rel.RelatedElements)
+        for rel in getattr(structure, 'IsDecomposedBy', []):
+            spatial.extend(rel.RelatedObjects)
+    return elements
+
+def quantity_takeoff(storey):
+    """Sum element counts, areas and volumes for one storey"""
+    takeoff = {
+        'storeyId': f'#{storey.id()}',
+        'name': storey.Name,
+        'elementCounts': {},
+        'totalArea': 0.0,
+        'totalVolume': 0.0
+    }
+
+    for element in storey_elements(storey):
+        element_type = element.is_a()
+        takeoff['elementCounts'][element_type] = takeoff['elementCounts'].get(element_type, 0) + 1
+
+        for definition in getattr(element, 'IsDefinedBy', []):
+            if definition.is_a('IfcRelDefinesByProperties'):
+                prop_set = definition.RelatingPropertyDefinition
+                if prop_set.is_a('IfcElementQuantity'):
+                    for quantity in prop_set.Quantities:
+                        if quantity.is_a('IfcQuantityArea'):
+                            takeoff['totalArea'] += quantity.AreaValue
+                        elif quantity.is_a('IfcQuantityVolume'):
+                            takeoff['totalVolume'] += quantity.VolumeValue
+
+    return takeoff
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'ifcopenshell',
-        'version': ifcopenshell.version
+        'version': ifcopenshell.version,
+        'cache': model_cache.stats(),
+        'searchIndexCache': search_cache.stats()
     })
 
 @app.route('/validate', methods=['POST'])
@@ -144,57 +448,82 @@ def extract_geometry():
             return jsonify({'error': 'Failed to download file'}), 500
 
         try:
-            ifc_file = ifcopenshell.open(file_path)
-
             # Setup geometry settings
             settings = ifcopenshell.geom.settings()
             settings.set(settings.USE_WORLD_COORDS, True)
 
-            entity_ids = data.get('entityIds', [])
+            entity_ids = [parse_entity_id(eid) for eid in data.get('entityIds', [])]
+            limit = data.get('limit', 10)  # Limit for demo
             geometries = {}
 
+            if use_partial_load(data, file_path):
+                storeys = []
+                unassigned = []
+                missing = []
+                with storey_index(data, file_path) as index:
+                    if entity_ids:
+                        entity_storeys = {eid: index.storey_of(eid) for eid in entity_ids}
+                        storey_ids = set(entity_storeys.values()) - {None}
+                        # Ids outside every storey partition: unknown ids are reported, the rest loaded below
+                        for eid, sid in entity_storeys.items():
+                            if sid is None:
+                                (unassigned if index.type_of(eid) is not None else missing).append(eid)
+                    else:
+                        storey_ids = set(parse_entity_id(sid) for sid in data.get('storeyIds', [])) or set(index.storey_ids)
+
+                    for storey_id in index.storey_ids:
+                        if storey_id not in storey_ids or (not entity_ids and len(geometries) >= limit):
+                            continue
+
+                        extracted = len(geometries)
+                        with index.open_storey(storey_id) as storey_file:
+                            if entity_ids:
+                                entities = [storey_file.by_id(eid) for eid, sid in entity_storeys.items()
+                                            if sid == storey_id]
+                            else:
+                                entities = storey_file.by_type('IfcBuildingElement')[:limit - len(geometries)]
+
+                            for entity in entities:
+                                try:
+                                    geometries[f'#{entity.id()}'] = extract_entity_geometry(settings, entity)
+                                except Exception as e:
+                                    logger.warning(f"Could not extract geometry for {entity.id()}: {e}")
+                            del entities
+
+                        storeys.append({
+                            'storeyId': f'#{storey_id}',
+                            'geometryCount': len(geometries) - extracted
+                        })
+
+                if unassigned:
+                    logger.warning(f"{len(unassigned)} requested ids are not in any storey, opening full model")
+                    ifc_file = ifcopenshell.open(file_path)
+                    for eid in unassigned:
+                        try:
+                            geometries[f'#{eid}'] = extract_entity_geometry(settings, ifc_file.by_id(eid))
+                        except Exception as e:
+                            logger.warning(f"Could not extract geometry for {eid}: {e}")
+                    del ifc_file
+
+                return jsonify({
+                    'geometries': geometries,
+                    'storeys': storeys,
+                    'unassigned': [f'#{eid}' for eid in unassigned],
+                    'missing': [f'#{eid}' for eid in missing]
+                })
+
+            ifc_file = ifcopenshell.open(file_path)
+
             # Get entities to process
             if entity_ids:
-                entities = [ifc_file.by_id(int(eid.replace('#', ''))) for eid in entity_ids]
+                entities = [ifc_file.by_id(eid) for eid in entity_ids]
             else:
                 # Get all building elements
-                entities = ifc_file.by_type('IfcBuildingElement')[:10]  # Limit for demo
+                entities = ifc_file.by_type('IfcBuildingElement')[:limit]
 
             for entity in entities:
                 try:
-                    # Create geometry
-                    shape = ifcopenshell.geom.create_shape(settings, entity)
-
-                    # Extract vertices and faces
-                    geometry_data = shape.geometry
-
-                    verts = geometry_data.verts
-                    faces = geometry_data.faces
-
-                    # Convert to lists
-                    vertices = [[verts[i], verts[i+1], verts[i+2]]
-                               for i in range(0, len(verts), 3)]
-                    faces_list = [[faces[i], faces[i+1], faces[i+2]]
-                                 for i in range(0, len(faces), 3)]
-
-                    # Get material
-                    materials = []
-                    if hasattr(entity, 'HasAssociations'):
-                        for association in entity.HasAssociations:
-                            if association.is_a('IfcRelAssociatesMaterial'):
-                                material = association.RelatingMaterial
-                                if material.is_a('IfcMaterial'):
-                                    materials.append({
-                                        'name': material.Name or 'Unnamed',
-                                        'color': {'r': 0.8, 'g': 0.8, 'b': 0.8, 'a': 1.0}
-                                    })
-
-                    geometries[f'#{entity.id()}'] = {
-                        'type': 'mesh',
-                        'vertices': vertices[:100],  # Limit for response size
-                        'faces': faces_list[:100],
-                        'materials': materials
-                    }
+                    geometries[f'#{entity.id()}'] = extract_entity_geometry(settings, entity)
 
                 except Exception as e:
                     logger.warning(f"Could not extract geometry for {entity.id()}: {e}")
@@ -224,67 +553,194 @@ def get_properties():
             return jsonify({'error': 'Failed to download file'}), 500
 
         try:
+            entity_id = parse_entity_id(data['entityId'])
+
+            if use_partial_load(data, file_path):
+                with storey_index(data, file_path) as index:
+                    storey_id = index.storey_of(entity_id)
+                    if storey_id is not None:
+                        with index.open_storey(storey_id) as storey_file:
+                            property_sets = extract_property_sets(storey_file.by_id(entity_id))
+                        return jsonify({'propertySets': property_sets, 'storeyId': f'#{storey_id}'})
+
+                logger.warning(f"#{entity_id} is not in any storey, opening full model")
+
             ifc_file = ifcopenshell.open(file_path)
-            entity_id = int(data['entityId'].replace('#', ''))
             entity = ifc_file.by_id(entity_id)
 
-            property_sets = []
-
-            # Get property sets
-            if hasattr(entity, 'IsDefinedBy'):
-                for definition in entity.IsDefinedBy:
-                    if definition.is_a('IfcRelDefinesByProperties'):
-                        property_set = definition.RelatingPropertyDefinition
-
-                        if property_set.is_a('IfcPropertySet'):
-                            properties = []
-
-                            for prop in property_set.HasProperties:
-                                if prop.is_a('IfcPropertySingleValue'):
-                                    prop_value = prop.NominalValue
-                                    properties.append({
-                                        'name': prop.Name,
-                                        'value': prop_value.wrappedValue if prop_value else None,
-                                        'type': prop_value.is_a() if prop_value else 'IfcLabel',
-                                        'unit': None
-                                    })
-
-                            property_sets.append({
-                                'name': property_set.Name,
-                                'description': property_set.Description or '',
-                                'properties': properties
-                            })
+            property_sets = extract_property_sets(entity)
 
-            # If no property sets, return basic properties
-            if not property_sets:
-                basic_properties = []
-                if hasattr(entity, 'Name'):
-                    basic_properties.append({
-                        'name': 'Name',
-                        'value': entity.Name,
-                        'type': 'IfcLabel'
-                    })
-                if hasattr(entity, 'Description'):
-                    basic_properties.append({
-                        'name': 'Description',
-                        'value': entity.Description,
-                        'type': 'IfcText'
-                    })
+            return jsonify({'propertySets': property_sets})
+
+        finally:
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+
+    except Exception as e:
+        logger.error(f"Property extraction error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/quantities', methods=['POST'])
+def get_quantities():
+    """Quantity takeoff per building storey"""
+    try:
+        data = request.get_json()
+
+        if not data or 'fileUrl' not in data:
+            return jsonify({'error': 'No file URL provided'}), 400
+
+        file_path = download_ifc_file(data['fileUrl'])
+        if not file_path:
+            return jsonify({'error': 'Failed to download file'}), 500
+
+        try:
+            storeys = []
+
+            if use_partial_load(data, file_path):
+                with storey_index(data, file_path) as index:
+                    for storey_id, storey_file in index.iter_storeys():
+                        storeys.append(quantity_takeoff(storey_file.by_id(storey_id)))
+                        del storey_file
+            else:
+                ifc_file = ifcopenshell.open(file_path)
+                storeys = [quantity_takeoff(storey) for storey in ifc_file.by_type('IfcBuildingStorey')]
+
+            element_counts = {}
+            for storey in storeys:
+                for element_type, count in storey['elementCounts'].items():
+                    element_counts[element_type] = element_counts.get(element_type, 0) + count
+
+            return jsonify({
+                'storeys': storeys,
+                'totals': {
+                    'elementCounts': element_counts,
+                    'totalArea': sum(storey['totalArea'] for storey in storeys),
+                    'totalVolume': sum(storey['totalVolume'] for storey in storeys)
+                }
+            })
 
-                property_sets.append({
-                    'name': 'Basic Properties',
-                    'description': 'Basic element properties',
-                    'properties': basic_properties
+        finally:
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+
+    except Exception as e:
+        logger.error(f"Quantity takeoff error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/storeys', methods=['POST'])
+def list_storeys():
+    """List building storeys from the partial-load index without opening the model"""
+    try:
+        data = request.get_json()
+
+        if not data or 'fileUrl' not in data:
+            return jsonify({'error': 'No file URL provided'}), 400
+
+        file_path = download_ifc_file(data['fileUrl'])
+        if not file_path:
+            return jsonify({'error': 'Failed to download file'}), 500
+
+        try:
+            with storey_index(data, file_path) as index:
+                return jsonify({
+                    'storeys': index.storeys(),
+                    'fileSize': index.file_size
                 })
 
-            return jsonify({'propertySets': property_sets})
+        finally:
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+
+    except Exception as e:
+        logger.error(f"Storey index error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/spatial-tree', methods=['POST'])
+def get_spatial_tree():
+    """Complete spatial structure hierarchy in one response, cached per model"""
+    try:
+        data = request.get_json()
+
+        if not data or 'fileUrl' not in data:
+            return jsonify({'error': 'No file URL provided'}), 400
+
+        cache_key = ('spatial-tree', data['fileUrl'])
+        if data.get('refresh'):
+            model_cache.invalidate(cache_key)
+
+        cached = model_cache.get(cache_key)
+        if cached is not None:
+            return jsonify({**cached, 'cached': True})
+
+        file_path = download_ifc_file(data['fileUrl'])
+        if not file_path:
+            return jsonify({'error': 'Failed to download file'}), 500
+
+        try:
+            if use_partial_load(data, file_path):
+                # Names and types come straight from the index; no model is opened
+                with storey_index(data, file_path) as index:
+                    tree = index.spatial_tree()
+            else:
+                tree = build_spatial_tree(ifcopenshell.open(file_path))
+
+            if tree is None:
+                return jsonify({'error': 'No IfcProject found'}), 422
+
+            result = {'tree': tree, 'nodeCount': count_tree_nodes(tree)}
+            model_cache.put(cache_key, result)
+
+            return jsonify({**result, 'cached': False})
 
         finally:
             if os.path.exists(file_path):
                 os.unlink(file_path)
 
     except Exception as e:
-        logger.error(f"Property extraction error: {e}")
+        logger.error(f"Spatial tree error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search/index', methods=['POST'])
+def build_search_index():
+    """Build (or refresh) the search index for a model ahead of queries"""
+    try:
+        data = request.get_json()
+
+        if not data or 'fileUrl' not in data:
+            return jsonify({'error': 'No file URL provided'}), 400
+
+        index, cached = get_search_index(data)
+        return jsonify({**index.stats(), 'cached': cached})
+
+    except Exception as e:
+        logger.error(f"Search index error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search', methods=['POST'])
+def search_elements():
+    """Find elements by text, IFC class and property/quantity conditions"""
+    try:
+        data = request.get_json()
+
+        if not data or 'fileUrl' not in data:
+            return jsonify({'error': 'No file URL provided'}), 400
+
+        index, cached = get_search_index(data)
+
+        try:
+            result = index.search(
+                text=data.get('query'),
+                types=data.get('types'),
+                filters=data.get('filters'),
+                limit=data.get('limit')
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f'Invalid query: {e}'}), 400
+
+        return jsonify({**result, 'cached': cached})
+
+    except Exception as e:
+        logger.error(f"Search error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/relationships', methods=['POST'])
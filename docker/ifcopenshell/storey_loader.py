@@ -0,0 +1,490 @@
+"""
+Storey-partitioned IFC loading
+Index a STEP file by IfcBuildingStorey containment and open one storey at a time
+"""
+
+import copy
+import gc
+import hashlib
+import os
+import re
+import tempfile
+import logging
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import ifcopenshell
+
+logger = logging.getLogger(__name__)
+
+RECORD_PATTERN = re.compile(rb'^#(\d+)\s*=\s*([A-Za-z0-9_]+)\s*\(')
+REFERENCE_PATTERN = re.compile(rb'#(\d+)')
+FIRST_REFERENCE_PATTERN = re.compile(rb'\s*#(\d+)')
+FILE_SCHEMA_PATTERN = re.compile(rb"FILE_SCHEMA\s*\(\s*\(\s*'([^']+)'")
+STEP_UNICODE_PATTERN = re.compile(r'\\X2\\((?:[0-9A-F]{4})+)\\X0\\')
+STEP_LATIN_PATTERN = re.compile(r'\\X\\([0-9A-F]{2})')
+
+# IfcRoot prefix of a relationship: GlobalId and OwnerHistory
+ROOT_PREFIX_PATTERN = re.compile(rb"\(\s*'[^']*'\s*,\s*(?:#\d+|\$)\s*,")
+
+# Tails of the two relationships that define the spatial tree:
+# IfcRelContainedInSpatialStructure(..., RelatedElements, RelatingStructure)
+# IfcRelAggregates(..., RelatingObject, RelatedObjects)
+CONTAINMENT_TAIL_PATTERN = re.compile(rb'\(([^()]*)\)\s*,\s*#(\d+)\s*\)\s*;$')
+AGGREGATION_TAIL_PATTERN = re.compile(rb'#(\d+)\s*,\s*\(([^()]*)\)\s*\)\s*;$')
+
+# Relationships that fan out to the whole model and would pull every storey
+# into every partition.
+SKIPPED_RELATIONSHIPS = {b'IFCRELDECLARES'}
+
+
+def split_arguments(record: bytes) -> List[bytes]:
+    """Split the top-level arguments of a STEP instance record"""
+    start = record.index(b'(') + 1
+    end = record.rindex(b')')
+    body = record[start:end]
+
+    args = []
+    depth = 0
+    in_string = False
+    current = start_index = 0
+    while current < len(body):
+        char = body[current:current + 1]
+        if in_string:
+            if char == b"'":
+                # '' is an escaped quote inside a string
+                if body[current + 1:current + 2] == b"'":
+                    current += 1
+                else:
+                    in_string = False
+        elif char == b"'":
+            in_string = True
+        elif char == b'(':
+            depth += 1
+        elif char == b')':
+            depth -= 1
+        elif char == b',' and depth == 0:
+            args.append(body[start_index:current])
+            start_index = current + 1
+        current += 1
+    args.append(body[start_index:])
+
+    return [arg.strip() for arg in args]
+
+
+def decode_step_string(arg: bytes) -> Optional[str]:
+    """Decode a quoted STEP string argument, including \\X\\ and \\X2\\ escapes"""
+    if not arg.startswith(b"'"):
+        return None
+    text = arg[1:-1].replace(b"''", b"'").decode('latin-1')
+    text = STEP_UNICODE_PATTERN.sub(
+        lambda m: bytes.fromhex(m.group(1)).decode('utf-16-be', 'replace'), text
+    )
+    return STEP_LATIN_PATTERN.sub(lambda m: chr(int(m.group(1), 16)), text)
+
+
+def file_digest(file_path: str) -> str:
+    """Content hash of a file, read in 1 MB chunks"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def spatial_node(entity_id: int, entity_type: str, name: Optional[str],
+                 children: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact node of the spatial-structure tree"""
+    node = {
+        'id': f'#{entity_id}',
+        'type': entity_type,
+        'name': name,
+        'childCount': len(children)
+    }
+    if children:
+        node['children'] = children
+    return node
+
+
+def parse_reference(arg: bytes) -> Optional[int]:
+    """Return the instance id of a scalar reference argument"""
+    if arg.startswith(b'#') and arg[1:].isdigit():
+        return int(arg[1:])
+    return None
+
+
+def parse_reference_list(arg: bytes) -> List[int]:
+    """Return the instance ids of an aggregate-of-references argument"""
+    if not arg.startswith(b'('):
+        return []
+    return [int(ref) for ref in REFERENCE_PATTERN.findall(arg)]
+
+
+class StoreyIndex:
+    """Byte-offset index of an IFC file partitioned by building storey
+
+    Building the index streams the file once and keeps only instance offsets,
+    the spatial containment tree and an inverse map from products to the
+    relationships that describe them. Each storey can then be materialised as
+    a small standalone IFC file holding the storey's products and everything
+    they reference, so peak memory is bounded by the largest storey instead
+    of the whole model.
+
+    The index is tied to the file's content, not its path: bind() gives a
+    copy reading from another file with the same digest, so one index can
+    serve every download of a model.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.file_size = os.path.getsize(file_path)
+        self.digest = None
+        self.header = b''
+        self.schema = None
+
+        self._offsets = array('q')
+        self._type_codes = array('H')
+        self._type_names: List[bytes] = []
+        self._type_lookup: Dict[bytes, int] = {}
+
+        self.project_id: Optional[int] = None
+        self.storey_ids: List[int] = []
+
+        # Spatial tree: container -> children and the relationships declaring them
+        self._contained: Dict[int, List[int]] = {}
+        self._aggregated: Dict[int, List[int]] = {}
+        self._structural_rels: Dict[int, List[int]] = {}
+
+        # Inverse references: product -> non-structural relationships, item -> styled items
+        self._inverse_rels: Dict[int, List[int]] = {}
+        self._styled_items: Dict[int, List[int]] = {}
+
+        # Every id that takes part in the spatial tree
+        self._products: Set[int] = set()
+        self._storey_products: Dict[int, Set[int]] = {}
+
+        self._handle = None
+        self._build()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the underlying file handle"""
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+
+    def matches(self, file_path: str) -> bool:
+        """Whether file_path holds the same content this index was built from"""
+        return os.path.getsize(file_path) == self.file_size and file_digest(file_path) == self.digest
+
+    def bind(self, file_path: str) -> 'StoreyIndex':
+        """A view of this index reading records from file_path, with its own file handle"""
+        view = copy.copy(self)
+        view.file_path = file_path
+        view._handle = None
+        return view
+
+    # ------------------------------------------------------------------
+    # Index construction
+    # ------------------------------------------------------------------
+
+    def _build(self):
+        """Stream the file once and record offsets and spatial relationships"""
+        header_lines = []
+        in_data = False
+        digest = hashlib.blake2b(digest_size=16)
+
+        with open(self.file_path, 'rb') as f:
+            offset = 0
+            record_offset = 0
+            pending = b''
+
+            for line in f:
+                line_offset = offset
+                offset += len(line)
+                digest.update(line)
+
+                if not in_data:
+                    header_lines.append(line)
+                    if line.strip() == b'DATA;':
+                        in_data = True
+                    continue
+
+                if not pending:
+                    if not line.lstrip().startswith(b'#'):
+                        continue
+                    record_offset = line_offset
+                    pending = line.strip()
+                else:
+                    pending += line.strip()
+
+                if pending.endswith(b';'):
+                    self._index_record(pending, record_offset)
+                    pending = b''
+
+        self.digest = digest.hexdigest()
+        self.header = b''.join(header_lines)
+        schema = FILE_SCHEMA_PATTERN.search(self.header)
+        self.schema = schema.group(1).decode() if schema else 'IFC4'
+
+        # Only products can anchor an inverse lookup
+        self._inverse_rels = {k: v for k, v in self._inverse_rels.items() if k in self._products}
+
+        logger.info(
+            f"Indexed {self.file_path}: {len(self._offsets)} ids, "
+            f"{len(self.storey_ids)} storeys, {len(self._products)} spatial products"
+        )
+
+    def _index_record(self, record: bytes, record_offset: int):
+        """Index a single instance record"""
+        match = RECORD_PATTERN.match(record)
+        if not match:
+            return
+
+        entity_id = int(match.group(1))
+        type_name = match.group(2).upper()
+
+        if entity_id >= len(self._offsets):
+            grow = max(entity_id + 1, 2 * len(self._offsets)) - len(self._offsets)
+            self._offsets.extend(array('q', [-1]) * grow)
+            self._type_codes.extend(array('H', [0]) * grow)
+
+        self._offsets[entity_id] = record_offset
+        self._type_codes[entity_id] = self._type_code(type_name)
+
+        if type_name == b'IFCPROJECT':
+            self.project_id = entity_id
+        elif type_name == b'IFCBUILDINGSTOREY':
+            self.storey_ids.append(entity_id)
+            self._products.add(entity_id)
+        elif type_name == b'IFCRELCONTAINEDINSPATIALSTRUCTURE':
+            tail = CONTAINMENT_TAIL_PATTERN.search(record)
+            if not tail:
+                return
+            container = int(tail.group(2))
+            elements = [int(ref) for ref in REFERENCE_PATTERN.findall(tail.group(1))]
+            self._contained.setdefault(container, []).extend(elements)
+            self._structural_rels.setdefault(container, []).append(entity_id)
+            self._products.add(container)
+            self._products.update(elements)
+        elif type_name == b'IFCRELAGGREGATES':
+            tail = AGGREGATION_TAIL_PATTERN.search(record)
+            if not tail:
+                return
+            parent = int(tail.group(1))
+            children = [int(ref) for ref in REFERENCE_PATTERN.findall(tail.group(2))]
+            self._aggregated.setdefault(parent, []).extend(children)
+            self._structural_rels.setdefault(parent, []).append(entity_id)
+            self._products.add(parent)
+            self._products.update(children)
+        elif type_name == b'IFCSTYLEDITEM':
+            item = FIRST_REFERENCE_PATTERN.match(record, match.end())
+            if item:
+                self._styled_items.setdefault(int(item.group(1)), []).append(entity_id)
+        elif type_name.startswith(b'IFCREL') and type_name not in SKIPPED_RELATIONSHIPS:
+            # Skip GlobalId and OwnerHistory, map everything else back to the rel
+            prefix = ROOT_PREFIX_PATTERN.match(record, match.end() - 1)
+            for ref in REFERENCE_PATTERN.findall(record, prefix.end() if prefix else match.end()):
+                self._inverse_rels.setdefault(int(ref), []).append(entity_id)
+
+    def _type_code(self, type_name: bytes) -> int:
+        code = self._type_lookup.get(type_name)
+        if code is None:
+            self._type_names.append(type_name)
+            code = len(self._type_names)
+            self._type_lookup[type_name] = code
+        return code
+
+    # ------------------------------------------------------------------
+    # Record access
+    # ------------------------------------------------------------------
+
+    def type_of(self, entity_id: int) -> Optional[str]:
+        """Return the IFC type name of an instance without loading it"""
+        if entity_id >= len(self._type_codes) or not self._type_codes[entity_id]:
+            return None
+        return self._type_names[self._type_codes[entity_id] - 1].decode()
+
+    def read_record(self, entity_id: int) -> bytes:
+        """Read a single instance record from disk"""
+        if entity_id >= len(self._offsets) or self._offsets[entity_id] < 0:
+            raise KeyError(f'#{entity_id} not found in {self.file_path}')
+
+        if self._handle is None:
+            self._handle = open(self.file_path, 'rb')
+
+        self._handle.seek(self._offsets[entity_id])
+        record = b''
+        while True:
+            line = self._handle.readline()
+            if not line:
+                break
+            record += line.strip()
+            if record.endswith(b';'):
+                break
+        return record
+
+    # ------------------------------------------------------------------
+    # Storey partitions
+    # ------------------------------------------------------------------
+
+    def storeys(self) -> List[Dict[str, Any]]:
+        """Summarise storeys without opening the model"""
+        summary = []
+        for storey_id in self.storey_ids:
+            args = split_arguments(self.read_record(storey_id))
+            name = decode_step_string(args[2])
+            summary.append({
+                'id': f'#{storey_id}',
+                'name': name,
+                'elementCount': len(self.storey_products(storey_id)) - 1
+            })
+        return summary
+
+    def spatial_tree(self) -> Optional[Dict[str, Any]]:
+        """Build the Project->Site->Building->Storey->Space->Element tree from the index"""
+        if self.project_id is None:
+            return None
+
+        def build(entity_id: int, visited: Set[int]) -> Dict[str, Any]:
+            visited.add(entity_id)
+            args = split_arguments(self.read_record(entity_id))
+            name = decode_step_string(args[2]) if len(args) > 2 else None
+            children = [
+                build(child, visited)
+                for child in self._aggregated.get(entity_id, []) + self._contained.get(entity_id, [])
+                if child not in visited
+            ]
+            return spatial_node(entity_id, self._ifc_type_name(entity_id), name, children)
+
+        return build(self.project_id, set())
+
+    def _ifc_type_name(self, entity_id: int) -> Optional[str]:
+        """Return the schema-cased type name, e.g. IfcBuildingStorey"""
+        name = self.type_of(entity_id)
+        if name is None:
+            return None
+        try:
+            schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(self.schema)
+            return schema.declaration_by_name(name).name()
+        except Exception:
+            return name
+
+    def storey_of(self, entity_id: int) -> Optional[int]:
+        """Return the storey whose partition contains an instance"""
+        for storey_id in self.storey_ids:
+            if entity_id in self.storey_products(storey_id):
+                return storey_id
+        return None
+
+    def storey_products(self, storey_id: int) -> Set[int]:
+        """Products spatially contained in or decomposing a storey"""
+        if storey_id in self._storey_products:
+            return self._storey_products[storey_id]
+
+        products = {storey_id}
+        queue = [storey_id]
+        while queue:
+            node = queue.pop()
+            for child in self._aggregated.get(node, []) + self._contained.get(node, []):
+                if child not in products:
+                    products.add(child)
+                    queue.append(child)
+
+        self._storey_products[storey_id] = products
+        return products
+
+    def _partition(self, storey_id: int) -> Tuple[Dict[int, bytes], Set[int]]:
+        """Collect the records that make up a storey partition"""
+        products = self.storey_products(storey_id)
+        foreign = self._products - products
+        foreign.discard(self.project_id)
+
+        records: Dict[int, bytes] = {}
+        queue = [storey_id]
+        if self.project_id is not None:
+            queue.append(self.project_id)
+
+        for product in products:
+            queue.append(product)
+            queue.extend(self._structural_rels.get(product, []))
+            queue.extend(self._inverse_rels.get(product, []))
+
+        while queue:
+            entity_id = queue.pop()
+            if entity_id in records or entity_id in foreign:
+                continue
+
+            record = self.read_record(entity_id)
+            type_name = self._type_names[self._type_codes[entity_id] - 1]
+            if type_name.startswith(b'IFCREL'):
+                record = self._prune_relationship(record, foreign)
+                if record is None:
+                    continue
+
+            records[entity_id] = record
+            for ref in REFERENCE_PATTERN.findall(record[record.index(b'('):]):
+                ref = int(ref)
+                if ref not in records and ref not in foreign:
+                    queue.append(ref)
+            queue.extend(self._styled_items.get(entity_id, []))
+
+        return records, products
+
+    def _prune_relationship(self, record: bytes, foreign: Set[int]) -> Optional[bytes]:
+        """Drop references to products outside the partition from a relationship"""
+        args = split_arguments(record)
+        pruned = []
+        for arg in args:
+            ref = parse_reference(arg)
+            if ref is not None and ref in foreign:
+                return None
+            refs = parse_reference_list(arg)
+            if refs:
+                kept = [f'#{r}'.encode() for r in refs if r not in foreign]
+                if not kept:
+                    return None
+                arg = b'(' + b','.join(kept) + b')'
+            pruned.append(arg)
+
+        head = record[:record.index(b'(') + 1]
+        return head + b','.join(pruned) + b');'
+
+    def write_storey(self, storey_id: int, output_path: str) -> int:
+        """Write a standalone IFC file for one storey, returning its product count"""
+        records, products = self._partition(storey_id)
+        with open(output_path, 'wb') as out:
+            out.write(self.header)
+            for entity_id in sorted(records):
+                out.write(records[entity_id])
+                out.write(b'\n')
+            out.write(b'ENDSEC;\nEND-ISO-10303-21;\n')
+        return len(products)
+
+    @contextmanager
+    def open_storey(self, storey_id: int) -> Iterator[ifcopenshell.file]:
+        """Open a single storey as an ifcopenshell file and release it on exit"""
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.ifc')
+        temp_file.close()
+        ifc_file = None
+        try:
+            self.write_storey(storey_id, temp_file.name)
+            ifc_file = ifcopenshell.open(temp_file.name)
+            yield ifc_file
+        finally:
+            del ifc_file
+            gc.collect()
+            if os.path.exists(temp_file.name):
+                os.unlink(temp_file.name)
+
+    def iter_storeys(self) -> Iterator[Tuple[int, ifcopenshell.file]]:
+        """Yield (storey id, file) pairs, holding only one storey in memory at a time"""
+        for storey_id in self.storey_ids:
+            with self.open_storey(storey_id) as ifc_file:
+                yield storey_id, ifc_file
@@ -498,6 +498,22 @@ export interface ObjectDetectionResult {
   }
 }
 
+export interface PlanAnalysisResult {
+  objects: DetectedObject[]
+  scale: {
+    scaleRatio: number
+    scaleFound: boolean
+    confidence: number
+  }
+  statistics: {
+    totalWalls: number
+    totalDoors: number
+    totalWindows: number
+    totalFurniture: number
+  }
+  imageSize: { width: number; height: number }
+}
+
 /**
  * Advanced AI Parsing Service
  * Supports Detectron2, YOLO, Azure Cognitive Services, and AWS Rekognition
@@ -542,6 +558,63 @@ export class AdvancedAIParsingService {
     }
   }
 
+  /**
+   * Detect objects, scale and floor plan categories in one request
+   */
+  async analyzePlan(imageData: string | File | Blob): Promise<PlanAnalysisResult> {
+    try {
+      const imageBase64 = await this.convertToBase64(imageData)
+      const response = await fetch(`${this.config.endpoint}/analyze-plan`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${this.config.apiKey}`
+        },
+        body: JSON.stringify({
+          image: imageBase64,
+          conf_threshold: this.config.confidenceThreshold,
+          iou_threshold: 0.45
+        })
+      })
+
+      if (!response.ok) {
+        throw new Error(`Plan analysis API error: ${response.statusText}`)
+      }
+
+      const data = await response.json()
+
+      return {
+        objects: data.detections.map((det: any) => ({
+          class: det.class,
+          confidence: det.confidence,
+          boundingBox: det.bbox
+        })),
+        scale: {
+          scaleRatio: data.scale.scaleRatio,
+          scaleFound: data.scale.scaleFound,
+          confidence: data.scale.confidence
+        },
+        statistics: data.floorPlan.statistics,
+        imageSize: { width: data.image_width, height: data.image_height }
+      }
+    } catch (error) {
+      console.error('[AdvancedAIParsing] Plan analysis failed:', error)
+      const mock = this.mockDetection()
+      const count = (name: string) => mock.objects.filter(obj => obj.class === name).length
+      return {
+        objects: mock.objects,
+        scale: { scaleRatio: 100, scaleFound: false, confidence: 0.3 },
+        statistics: {
+          totalWalls: count('wall'),
+          totalDoors: count('door'),
+          totalWindows: count('window'),
+          totalFurniture: 0
+        },
+        imageSize: mock.imageSize
+      }
+    }
+  }
+
   /**
    * Call appropriate AI model endpoint
    */
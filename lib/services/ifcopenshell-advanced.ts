@@ -63,6 +63,33 @@ export interface IFCRelationship {
   description?: string
 }
 
+export interface IFCSpatialNode {
+  id: string
+  type: string
+  name: string | null
+  childCount: number
+  children?: IFCSpatialNode[]
+}
+
+export interface IFCSearchFilter {
+  property: string
+  op?: 'eq' | 'gt' | 'gte' | 'lt' | 'lte' | 'between' | 'exists'
+  value?: any
+}
+
+export interface IFCSearchQuery {
+  query?: string
+  types?: string[]
+  filters?: IFCSearchFilter[]
+  limit?: number
+}
+
+export interface IFCSearchResult {
+  elementIds: string[]
+  total: number
+  tookMs: number
+}
+
 export class IfcopenshellAdvancedService {
   private pythonEndpoint: string
 
@@ -161,6 +188,51 @@ export class IfcopenshellAdvancedService {
     }
   }
 
+  /**
+   * Get the complete spatial structure tree in a single request
+   */
+  async getSpatialTree(fileUrl: string, refresh = false): Promise<IFCSpatialNode | null> {
+    try {
+      const response = await fetch(`${this.pythonEndpoint}/spatial-tree`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({fileUrl, refresh})
+      })
+
+      if (!response.ok) {
+        return null
+      }
+
+      const data = await response.json()
+      return data.tree
+    } catch (error) {
+      console.error('[ifcopenshell] Spatial tree extraction failed:', error)
+      return null
+    }
+  }
+
+  /**
+   * Search elements by text, IFC class and property values
+   */
+  async searchElements(fileUrl: string, query: IFCSearchQuery): Promise<IFCSearchResult> {
+    try {
+      const response = await fetch(`${this.pythonEndpoint}/search`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({fileUrl, ...query})
+      })
+
+      if (!response.ok) {
+        return {elementIds: [], total: 0, tookMs: 0}
+      }
+
+      return await response.json()
+    } catch (error) {
+      console.error('[ifcopenshell] Element search failed:', error)
+      return {elementIds: [], total: 0, tookMs: 0}
+    }
+  }
+
   /**
    * Check IFC compliance (buildingSMART standards)
    */